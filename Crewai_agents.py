@@ -1,415 +1,983 @@
-from crewai import Agent, Task, Crew, Process, LLM
-from crewai.tools import tool
-from sentence_transformers import SentenceTransformer
-from elasticsearch import Elasticsearch
-import pyodbc
-
-ELASTIC_HOST = "<your_elasticsearch_host>"
-ELASTIC_PORT = 9200
-ELASTIC_USERNAME = "<your_elasticsearch_username>"
-ELASTIC_PASSWORD = "<your_elasticsearch_password>"
-ELASTIC_CA_CERT = r"<path_to_elasticsearch_ca_cert>"
-ELASTIC_INDEX = "incident_sop"
-
-
-DB_CONNECTION_STRING = 'Driver={ODBC Driver 17 for SQL Server};Server=<your_server>;Database=<your_database>;Trusted_Connection=yes;'
-
-
-def Multiagentsystem(user_query, user_query_with_context):
-    """Function to handle multi-agent system for incident management queries"""
-    process_flow = []
-    
-    llm = LLM(
-        model="azure/gpt-4o",
-        api_version="2025-01-01-preview",
-        base_url="<your_azure_openai_endpoint>",
-        api_key="<your_azure_openai_api_key>"
-    )
-
-    @tool
-    def get_chunks_tool(query: str) -> str:
-        """
-        Retrieves relevant document chunks from Elasticsearch based on semantic similarity.
-        
-        Args:
-            query: The search query string
-            
-        Returns:
-            A formatted string containing the most relevant document chunks
-        """
-        try:
-            # Track step - Incident_SOP_agent executing get_chunks_tool
-            process_flow.append({
-                "step_number": 1,
-                "agent": "Manager Agent",
-                "action": "Analyzing user question",
-                "description": f"Analyzing query: {user_query}"
-            })
-            step_num = len(process_flow) + 1
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Manager Agent",
-                "action": "Delegating to Incident_SOP_Agent",
-                "description": f"Routing query to Incident_SOP_Agent"
-            })
-
-            step_num = len(process_flow) + 1
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Incident_SOP_Agent",
-                "action": "Connecting to MCP ElasticSearch Sever",
-                "description": f"Elastablishing connection"
-            })
-
-            step_num = len(process_flow) + 1
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Incident_SOP_Agent",
-                "action": "Invoking get_chunks_tool",
-                "description": f"Searching SOP documentation for: {query}"
-            })
-
-
-        
-            model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-            query_embedding = model.encode(query).tolist()
-            
-            
-            es = Elasticsearch(
-                hosts=[f"https://{ELASTIC_HOST}:{ELASTIC_PORT}"],
-                basic_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD),
-                ca_certs=ELASTIC_CA_CERT,
-                verify_certs=True
-            )
-            
-            
-            search_body = {
-                "knn": {
-                    "field": "content_embedding",
-                    "query_vector": query_embedding,
-                    "k": 5,
-                    "num_candidates": 100
-                },
-                "fields": ["content", "chunk_id", "source"],
-                "_source": ["content", "chunk_id", "source"]
-            }
-            
-            results = es.search(index=ELASTIC_INDEX, body=search_body)
-            
-            step_num = len(process_flow) + 1
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Incident_SOP_Agent",
-                "action": "Processing search results",
-                "description": f"Retrieved {len(results['hits']['hits'])} relevant document chunks"
-            })
-            
-            # Step 4: Format and return results
-            if results['hits']['total']['value'] == 0:
-                return "No relevant chunks found for the query."
-            
-            step_num = len(process_flow) + 1
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Incident_SOP_Agent",
-                "action": "Formatting final response",
-                "description": "Structuring retrieved chunks for presentation"
-            })
-            
-            formatted_results = "Retrieved Document Chunks:\n" + "="*80 + "\n\n"
-            
-            for idx, hit in enumerate(results['hits']['hits'], 1):
-                source = hit['_source']
-                formatted_results += f"Chunk {idx}:\n"
-                formatted_results += f"Content:\n{source.get('content', 'No content')}\n"
-                formatted_results += "-"*80 + "\n\n"
-            return formatted_results
-            
-        except Exception as e:
-            step_num = len(process_flow) + 1
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Incident_SOP_Agent",
-                "action": "Error in get_chunks_tool",
-                "description": f"Exception occurred: {str(e)}"
-            })
-            error_msg = f"Error retrieving chunks from Elasticsearch: {str(e)}"
-            return error_msg
-
-    @tool
-    def get_sql_data_tool(query: str) -> str:
-        """
-        Executes a SQL query against the Incident Management database and returns results.
-        
-        Args:
-            query: The SQL query string to execute.
-            
-        Returns:
-            Formatted string containing the SQL query results or error message
-            
-        Example SQL Queries:
-            - "SELECT * FROM Incidents WHERE Incident_ID = 'INC000229'"
-            - "SELECT * FROM Incidents WHERE Status = 'Open' AND Severity = 'P1'"
-            - "SELECT Incident_ID, Service_Name, Status, On_Call_Engineer FROM Incidents WHERE On_Call_Engineer = 'Charles Taylor'"
-            - "SELECT * FROM Incidents WHERE Status = 'In Progress'"
-        """
-        try:
-            process_flow.append({
-                "step_number": 1,
-                "agent": "Manager Agent",
-                "action": "Analyzing user question",
-                "description": f"Analyzing query: {user_query}"
-            })
-            step_num = len(process_flow) + 1
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Manager Agent",
-                "action": "Delegating to Incident_Data_Agent",
-                "description": f"Routing query to Incident_Data_Agent"
-            })
-
-            step_num = len(process_flow) + 1
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Incident_Data_Agent",
-                "action": "Connecting to MCP SQL Sever",
-                "description": f"Elastablishing connection"
-            })
-            step_num = len(process_flow) + 1
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Incident_Data_Agent",
-                "action": "Invoking get_sql_data_tool",
-                "description": "Executing SQL query"
-            })
-            
-            
-            conn = pyodbc.connect(DB_CONNECTION_STRING)
-            cursor = conn.cursor()
-            
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            
-            # Track step - Fetching results
-            step_num = len(process_flow) + 1
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Incident_Data_Agent",
-                "action": "Fetching query results",
-                "description": f"Retrieved {len(rows)} records from database"
-            })
-            
-            if not rows:
-                step_num = len(process_flow) + 1
-                process_flow.append({
-                    "step_number": step_num,
-                    "agent": "Incident_Data_Agent",
-                    "action": "Formatting final response",
-                    "description": "No records found for the query"
-                })
-                return "No records found matching the query."
-            
-            # Get column names
-            columns = [description[0] for description in cursor.description]
-            
-            # Track step - Processing and formatting results
-            step_num = len(process_flow) + 1
-            total_records = len(rows)
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Incident_Data_Agent",
-                "action": "Processing and formatting results",
-                "description": f"Formatting {total_records} records for display"
-            })
-            
-            formatted_results = "Query Results:\n" + "="*100 + "\n"
-            
-            # Check if records exceed 20
-            if total_records > 20:
-                formatted_results += f"\nNOTE: Total records found: {total_records}. Displaying first 20 records only.\n"
-                formatted_results += "="*100 + "\n\n"
-                rows_to_display = rows[:20]
-            else:
-                formatted_results += "\n"
-                rows_to_display = rows
-            
-            for idx, row in enumerate(rows_to_display, 1):
-                formatted_results += f"Record {idx}:\n"
-                for col_name, value in zip(columns, row):
-                    formatted_results += f"  {col_name}: {value}\n"
-                formatted_results += "-"*100 + "\n\n"
-            
-            cursor.close()
-            conn.close()
-            return formatted_results
-            
-        except Exception as e:
-            step_num = len(process_flow) + 1
-            process_flow.append({
-                "step_number": step_num,
-                "agent": "Incident_Data_Agent",
-                "action": "Error in get_sql_data_tool",
-                "description": f"Exception occurred: {str(e)}"
-            })
-            error_msg = f"Error executing SQL query: {str(e)}"
-            return error_msg
-
-    Incident_Data_agent = Agent(
-        role="Incident Data Management Assistant",
-        goal="Retrieve real-time incident data from the database to answer questions about specific incidents, their status, severity, assigned engineers, and SLA information. For any query about incident details, write and execute SQL queries against the Incidents table.",
-        backstory="""
-    You are an Incident Data Management Assistant specializing in database queries.
-
-    Your Primary Responsibility:
-    - Answer user questions about specific incidents using the Incidents table
-    - Execute SQL queries to retrieve incident information
-
-    Database Table: Incidents
-    Columns: Incident_ID, Service_Name, Severity, Status, Issue_Description, Owner_Team, On_Call_Engineer, Escalation_Contact, Start_Time, MTTR_Minutes, SLA_Breached
-
-    Query Rules:
-    1. When user asks about specific incidents, their status, owner, engineer, or SLA information, use get_sql_data_tool
-    2. Construct SQL queries based on the user question:
-    - For specific incident: SELECT * FROM Incidents WHERE Incident_ID = '[ID]'
-    - For incidents by status: SELECT * FROM Incidents WHERE Status = '[status]'
-    - For incidents by severity: SELECT * FROM Incidents WHERE Severity = '[severity]'
-    - For incidents by engineer: SELECT * FROM Incidents WHERE On_Call_Engineer = '[name]'
-    - For SLA breached incidents: SELECT * FROM Incidents WHERE SLA_Breached = 1
-    3. Always use the exact column names and table name
-    4. Use ONLY the data returned from SQL queries to construct your answer
-    5. Present data in a clear, formatted manner
-    6. Do not guess or assume data
-
-    Query Examples and Expected SQL:
-
-    Example 1: User asks "What is the status of incident INC000229?"
-    SQL: SELECT Incident_ID, Status, On_Call_Engineer, Severity FROM Incidents WHERE Incident_ID = 'INC000229'
-
-    Example 2: User asks "Who is handling incident INC000284?"
-    SQL: SELECT Incident_ID, On_Call_Engineer, Owner_Team, Status FROM Incidents WHERE Incident_ID = 'INC000284'
-
-    Example 3: User asks "Show all open incidents"
-    SQL: SELECT * FROM Incidents WHERE Status = 'Open'
-
-    Example 4: User asks "Which incidents have breached SLA?"
-    SQL: SELECT Incident_ID, Service_Name, Severity, Status, MTTR_Minutes FROM Incidents WHERE SLA_Breached = 1
-
-    Example 5: User asks "What are all P1 severity incidents?"
-    SQL: SELECT * FROM Incidents WHERE Severity = 'P1'
-
-    Tone:
-    - Professional
-    - Data-focused
-    - Clear and concise
-    """,
-        tools=[get_sql_data_tool],
-        llm=llm,
-        verbose=True,
-    )
-
-
-    Incident_SOP_agent = Agent(
-        role="Incident Management SOP Assistant",
-        goal="Answer questions about incident management procedures, escalation paths, and SLAs by retrieving and analyzing relevant information from incident management SOPs and documentation",
-        backstory="""
-    You are an Incident Management SOP Assistant.
-
-    You must answer user questions ONLY using information returned from the tool:
-        get_chunks_tool
-
-    Execution Rules:
-
-    1. For every user question you MUST call:
-        use get_chunks_tool, passing the user question as the argument.
-
-    2. Use ONLY the text returned in the chunks to construct the answer.
-    3. DO NOT use any prior knowledge outside the chunks.
-    4. If the chunks do not contain relevant information, respond EXACTLY:
-
-    "The SOP does not contain enough information to answer this question."
-
-    5. Provide answers in a clear, structured, operational format.
-    6. When procedures exist, respond in step-by-step numbered actions.
-    7. When severity/SLA is asked, map to P1–P4 definitions from chunks.
-    8. Do not mention internal tool names in the final answer.
-    9. Do not guess, assume, or hallucinate details.
-
-    Tone:
-    - Professional
-    - Concise
-    - Action oriented for engineers on call
-
-    Formatting Rules:
-    - Do NOT use any special characters in your response
-    - Do NOT use markdown formatting (bold, italics, code blocks)
-    - Keep formatting very clean and professional
-    - Use plain text only with simple line breaks and indentation for structure
-
-    """,
-        tools=[get_chunks_tool],
-        verbose=True,
-        llm=llm
-    )
-
-    manager_agent = Agent(
-        role="Multi-Agent System Manager",
-        goal="Intelligently route user queries to the most appropriate specialized agent: either Incident Data Management Assistant or Incident Management SOP Assistant. Ensure coherent and accurate responses.",
-        backstory="""You are the manager of a multi-agent system with two specialized agents:
-
-    1. Incident Data Management Assistant
-    - Handles: Real-time incident data queries
-    - Use when user asks about:
-        * Specific incident details (status, severity, owner, engineer)
-        * Who is handling a particular incident
-        * Incident SLA information
-        * Current incident status or metrics
-        * Queries about incident IDs, service names, or specific incident attributes
-    - Example queries: "What is the status of INC000229?", "Who is handling the authentication incident?", "Show all open incidents"
-
-    2. Incident Management SOP Assistant
-    - Handles: Incident management procedures and documentation
-    - Use when user asks about:
-        * How to handle incidents
-        * Escalation procedures
-        * SLA definitions and timeframes
-        * Incident management best practices
-        * Standard Operating Procedures
-    - Example queries: "What is the escalation procedure?", "How should we handle P1 incidents?"
-
-    Delegation Logic:
-    - If query contains: incident IDs, specific incident names, status questions, engineer assignments, MTTR, or current incident data
-    -> Route to: Incident Data Management Assistant
-    - If query contains: procedures, how-to, escalation paths, SOP, best practices, definitions
-    -> Route to: Incident Management SOP Assistant
-    - If query contains BOTH aspects, determine primary intent and route accordingly
-
-    Always ensure the selected agent has all context needed from the user query.""",
-        verbose=True,
-        llm=llm
-    )
-
-    task = Task(
-        description=user_query_with_context,
-        expected_output="A well-structured, formatted response to the user query"
-    )
-
-    # Create and execute the crew
-    crew = Crew(
-        agents=[Incident_SOP_agent, Incident_Data_agent],
-        tasks=[task],
-        verbose=True,
-        process=Process.hierarchical,
-        manager_agent=manager_agent
-    )
-
-    crew.kickoff()
-    task_output = task.output
-    result=task_output.raw
-    result=result.replace('*','').replace('#','')
-    
-    # Return both process_flow list and the result
-    return {
-        "process_flow": process_flow,
-        "response": result
-    }
-
+import contextvars
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import nullcontext
+
+from crewai import Agent, Task, Crew, Process, LLM
+from crewai.tools import tool
+
+from embeddings import encode
+from es_client import get_es_client, ELASTIC_INDEX
+from db_pool import get_connection, fetch_limited
+from router import route_query, question_entities, is_follow_up
+from entity_index import get_entity_index, ENTITY_INDEX_ENABLED
+from semantic_cache import get_semantic_cache, SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_SKIP_FOLLOW_UPS
+from local_index import get_local_index, LOCAL_INDEX_ENABLED
+from query_cache import get_query_cache, is_read_only, QueryCache, QUERY_CACHE_ENABLED
+from incident_aggregates import get_aggregate_store, AGGREGATES_ENABLED
+from tracing import span, traced, trace_request, current_trace, set_trace_attribute, Span
+from llm_budget import request_budget, install_budget, branch_budget, use_budget, LLMBudgetExceeded
+
+logger = logging.getLogger(__name__)
+
+# Token streaming and LLM call spans rely on the crewai event bus (crewai.events from 0.186, crewai.utilities.events
+# before); without it only process_flow steps are streamed, which is logged at import so it is never silent
+try:
+    from crewai.events import crewai_event_bus
+    from crewai.events.types.llm_events import (LLMCallStartedEvent, LLMCallCompletedEvent, LLMCallFailedEvent,
+                                                LLMStreamChunkEvent)
+except ImportError:
+    try:
+        from crewai.utilities.events import crewai_event_bus
+        from crewai.utilities.events.llm_events import (LLMCallStartedEvent, LLMCallCompletedEvent, LLMCallFailedEvent,
+                                                        LLMStreamChunkEvent)
+    except ImportError:
+        crewai_event_bus = None
+        logger.warning("This crewai release has no event bus; answer token streaming and LLM call spans are "
+                       "disabled (see requirements.txt for the supported version)")
+
+LLM_MODEL = "azure/gpt-4o"
+LLM_API_VERSION = "2025-01-01-preview"
+LLM_BASE_URL = "<your_azure_openai_endpoint>"
+LLM_API_KEY = "<your_azure_openai_api_key>"
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+SOP_NO_ANSWER = "The SOP does not contain enough information to answer this question."
+LLM_STREAMING = crewai_event_bus is not None
+
+# Send unambiguous questions straight to a parameterized query or the SOP agent instead of the manager
+FAST_PATH_ENABLED = True
+
+# Mixed data + procedure questions run the data and SOP agents in parallel and merge their answers in one LLM call;
+# when disabled they go through the hierarchical manager
+FAN_OUT_ENABLED = True
+FAN_OUT_MAX_WORKERS = 8
+# Seconds each branch may run, counted from when both start; a late branch is left out of the merged answer
+FAN_OUT_BRANCH_TIMEOUTS = {'data': 60, 'sop': 60}
+
+# Incident queries are capped on the server; only this many rows ever reach the process or the prompt
+SQL_MAX_ROWS = 20
+SQL_QUERY_TIMEOUT = 15
+
+INCIDENT_DATA_GOAL = "Retrieve real-time incident data from the database to answer questions about specific incidents, their status, severity, assigned engineers, and SLA information. For any query about incident details, write and execute SQL queries against the Incidents table."
+INCIDENT_DATA_BACKSTORY = """
+    You are an Incident Data Management Assistant specializing in database queries.
+
+    Your Primary Responsibility:
+    - Answer user questions about specific incidents using the Incidents table
+    - Execute SQL queries to retrieve incident information
+
+    Database Table: Incidents
+    Columns: Incident_ID, Service_Name, Severity, Status, Issue_Description, Owner_Team, On_Call_Engineer, Escalation_Contact, Start_Time, MTTR_Minutes, SLA_Breached
+
+    Query Rules:
+    1. When user asks about specific incidents, their status, owner, engineer, or SLA information, use get_sql_data_tool
+    2. Construct SQL queries based on the user question:
+    - For specific incident: SELECT * FROM Incidents WHERE Incident_ID = '[ID]'
+    - For incidents by status: SELECT * FROM Incidents WHERE Status = '[status]'
+    - For incidents by severity: SELECT * FROM Incidents WHERE Severity = '[severity]'
+    - For incidents by engineer: SELECT * FROM Incidents WHERE On_Call_Engineer = '[name]'
+    - For SLA breached incidents: SELECT * FROM Incidents WHERE SLA_Breached = 1
+    3. Always use the exact column names and table name
+    4. Use ONLY the data returned from SQL queries to construct your answer
+    5. Present data in a clear, formatted manner
+    6. Do not guess or assume data
+    7. Results are returned as CSV with at most 20 rows and a note with the total row count; for questions about how many incidents match, use SELECT COUNT(*) or GROUP BY instead of listing rows
+    8. For statistics (incident counts, SLA breach rates, average or percentile MTTR) by severity, service, team or status over the last 24h, 7d, 30d or all time, use get_incident_aggregates_tool instead of writing aggregate SQL
+
+    Query Examples and Expected SQL:
+
+    Example 1: User asks "What is the status of incident INC000229?"
+    SQL: SELECT Incident_ID, Status, On_Call_Engineer, Severity FROM Incidents WHERE Incident_ID = 'INC000229'
+
+    Example 2: User asks "Who is handling incident INC000284?"
+    SQL: SELECT Incident_ID, On_Call_Engineer, Owner_Team, Status FROM Incidents WHERE Incident_ID = 'INC000284'
+
+    Example 3: User asks "Show all open incidents"
+    SQL: SELECT * FROM Incidents WHERE Status = 'Open'
+
+    Example 4: User asks "Which incidents have breached SLA?"
+    SQL: SELECT Incident_ID, Service_Name, Severity, Status, MTTR_Minutes FROM Incidents WHERE SLA_Breached = 1
+
+    Example 5: User asks "What are all P1 severity incidents?"
+    SQL: SELECT * FROM Incidents WHERE Severity = 'P1'
+
+    Tone:
+    - Professional
+    - Data-focused
+    - Clear and concise
+    """
+
+INCIDENT_SOP_GOAL = "Answer questions about incident management procedures, escalation paths, and SLAs by retrieving and analyzing relevant information from incident management SOPs and documentation"
+INCIDENT_SOP_BACKSTORY = """
+    You are an Incident Management SOP Assistant.
+
+    You must answer user questions ONLY using information returned from the tool:
+        get_chunks_tool
+
+    Execution Rules:
+
+    1. For every user question you MUST call:
+        use get_chunks_tool, passing the user question as the argument.
+
+    2. Use ONLY the text returned in the chunks to construct the answer.
+    3. DO NOT use any prior knowledge outside the chunks.
+    4. If the chunks do not contain relevant information, respond EXACTLY:
+
+    "The SOP does not contain enough information to answer this question."
+
+    5. Provide answers in a clear, structured, operational format.
+    6. When procedures exist, respond in step-by-step numbered actions.
+    7. When severity/SLA is asked, map to P1–P4 definitions from chunks.
+    8. Do not mention internal tool names in the final answer.
+    9. Do not guess, assume, or hallucinate details.
+
+    Tone:
+    - Professional
+    - Concise
+    - Action oriented for engineers on call
+
+    Formatting Rules:
+    - Do NOT use any special characters in your response
+    - Do NOT use markdown formatting (bold, italics, code blocks)
+    - Keep formatting very clean and professional
+    - Use plain text only with simple line breaks and indentation for structure
+
+    """
+
+MANAGER_GOAL = "Intelligently route user queries to the most appropriate specialized agent: either Incident Data Management Assistant or Incident Management SOP Assistant. Ensure coherent and accurate responses."
+MANAGER_BACKSTORY = """You are the manager of a multi-agent system with two specialized agents:
+
+    1. Incident Data Management Assistant
+    - Handles: Real-time incident data queries
+    - Use when user asks about:
+        * Specific incident details (status, severity, owner, engineer)
+        * Who is handling a particular incident
+        * Incident SLA information
+        * Current incident status or metrics
+        * Queries about incident IDs, service names, or specific incident attributes
+    - Example queries: "What is the status of INC000229?", "Who is handling the authentication incident?", "Show all open incidents"
+
+    2. Incident Management SOP Assistant
+    - Handles: Incident management procedures and documentation
+    - Use when user asks about:
+        * How to handle incidents
+        * Escalation procedures
+        * SLA definitions and timeframes
+        * Incident management best practices
+        * Standard Operating Procedures
+    - Example queries: "What is the escalation procedure?", "How should we handle P1 incidents?"
+
+    Delegation Logic:
+    - If query contains: incident IDs, specific incident names, status questions, engineer assignments, MTTR, or current incident data
+    -> Route to: Incident Data Management Assistant
+    - If query contains: procedures, how-to, escalation paths, SOP, best practices, definitions
+    -> Route to: Incident Management SOP Assistant
+    - If query contains BOTH aspects, determine primary intent and route accordingly
+
+    Always ensure the selected agent has all context needed from the user query."""
+
+
+DATA_BRANCH_INSTRUCTION = """Answer only the incident data part of this question (status, severity, ownership, on-call and
+escalation contacts, SLA and MTTR figures). Another specialist covers procedures and SOPs."""
+SOP_BRANCH_INSTRUCTION = """Answer only the procedure part of this question from the incident management SOPs (steps,
+escalation paths, SLAs, policies). Another specialist looks up the incident records."""
+PREFETCHED_SOP_INSTRUCTION = """The SOP document chunks below were already retrieved for this question. Answer from them
+when they cover it, and call get_chunks_tool only for anything they do not cover."""
+ENTITY_HINT_INSTRUCTION = """Names in this question matched these exact Incidents values. Use them as the literals in any
+SQL you write instead of the spelling in the question:"""
+SYNTHESIS_PROMPT = """You are the manager of an incident management assistant. Two specialists answered parts of the
+user's question in parallel: one from the live incident records, one from the incident management SOPs. Merge their
+findings into a single well-structured answer to the question, applying the procedures to the specific incidents where
+relevant. Use only the information provided and say so plainly when something is missing."""
+
+
+class RequestContext:
+    """Per-request state shared by the tools of a single Multiagentsystem call"""
+
+    def __init__(self, user_query, on_event=None):
+        self.user_query = user_query
+        self.route_path = 'manager'
+        self.process_flow = []
+        self.on_event = on_event
+        # Text after which streamed LLM output is the answer; "" streams a whole response, None streams nothing
+        self.answer_marker = FINAL_ANSWER_MARKER
+        # (title, text) of everything the tools retrieved, the fallback answer when the LLM budget runs out
+        self.tool_outputs = []
+        # Work done ahead of time for the whole of a /query-batch request (see batch_query.py)
+        self.prefetched_sop_hits = None
+        self.prefetched_records = None
+        self._embeddings = {}
+        self._llm_output = ""
+        self._streaming_answer = False
+        self._llm_span = None
+        self._steps_lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    def branch(self):
+        """Context for one concurrently running fan-out branch: shares process_flow, the listener and the embedding
+        memo with this request but tracks its own LLM calls, and never streams tokens (the merged answer does)"""
+        child = RequestContext(self.user_query, on_event=self.on_event)
+        child.route_path = self.route_path
+        child.process_flow = self.process_flow
+        child.tool_outputs = self.tool_outputs
+        child.prefetched_sop_hits = self.prefetched_sop_hits
+        child.answer_marker = None
+        child.started = self.started
+        child._embeddings = self._embeddings
+        child._steps_lock = self._steps_lock
+        return child
+
+    def detach(self):
+        """Stop an abandoned branch from adding steps to a response that has already been returned"""
+        with self._steps_lock:
+            self.process_flow = []
+            self.tool_outputs = []
+            self.on_event = None
+
+    def apply_prefetched(self, prefetched):
+        """Use a batch's precomputed query embedding, SOP hits and incident rows instead of fetching them again"""
+        if prefetched.get('embedding') is not None:
+            self._embeddings[self.user_query] = prefetched['embedding']
+        self.prefetched_sop_hits = prefetched.get('sop_hits')
+        self.prefetched_records = prefetched.get('incident_records')
+
+    def embed(self, text):
+        """Encode text once per request; returns (embedding, encode_ms), with 0 ms for repeats"""
+        if text in self._embeddings:
+            return self._embeddings[text], 0.0
+        embedding, encode_ms = encode(text)
+        self._embeddings[text] = embedding
+        return embedding, encode_ms
+
+    def has_errors(self):
+        return any(step['action'].startswith('Error') for step in self.process_flow)
+
+    def emit(self, event, data):
+        """Forward an event to the streaming listener, if the caller registered one"""
+        if self.on_event is not None:
+            self.on_event(event, data)
+
+    def add_step(self, agent, action, description):
+        with self._steps_lock:
+            step = {
+                "step_number": len(self.process_flow) + 1,
+                "agent": agent,
+                "action": action,
+                "description": description,
+                "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1)
+            }
+            self.process_flow.append(step)
+        self.emit('step', step)
+
+    def add_tool_output(self, title, text):
+        with self._steps_lock:
+            self.tool_outputs.append((title, text))
+
+    def start_llm_call(self):
+        self._llm_span = Span('llm.call', model=LLM_MODEL)
+        self._llm_output = ""
+        if self._streaming_answer:
+            self._streaming_answer = False
+            self.emit('token_reset', {})
+
+    def end_llm_call(self, status='ok'):
+        if self._llm_span is not None:
+            self._llm_span.end(status)
+            self._llm_span = None
+
+    def add_llm_chunk(self, chunk):
+        """Stream the part of an LLM response that follows answer_marker (the ReAct 'Final Answer:')"""
+        if self._streaming_answer:
+            self.emit('token', {'text': chunk})
+            return
+        if self.answer_marker is None:
+            return
+        self._llm_output += chunk
+        marker = self._llm_output.find(self.answer_marker)
+        if marker != -1:
+            self._streaming_answer = True
+            answer_start = self._llm_output[marker + len(self.answer_marker):].lstrip()
+            if answer_start:
+                self.emit('token', {'text': answer_start})
+
+
+_request_context = contextvars.ContextVar('request_context', default=None)
+
+
+def current_context():
+    """Return the RequestContext of the running request, or a throwaway one outside of a request"""
+    ctx = _request_context.get()
+    if ctx is None:
+        ctx = RequestContext("")
+    return ctx
+
+
+def _summary_line(shown, total_rows):
+    if total_rows is None:
+        return f"Showing the first {shown} records; more exist."
+    if total_rows > shown:
+        return f"Total records found: {total_rows}. Displaying first {shown} records only."
+    return f"Total records found: {total_rows}."
+
+
+def format_records(columns, rows, total_rows):
+    """Format query rows as numbered records for display in the chat"""
+    parts = ["Query Results:", "=" * 100, _summary_line(len(rows), total_rows), ""]
+    for idx, row in enumerate(rows, 1):
+        parts.append(f"Record {idx}:")
+        parts.extend(f"  {col_name}: {value}" for col_name, value in zip(columns, row))
+        parts.append("-" * 100)
+    return "\n".join(parts) + "\n"
+
+
+def _csv_value(value):
+    text = "" if value is None else str(value)
+    if any(ch in text for ch in ',"\n\r'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def format_table(columns, rows, total_rows):
+    """Format query rows compactly for the LLM: a header line, one CSV line per row and the total count"""
+    lines = [_summary_line(len(rows), total_rows), ",".join(columns)]
+    lines.extend(",".join(_csv_value(value) for value in row) for row in rows)
+    return "\n".join(lines)
+
+
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    """Return the shared LLM client, creating it on first use"""
+    global _llm
+    if _llm is not None:
+        return _llm
+
+    with _llm_lock:
+        if _llm is None:
+            llm_kwargs = {'stream': True} if LLM_STREAMING else {}
+            _llm = install_budget(LLM(
+                model=LLM_MODEL,
+                api_version=LLM_API_VERSION,
+                base_url=LLM_BASE_URL,
+                api_key=LLM_API_KEY,
+                **llm_kwargs
+            ))
+    return _llm
+
+
+def set_llm(llm):
+    """Replace the shared LLM (e.g. with benchmark_fakes.ScriptedLLM); call before the first request,
+    since each worker thread keeps the agents it built"""
+    global _llm
+    with _llm_lock:
+        _llm = install_budget(llm)
+
+
+if crewai_event_bus is not None:
+    @crewai_event_bus.on(LLMCallStartedEvent)
+    def _on_llm_call_started(source, event):
+        ctx = _request_context.get()
+        if ctx is not None:
+            ctx.start_llm_call()
+
+    @crewai_event_bus.on(LLMCallCompletedEvent)
+    def _on_llm_call_completed(source, event):
+        ctx = _request_context.get()
+        if ctx is not None:
+            ctx.end_llm_call()
+
+    @crewai_event_bus.on(LLMCallFailedEvent)
+    def _on_llm_call_failed(source, event):
+        ctx = _request_context.get()
+        if ctx is not None:
+            ctx.end_llm_call('error')
+
+    @crewai_event_bus.on(LLMStreamChunkEvent)
+    def _on_llm_stream_chunk(source, event):
+        ctx = _request_context.get()
+        if ctx is not None:
+            ctx.add_llm_chunk(event.chunk)
+
+
+def knn_search_body(query_embedding, k=5):
+    """Elasticsearch kNN request body for the top-k SOP chunks nearest to query_embedding (a list)"""
+    return {
+        "knn": {
+            "field": "content_embedding",
+            "query_vector": query_embedding,
+            "k": k,
+            "num_candidates": 100
+        },
+        "fields": ["content", "chunk_id", "source"],
+        "_source": ["content", "chunk_id", "source"]
+    }
+
+
+def search_sop_chunks(ctx, query, query_embedding, k=5):
+    """Top-k SOP chunks from the local hybrid index when it is enabled and loaded, otherwise from Elasticsearch"""
+    local_index = get_local_index()
+    if LOCAL_INDEX_ENABLED and local_index.is_ready():
+        ctx.add_step("Incident_SOP_Agent", "Searching local SOP index", "Hybrid BM25 + vector ranking in process")
+        with span('local_index.search'):
+            return local_index.search(query_embedding, query, k=k)
+
+    try:
+        with span('es.search'):
+            results = get_es_client().search(index=ELASTIC_INDEX, body=knn_search_body(query_embedding, k))
+    except Exception as e:
+        # Keep answering from the last local snapshot while Elasticsearch is unavailable
+        if not local_index.is_ready():
+            raise
+        ctx.add_step("Incident_SOP_Agent", "Falling back to local SOP index", f"Elasticsearch search failed: {str(e)}")
+        with span('local_index.search'):
+            return local_index.search(query_embedding, query, k=k)
+    return [hit['_source'] for hit in results['hits']['hits']]
+
+
+def search_sop_chunks_batch(queries, query_embeddings, k=5):
+    """Top-k SOP chunks for many queries at once: one Elasticsearch msearch request, or the local index.
+
+    Returns one hit list per query, or None for a query whose search failed.
+    """
+    local_index = get_local_index()
+    if LOCAL_INDEX_ENABLED and local_index.is_ready():
+        with span('local_index.search', queries=len(queries)):
+            return [local_index.search(embedding, query, k=k) for query, embedding in zip(queries, query_embeddings)]
+
+    body = []
+    for embedding in query_embeddings:
+        body.extend([{'index': ELASTIC_INDEX}, knn_search_body(embedding, k)])
+    with span('es.msearch', queries=len(queries)):
+        responses = get_es_client().msearch(body=body)['responses']
+    return [None if 'error' in response else [hit['_source'] for hit in response['hits']['hits']]
+            for response in responses]
+
+
+def format_chunks(hits):
+    """Render SOP chunks the way get_chunks_tool hands them to the agent"""
+    formatted_results = "Retrieved Document Chunks:\n" + "="*80 + "\n\n"
+    for idx, source in enumerate(hits, 1):
+        formatted_results += f"Chunk {idx}:\n"
+        formatted_results += f"Content:\n{source.get('content', 'No content')}\n"
+        formatted_results += "-"*80 + "\n\n"
+    return formatted_results
+
+
+@tool
+@traced('tool.get_chunks_tool')
+def get_chunks_tool(query: str) -> str:
+    """
+    Retrieves relevant document chunks from Elasticsearch based on semantic similarity.
+
+    Args:
+        query: The search query string
+
+    Returns:
+        A formatted string containing the most relevant document chunks
+    """
+    ctx = current_context()
+    try:
+        # Track step - Incident_SOP_agent executing get_chunks_tool
+        if ctx.route_path == 'manager':
+            ctx.add_step("Manager Agent", "Analyzing user question", f"Analyzing query: {ctx.user_query}")
+            ctx.add_step("Manager Agent", "Delegating to Incident_SOP_Agent", "Routing query to Incident_SOP_Agent")
+        ctx.add_step("Incident_SOP_Agent", "Connecting to MCP ElasticSearch Sever", "Elastablishing connection")
+        ctx.add_step("Incident_SOP_Agent", "Invoking get_chunks_tool", f"Searching SOP documentation for: {query}")
+
+        query_embedding, encode_ms = ctx.embed(query)
+        query_embedding = query_embedding.tolist()
+        ctx.add_step("Incident_SOP_Agent", "Encoding query", f"Query embedding computed in {encode_ms:.1f} ms")
+
+        hits = search_sop_chunks(ctx, query, query_embedding)
+
+        ctx.add_step("Incident_SOP_Agent", "Processing search results",
+                     f"Retrieved {len(hits)} relevant document chunks")
+
+        # Step 4: Format and return results
+        if not hits:
+            return "No relevant chunks found for the query."
+
+        ctx.add_step("Incident_SOP_Agent", "Formatting final response", "Structuring retrieved chunks for presentation")
+
+        formatted_results = format_chunks(hits)
+        ctx.add_tool_output(f"SOP excerpts for: {query}", formatted_results)
+        return formatted_results
+
+    except Exception as e:
+        ctx.add_step("Incident_SOP_Agent", "Error in get_chunks_tool", f"Exception occurred: {str(e)}")
+        error_msg = f"Error retrieving chunks from Elasticsearch: {str(e)}"
+        return error_msg
+
+
+def query_incidents(ctx, sql, params=()):
+    """Run a capped Incidents query, serving repeated read-only queries from the query cache;
+    returns (columns, rows, total_rows)"""
+    cache = get_query_cache()
+    key = QueryCache.make_key(sql, params, SQL_MAX_ROWS) if QUERY_CACHE_ENABLED and is_read_only(sql) else None
+    if key is not None:
+        cached = cache.lookup(key)
+        if cached is not None:
+            ctx.add_step("Incident_Data_Agent", "Query cache hit",
+                         f"Serving results cached within the last {cache.ttl} seconds")
+            return cached
+
+    with get_connection() as conn:
+        columns, rows, total_rows = fetch_limited(conn, sql, params, max_rows=SQL_MAX_ROWS, timeout=SQL_QUERY_TIMEOUT)
+    if key is not None:
+        cache.store(key, columns, rows, total_rows)
+    return columns, rows, total_rows
+
+
+@tool
+@traced('tool.get_sql_data_tool')
+def get_sql_data_tool(query: str) -> str:
+    """
+    Executes a SQL query against the Incident Management database and returns results.
+
+    Args:
+        query: The SQL query string to execute.
+
+    Returns:
+        Formatted string containing the SQL query results or error message
+
+    Example SQL Queries:
+        - "SELECT * FROM Incidents WHERE Incident_ID = 'INC000229'"
+        - "SELECT * FROM Incidents WHERE Status = 'Open' AND Severity = 'P1'"
+        - "SELECT Incident_ID, Service_Name, Status, On_Call_Engineer FROM Incidents WHERE On_Call_Engineer = 'Charles Taylor'"
+        - "SELECT * FROM Incidents WHERE Status = 'In Progress'"
+    """
+    ctx = current_context()
+    try:
+        if ctx.route_path == 'manager':
+            ctx.add_step("Manager Agent", "Analyzing user question", f"Analyzing query: {ctx.user_query}")
+            ctx.add_step("Manager Agent", "Delegating to Incident_Data_Agent", "Routing query to Incident_Data_Agent")
+        ctx.add_step("Incident_Data_Agent", "Connecting to MCP SQL Sever", "Elastablishing connection")
+        ctx.add_step("Incident_Data_Agent", "Invoking get_sql_data_tool", "Executing SQL query")
+
+        columns, rows, total_rows = query_incidents(ctx, query)
+
+        # Track step - Fetching results
+        ctx.add_step("Incident_Data_Agent", "Fetching query results",
+                     f"Retrieved {len(rows)} of {total_rows if total_rows is not None else 'more'} records from database")
+
+        if not rows:
+            ctx.add_step("Incident_Data_Agent", "Formatting final response", "No records found for the query")
+            return "No records found matching the query."
+
+        # Track step - Processing and formatting results
+        ctx.add_step("Incident_Data_Agent", "Processing and formatting results",
+                     f"Formatting {len(rows)} records for display")
+        ctx.add_tool_output("Incident records", format_records(columns, rows, total_rows))
+        return format_table(columns, rows, total_rows)
+
+    except Exception as e:
+        ctx.add_step("Incident_Data_Agent", "Error in get_sql_data_tool", f"Exception occurred: {str(e)}")
+        error_msg = f"Error executing SQL query: {str(e)}"
+        return error_msg
+
+
+@tool
+@traced('tool.get_incident_aggregates_tool')
+def get_incident_aggregates_tool(window: str = "7d", group_by: str = "", severity: str = "", service: str = "",
+                                 team: str = "", status: str = "") -> str:
+    """
+    Returns precomputed incident statistics without running SQL: incident and open counts, SLA breaches,
+    SLA breach rate, and average, p50, p90 and p95 MTTR in minutes.
+
+    Args:
+        window: Time window by Start_Time: "24h", "7d", "30d" or "all".
+        group_by: Optional breakdown: "severity", "service", "team" or "status". Empty for one overall row.
+        severity: Optional Severity filter, e.g. "P1".
+        service: Optional Service_Name filter.
+        team: Optional Owner_Team filter.
+        status: Optional Status filter, e.g. "Open".
+
+    Example calls:
+        - "How many P1s breached SLA this week?" -> window="7d", severity="P1"
+        - "Average MTTR per service this month" -> window="30d", group_by="service"
+    """
+    ctx = current_context()
+    try:
+        ctx.add_step("Incident_Data_Agent", "Invoking get_incident_aggregates_tool",
+                     f"Reading {window} incident statistics" + (f" by {group_by}" if group_by else ""))
+        result = get_aggregate_store().query(window, group_by or None, severity or None, service or None,
+                                             team or None, status or None)
+    except Exception as e:
+        ctx.add_step("Incident_Data_Agent", "Error in get_incident_aggregates_tool", f"Exception occurred: {str(e)}")
+        return f"Error reading incident statistics: {str(e)}"
+
+    if group_by:
+        rows = [(key, *summary.values()) for key, summary in result.items()]
+        columns = [group_by] + (list(next(iter(result.values()))) if result else [])
+    else:
+        rows = [tuple(result.values())]
+        columns = list(result)
+    filters = ", ".join(f"{name}={value}" for name, value in
+                        (("severity", severity), ("service", service), ("team", team), ("status", status)) if value)
+    lines = [f"Incident statistics for window {window}" + (f" ({filters})" if filters else "") + ":", ",".join(columns)]
+    lines.extend(",".join(_csv_value(value) for value in row) for row in rows)
+    ctx.add_tool_output(lines[0].rstrip(':'), "\n".join(lines[1:]))
+    return "\n".join(lines)
+
+
+# crewai agents keep executor state while they run, so each worker thread builds its own set once and
+# reuses it for every request it serves; nothing request-specific is stored on them.
+_thread_agents = threading.local()
+
+
+def get_agents():
+    """Return this thread's (Incident_Data_agent, Incident_SOP_agent, manager_agent), building them on first use"""
+    agents = getattr(_thread_agents, 'agents', None)
+    if agents is not None:
+        return agents
+
+    llm = get_llm()
+
+    Incident_Data_agent = Agent(
+        role="Incident Data Management Assistant",
+        goal=INCIDENT_DATA_GOAL,
+        backstory=INCIDENT_DATA_BACKSTORY,
+        tools=[get_sql_data_tool, get_incident_aggregates_tool] if AGGREGATES_ENABLED else [get_sql_data_tool],
+        llm=llm,
+        verbose=True,
+    )
+
+    Incident_SOP_agent = Agent(
+        role="Incident Management SOP Assistant",
+        goal=INCIDENT_SOP_GOAL,
+        backstory=INCIDENT_SOP_BACKSTORY,
+        tools=[get_chunks_tool],
+        verbose=True,
+        llm=llm
+    )
+
+    manager_agent = Agent(
+        role="Multi-Agent System Manager",
+        goal=MANAGER_GOAL,
+        backstory=MANAGER_BACKSTORY,
+        verbose=True,
+        llm=llm
+    )
+
+    agents = (Incident_Data_agent, Incident_SOP_agent, manager_agent)
+    _thread_agents.agents = agents
+    return agents
+
+
+def run_incident_query(ctx, route):
+    """Execute a router-generated parameterized Incidents query and format the rows as the answer"""
+    if ctx.prefetched_records is not None:
+        ctx.add_step("Incident_Data_Agent", "Using batched lookup",
+                     f"{route['reason']}, read by the batch's combined Incident_ID query")
+        columns, rows, total_rows = ctx.prefetched_records
+    else:
+        ctx.add_step("Incident_Data_Agent", "Executing parameterized query", route['reason'])
+        columns, rows, total_rows = query_incidents(ctx, route['sql'], route['params'])
+
+    ctx.add_step("Incident_Data_Agent", "Fetching query results",
+                 f"Retrieved {len(rows)} of {total_rows if total_rows is not None else 'more'} records from database")
+    if not rows:
+        return "No incidents found matching the query."
+    return format_records(columns, rows, total_rows)
+
+
+def run_single_agent(agent, description, span_name):
+    """Run one agent on its own in a sequential crew, without the manager round-trip"""
+    task = Task(
+        description=description,
+        expected_output="A well-structured, formatted response to the user query",
+        agent=agent
+    )
+    crew = Crew(
+        agents=[agent],
+        tasks=[task],
+        verbose=True,
+        process=Process.sequential
+    )
+    with span(span_name):
+        crew.kickoff()
+    return task.output.raw
+
+
+def with_prefetched_sop(ctx, description):
+    """Append SOP chunks a batch already retrieved for this question, so the agent can answer without calling
+    get_chunks_tool first"""
+    if not ctx.prefetched_sop_hits:
+        return description
+    formatted_results = format_chunks(ctx.prefetched_sop_hits)
+    ctx.add_step("Incident_SOP_Agent", "Using batched SOP retrieval",
+                 f"{len(ctx.prefetched_sop_hits)} document chunks retrieved with the rest of the batch")
+    ctx.add_tool_output(f"SOP excerpts for: {ctx.user_query}", formatted_results)
+    return f"{description}\n\n{PREFETCHED_SOP_INSTRUCTION}\n\n{formatted_results}"
+
+
+def run_sop_agent(user_query_with_context):
+    """Run the SOP agent on its own in a sequential crew, without the manager round-trip"""
+    _, Incident_SOP_agent, _ = get_agents()
+    description = with_prefetched_sop(current_context(), user_query_with_context)
+    return run_single_agent(Incident_SOP_agent, description, 'crew.sop')
+
+
+def semantic_cache_scope(user_query, user_query_with_context):
+    """Scope a cached SOP answer is valid in: the entities the question names, plus a hash of the conversation
+    context around it when it is a follow-up that depends on that context"""
+    entities = question_entities(user_query)
+    context = user_query_with_context.partition(user_query)[2].strip()
+    if not context or not is_follow_up(user_query, entities):
+        return None, entities
+    return hashlib.sha1(context.encode('utf-8')).hexdigest(), entities
+
+
+def answer_sop_question(ctx, user_query_with_context):
+    """Answer an SOP question from the semantic cache when a close enough question about the same entities was
+    already answered"""
+    if not SEMANTIC_CACHE_ENABLED:
+        return run_sop_agent(user_query_with_context)
+
+    cache = get_semantic_cache()
+    try:
+        scope = semantic_cache_scope(ctx.user_query, user_query_with_context)
+        if scope[0] is not None and SEMANTIC_CACHE_SKIP_FOLLOW_UPS:
+            ctx.add_step("Incident_SOP_Agent", "Semantic cache skipped", "Follow-up to earlier turns")
+            return run_sop_agent(user_query_with_context)
+        query_embedding, _ = ctx.embed(ctx.user_query)
+        cached = cache.lookup(query_embedding, scope)
+    except Exception as e:
+        print(f"Semantic cache lookup failed: {str(e)}")
+        return run_sop_agent(user_query_with_context)
+
+    if cached is not None:
+        ctx.add_step("Incident_SOP_Agent", "Semantic cache hit",
+                     f"Reusing answer to \"{cached['query']}\" (similarity {cached['similarity']:.3f})")
+        return cached['answer']
+
+    ctx.add_step("Incident_SOP_Agent", "Semantic cache miss", "No sufficiently similar SOP question cached")
+    result = run_sop_agent(user_query_with_context)
+    if not ctx.has_errors() and SOP_NO_ANSWER not in result:
+        cache.store(ctx.user_query, query_embedding, result, scope)
+    return result
+
+
+def run_manager_crew(user_query_with_context):
+    """Run the full hierarchical crew and let the manager agent pick the specialist"""
+    Incident_Data_agent, Incident_SOP_agent, manager_agent = get_agents()
+
+    task = Task(
+        description=user_query_with_context,
+        expected_output="A well-structured, formatted response to the user query"
+    )
+
+    # Create and execute the crew
+    crew = Crew(
+        agents=[Incident_SOP_agent, Incident_Data_agent],
+        tasks=[task],
+        verbose=True,
+        process=Process.hierarchical,
+        manager_agent=manager_agent
+    )
+
+    with span('crew.manager'):
+        crew.kickoff()
+    return task.output.raw
+
+
+_fan_out_executor = None
+_fan_out_lock = threading.Lock()
+
+
+def get_fan_out_executor():
+    """Return the thread pool that runs fan-out branches, creating it on first use"""
+    global _fan_out_executor
+    if _fan_out_executor is not None:
+        return _fan_out_executor
+
+    with _fan_out_lock:
+        if _fan_out_executor is None:
+            _fan_out_executor = ThreadPoolExecutor(max_workers=FAN_OUT_MAX_WORKERS, thread_name_prefix='fan-out')
+    return _fan_out_executor
+
+
+def _run_branch(branch_ctx, budget, name, description):
+    """Body of one fan-out branch; runs in a pool thread inside a copy of the request's contextvars"""
+    _request_context.set(branch_ctx)
+    if budget is not None:
+        use_budget(budget)
+    Incident_Data_agent, Incident_SOP_agent, _ = get_agents()
+    agent = Incident_Data_agent if name == 'data' else Incident_SOP_agent
+    with span(f'fan_out.{name}'):
+        return run_single_agent(agent, description, f'crew.{name}')
+
+
+def synthesize_answer(ctx, data_answer, sop_answer):
+    """Merge the two branch answers with a single direct LLM call, streamed to the listener as the answer"""
+    ctx.add_step("Manager Agent", "Synthesizing answer", "Merging incident data and SOP findings")
+    messages = [
+        {'role': 'system', 'content': SYNTHESIS_PROMPT},
+        {'role': 'user', 'content': (f"User question:\n{ctx.user_query}\n\n"
+                                     f"Incident data findings:\n{data_answer}\n\n"
+                                     f"SOP findings:\n{sop_answer}")},
+    ]
+    ctx.answer_marker = ""
+    try:
+        with span('fan_out.synthesis'):
+            return get_llm().call(messages)
+    finally:
+        ctx.answer_marker = FINAL_ANSWER_MARKER
+
+
+def run_fan_out(ctx, user_query_with_context):
+    """Answer a mixed question by running the data and SOP agents concurrently, then merging their answers.
+
+    Each branch has its own timeout. When only one branch finishes, its answer is returned with a note instead of
+    paying for a synthesis call; when both fail, the data branch's error is raised.
+
+    A running thread cannot be stopped, so a timed-out branch is cancelled through its BranchBudget instead: its
+    next LLM call raises LLMBudgetExceeded and ends its crew. Until then it keeps its pool thread, and the calls it
+    makes are charged to this request's budget.
+    """
+    branches = {
+        'data': ("Incident_Data_Agent", DATA_BRANCH_INSTRUCTION),
+        'sop': ("Incident_SOP_Agent", SOP_BRANCH_INSTRUCTION),
+    }
+    ctx.add_step("Manager Agent", "Running agents in parallel",
+                 "Incident_Data_Agent and Incident_SOP_Agent work on their parts of the question concurrently")
+    executor = get_fan_out_executor()
+    started = time.monotonic()
+    with span('fan_out'):
+        futures = {}
+        for name, (_, instruction) in branches.items():
+            branch_ctx = ctx.branch()
+            budget = branch_budget(FAN_OUT_BRANCH_TIMEOUTS[name])
+            description = f"{user_query_with_context}\n\n{instruction}"
+            if name == 'sop':
+                description = with_prefetched_sop(ctx, description)
+            future = executor.submit(contextvars.copy_context().run, _run_branch, branch_ctx, budget, name,
+                                     description)
+            futures[name] = (future, branch_ctx, budget)
+
+        answers = {}
+        errors = {}
+        for name, (future, branch_ctx, budget) in futures.items():
+            agent_name = branches[name][0]
+            timeout = FAN_OUT_BRANCH_TIMEOUTS[name]
+            try:
+                answers[name] = future.result(timeout=max(0.0, started + timeout - time.monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                if budget is not None:
+                    budget.cancel(f"{agent_name} branch abandoned after {timeout}s")
+                branch_ctx.detach()
+                errors[name] = TimeoutError(f"{agent_name} did not answer within {timeout}s")
+                ctx.add_step(agent_name, "Error: branch timed out", str(errors[name]))
+            except Exception as e:
+                errors[name] = e
+                ctx.add_step(agent_name, "Error in parallel branch", f"Exception occurred: {str(e)}")
+
+        if not answers:
+            raise errors['data']
+        if len(answers) == 1:
+            (name, answer), = answers.items()
+            (_, error), = errors.items()
+            missing = 'incident data' if name == 'sop' else 'SOP'
+            return f"{answer}\n\nThe {missing} part of this question could not be answered: {str(error)}"
+        try:
+            return synthesize_answer(ctx, answers['data'], answers['sop'])
+        except LLMBudgetExceeded as e:
+            ctx.add_step("Manager Agent", "Skipping synthesis", str(e))
+            return f"{answers['data']}\n\n{answers['sop']}"
+
+
+def with_resolved_entities(ctx, user_query_with_context):
+    """Append the exact Incidents values of the services, teams and engineers the question names, so the data agent
+    writes SQL with literals that exist instead of retrying after an empty result"""
+    entities = get_entity_index().resolve(ctx.user_query)
+    if not entities:
+        return user_query_with_context
+    lines = []
+    for entity in entities:
+        written = f" (written as \"{entity['mention']}\")" if entity['mention'] != entity['value'] else ""
+        lines.append(f"- {entity['column']} = '{entity['value']}'{written}")
+    ctx.add_step("Router", "Resolved entity names",
+                 ", ".join(f"{entity['mention']} -> {entity['value']}" for entity in entities))
+    return f"{user_query_with_context}\n\n{ENTITY_HINT_INSTRUCTION}\n" + "\n".join(lines)
+
+
+def degraded_answer(ctx, error):
+    """Answer from what the tools already retrieved when the LLM budget ran out before a final answer"""
+    header = f"I could not complete a full answer within this request's limits ({error.reason})."
+    if not ctx.tool_outputs:
+        return f"{header} No data was retrieved before that point; please try a narrower question."
+    sections = [f"{title}:\n{text}" for title, text in ctx.tool_outputs]
+    return f"{header} Here is what was retrieved so far:\n\n" + "\n\n".join(sections)
+
+
+def Multiagentsystem(user_query, user_query_with_context, on_event=None, deadline=None, prefetched=None,
+                     on_budget=None):
+    """Function to handle multi-agent system for incident management queries.
+
+    on_event, when given, is called as on_event(event, data) for every process_flow step ('step') and for
+    streamed tokens of the final answer ('token', 'token_reset') while the crew runs.
+
+    LLM calls are bounded by a per-request budget (calls, tokens and a deadline, brought forward to the time.time()
+    deadline when given); when it runs out the answer is built from the tool outputs and 'degraded' is True.
+    on_budget, when given, is called with that budget as soon as it exists, so a caller can cancel it from another
+    thread, e.g. when the job running this request is cancelled.
+
+    prefetched carries work batch_query.py already did for this question: its 'embedding', 'sop_hits' and, for
+    incident ID lookups, 'incident_records' as (columns, rows, total_rows).
+    """
+    ctx = RequestContext(user_query, on_event=on_event)
+    if prefetched:
+        ctx.apply_prefetched(prefetched)
+    token = _request_context.set(ctx)
+    # Callers such as app.run_query_job open the trace themselves so their own DB work is included
+    outer_trace = current_trace()
+    try:
+        with nullcontext(outer_trace) if outer_trace is not None else trace_request() as trace, \
+                request_budget(deadline) as budget:
+            if on_budget is not None:
+                on_budget(budget)
+            route = route_query(user_query) if FAST_PATH_ENABLED else None
+            if route is not None:
+                ctx.route_path = route['path']
+                ctx.add_step("Router", f"Selected {route['path']} path", route['reason'])
+            if ctx.route_path == 'mixed' and not FAN_OUT_ENABLED:
+                ctx.route_path = 'manager'
+            set_trace_attribute('route', ctx.route_path)
+            if ENTITY_INDEX_ENABLED and ctx.route_path in ('manager', 'mixed'):
+                user_query_with_context = with_resolved_entities(ctx, user_query_with_context)
+
+            degraded = False
+            try:
+                if ctx.route_path in ('incident_lookup', 'incident_filter'):
+                    result = run_incident_query(ctx, route)
+                elif ctx.route_path == 'sop':
+                    result = answer_sop_question(ctx, user_query_with_context)
+                elif ctx.route_path == 'mixed':
+                    result = run_fan_out(ctx, user_query_with_context)
+                else:
+                    result = run_manager_crew(user_query_with_context)
+            except LLMBudgetExceeded as e:
+                ctx.add_step("Manager Agent", "LLM budget exhausted", f"{str(e)}; answering from retrieved data")
+                set_trace_attribute('degraded', True)
+                result = degraded_answer(ctx, e)
+                degraded = True
+            result = result.replace('*', '').replace('#', '')
+    finally:
+        _request_context.reset(token)
+
+    # Return the process_flow list, the result, LLM usage and the timing spans recorded so far
+    return {
+        "process_flow": ctx.process_flow,
+        "response": result,
+        "route": ctx.route_path,
+        "degraded": degraded,
+        "usage": budget.usage(),
+        "spans": trace.to_list()
+    }
@@ -1,201 +1,589 @@
-from flask import Flask, render_template, request, jsonify
-from Crewai_agents import Multiagentsystem
-import pyodbc
-from datetime import datetime
-
-app = Flask(__name__)
-
-DB_CONNECTION_STRING = 'Driver={ODBC Driver 17 for SQL Server};Server=<your_server>;Database=<your_database>;Trusted_Connection=yes;'
-
-def get_chat_history(chat_id, limit=5):
-    """Fetch last N chats for a specific chat_id from SQL Server"""
-    try:
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT Question, response FROM IncidentChatHistory 
-            WHERE ChatID = ? 
-            ORDER BY DateTime ASC
-            OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY
-        ''', (chat_id, limit))
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        history = []
-        for row in rows:
-            history.append({
-                'question': row[0],
-                'response': row[1]
-            })
-        
-        return history
-    except Exception as e:
-        print(f"Database error: {str(e)}")
-        return []
-
-
-def format_chat_context(chat_history):
-    """Format chat history as context string"""
-    if not chat_history:
-        return ""
-    
-    context = "chat history:\n\n"
-    for idx, chat in enumerate(chat_history):
-        context += f"\nQuestion: {chat['question']}\nResponse: {chat['response']}\n"
-    
-    return context
-
-
-def save_to_database(chat_id, question, response):
-    """Save chat history to SQL Server"""
-    try:
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO IncidentChatHistory (ChatID, Question, response, DateTime)
-            VALUES (?, ?, ?, ?)
-        ''', (chat_id, question, response, datetime.now()))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print(f"Chat {chat_id} saved to database")
-        return True
-    except Exception as e:
-        print(f"Database error: {str(e)}")
-        return False
-
-
-@app.route('/')
-def home():
-    return render_template('home.html')
-
-@app.route('/app')
-def app_index():
-    return render_template('index.html')
-
-@app.route('/get-conversations', methods=['GET'])
-def get_conversations():
-    """Fetch all conversations from SQL Server"""
-    try:
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT DISTINCT ChatID, Question, response, DateTime FROM IncidentChatHistory ORDER BY DateTime DESC')
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        conversations = []
-        for row in rows:
-            conversations.append({
-                'chatId': row[0],
-                'question': row[1],
-                'response': row[2],
-                'dateTime': row[3].isoformat() if row[3] else None
-            })
-        
-        return jsonify(conversations)
-    except Exception as e:
-        print(f"Database error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/get-chat/<chat_id>', methods=['GET'])
-def get_chat(chat_id):
-    """Fetch specific chat history from SQL Server"""
-    try:
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT Question, response FROM IncidentChatHistory WHERE ChatID = ? ORDER BY DateTime ASC', (chat_id,))
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        messages = []
-        for row in rows:
-            messages.append({
-                'role': 'user',
-                'content': row[0]
-            })
-            messages.append({
-                'role': 'assistant',
-                'content': row[1],
-            })
-        
-        return jsonify({'messages': messages})
-    except Exception as e:
-        print(f"Database error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/delete-chat/<chat_id>', methods=['DELETE'])
-def delete_chat(chat_id):
-    """Delete a specific chat from SQL Server"""
-    try:
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM IncidentChatHistory WHERE ChatID = ?', (chat_id,))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'success': True, 'message': 'Chat deleted'})
-    except Exception as e:
-        print(f"Database error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/clear-all', methods=['DELETE'])
-def clear_all():
-    """Delete all chats from SQL Server"""
-    try:
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM IncidentChatHistory')
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'success': True, 'message': 'All conversations cleared'})
-    except Exception as e:
-        print(f"Database error: {str(e)}")
-        return jsonify({'error': str(e)}), 500 
-
-@app.route('/query', methods=['POST'])
-def query():
-    user_query = request.json.get('query', '')
-    chat_id = request.json.get('chatId', '')  # Receive chatId from frontend
-    
-    if not user_query:
-        return jsonify({'error': 'Query cannot be empty'}), 400
-    
-    if not chat_id:
-        return jsonify({'error': 'Chat ID missing'}), 400
-    
-    try:
-        chat_history = get_chat_history(chat_id, limit=5)
-        formatted_context = format_chat_context(chat_history)
-        query_with_context = f"user query:\n{user_query}\n\n{formatted_context}\n" if formatted_context else f"user query:\n{user_query}"
-        
-        result = Multiagentsystem(user_query,query_with_context)
-        
-        # Extract response and process_flow
-        response = result.get('response', '')
-        process_flow = result.get('process_flow', [])
-        print(f"Process Flow: {process_flow}")
-        save_to_database(chat_id, user_query, response)
-        
-        return jsonify({
-            'chatId': chat_id,
-            'response': response,
-            'process_flow': process_flow
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+from startup import (mark_phase, start_preload, startup_report, format_startup_report,
+                     STARTUP_PRELOAD_ENABLED)
+from flask import Flask, render_template, request, jsonify, Response
+from embeddings import get_embedding_stats
+from es_client import es_health, close_es_client
+from db_pool import get_connection, get_pool
+from chat_context import build_chat_context
+from chat_writer import (get_chat_writer, sync_chat_history, shutdown_chat_writer, write_turns,
+                         CHAT_WRITE_BEHIND_ENABLED)
+from semantic_cache import get_semantic_cache, SEMANTIC_CACHE_ENABLED
+from query_cache import get_query_cache
+from incident_aggregates import get_aggregate_store, AGGREGATES_ENABLED, AGGREGATE_WINDOWS
+from entity_index import get_entity_index, ENTITY_INDEX_ENABLED, ENTITY_FIELDS, ENTITY_TYPEAHEAD_LIMIT
+from tracing import span, trace_request, get_metrics
+from local_index import get_local_index, LOCAL_INDEX_ENABLED
+from job_queue import (get_job_manager, shutdown_job_manager, JobQueueFull, JobManagerClosed, JOB_MAX_WORKERS,
+                       JOB_MAX_QUEUE_DEPTH, JOB_RETRY_AFTER_SECONDS)
+import atexit
+import base64
+import binascii
+import json
+import math
+import time
+from datetime import datetime
+
+mark_phase('imports')
+app = Flask(__name__)
+
+# crewai, the agents and the embedding model load in the background; history and health routes never need them
+if STARTUP_PRELOAD_ENABLED:
+    start_preload()
+if LOCAL_INDEX_ENABLED:
+    get_local_index().start_background_sync()
+if AGGREGATES_ENABLED:
+    get_aggregate_store().start_background_refresh()
+if ENTITY_INDEX_ENABLED:
+    get_entity_index().start_background_refresh()
+if SEMANTIC_CACHE_ENABLED:
+    get_semantic_cache().start_index_check()
+atexit.register(close_es_client)
+atexit.register(lambda: get_pool().close_all())
+# atexit runs in reverse: finish jobs, then flush their chat history, then close the pool
+atexit.register(shutdown_chat_writer)
+atexit.register(shutdown_job_manager)
+
+# Seconds between SSE keep-alive comments while the crew is still working
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Page size limits for the paginated conversation list
+CONVERSATIONS_PAGE_SIZE = 20
+CONVERSATIONS_MAX_PAGE_SIZE = 100
+
+# Largest /query-batch request; the batch shares one job and its deadline, so raise deadlineSeconds with it
+BATCH_MAX_QUESTIONS = 100
+
+def format_query_with_context(user_query, formatted_context):
+    """Prefix the user query with an already built conversation context"""
+    return f"user query:\n{user_query}\n\n{formatted_context}\n" if formatted_context else f"user query:\n{user_query}"
+
+
+def build_query_with_context(chat_id, user_query):
+    """Prefix the user query with the token-budgeted conversation context for this chat_id"""
+    return format_query_with_context(user_query, build_chat_context(chat_id))
+
+
+def format_sse(event, data):
+    """Encode one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def save_to_database(chat_id, question, response):
+    """Queue the turn for the background chat history writer, or write it now when write-behind is off or full"""
+    try:
+        if CHAT_WRITE_BEHIND_ENABLED and get_chat_writer().enqueue(chat_id, question, response):
+            return True
+        with span('db.save_chat'), get_connection() as conn:
+            write_turns(conn, [(0, chat_id, question, response, datetime.now())])
+            conn.commit()
+        print(f"Chat {chat_id} saved to database")
+        return True
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return False
+
+
+@app.route('/')
+def home():
+    return render_template('home.html')
+
+@app.route('/app')
+def app_index():
+    return render_template('index.html')
+
+@app.route('/get-conversations', methods=['GET'])
+def get_conversations():
+    """Fetch all conversations from SQL Server"""
+    try:
+        sync_chat_history()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT DISTINCT ChatID, Question, response, DateTime FROM IncidentChatHistory ORDER BY DateTime DESC')
+            rows = cursor.fetchall()
+            cursor.close()
+        
+        conversations = []
+        for row in rows:
+            conversations.append({
+                'chatId': row[0],
+                'question': row[1],
+                'response': row[2],
+                'dateTime': row[3].isoformat() if row[3] else None
+            })
+        
+        return jsonify(conversations)
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def encode_cursor(last_activity, chat_id):
+    """Opaque keyset cursor for the last row of a page"""
+    payload = json.dumps({'lastActivity': last_activity.isoformat(), 'chatId': chat_id})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor_value):
+    """Return (last_activity, chat_id) from a cursor, raising ValueError when it is malformed"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor_value.encode('ascii')))
+        return datetime.fromisoformat(payload['lastActivity']), payload['chatId']
+    except (binascii.Error, KeyError, TypeError, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
+@app.route('/conversations', methods=['GET'])
+def list_conversations():
+    """One row per chat (title, last activity, message count), newest first, keyset-paginated"""
+    try:
+        limit = min(max(int(request.args.get('limit', CONVERSATIONS_PAGE_SIZE)), 1), CONVERSATIONS_MAX_PAGE_SIZE)
+        cursor_value = request.args.get('cursor')
+        after = decode_cursor(cursor_value) if cursor_value else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        sync_chat_history()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Fetch one extra row to learn whether another page exists
+            if after is None:
+                cursor.execute('''
+                    SELECT TOP (?) ChatID, Title, LastActivity, MessageCount FROM IncidentChats
+                    ORDER BY LastActivity DESC, ChatID DESC
+                ''', (limit + 1,))
+            else:
+                last_activity, last_chat_id = after
+                cursor.execute('''
+                    SELECT TOP (?) ChatID, Title, LastActivity, MessageCount FROM IncidentChats
+                    WHERE LastActivity < ? OR (LastActivity = ? AND ChatID < ?)
+                    ORDER BY LastActivity DESC, ChatID DESC
+                ''', (limit + 1, last_activity, last_activity, last_chat_id))
+            rows = cursor.fetchall()
+            cursor.close()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        conversations = []
+        for row in rows:
+            conversations.append({
+                'chatId': row[0],
+                'title': row[1],
+                'lastActivity': row[2].isoformat() if row[2] else None,
+                'messageCount': row[3]
+            })
+        
+        next_cursor = encode_cursor(rows[-1][2], rows[-1][0]) if has_more else None
+        return jsonify({'conversations': conversations, 'nextCursor': next_cursor})
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/get-chat/<chat_id>', methods=['GET'])
+def get_chat(chat_id):
+    """Fetch specific chat history from SQL Server"""
+    try:
+        sync_chat_history(chat_id)
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT Question, response FROM IncidentChatHistory WHERE ChatID = ? ORDER BY DateTime ASC', (chat_id,))
+            rows = cursor.fetchall()
+            cursor.close()
+        
+        messages = []
+        for row in rows:
+            messages.append({
+                'role': 'user',
+                'content': row[0]
+            })
+            messages.append({
+                'role': 'assistant',
+                'content': row[1],
+            })
+        
+        return jsonify({'messages': messages})
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/delete-chat/<chat_id>', methods=['DELETE'])
+def delete_chat(chat_id):
+    """Delete a specific chat from SQL Server"""
+    try:
+        # Queued turns would otherwise be written after the delete and bring the chat back
+        sync_chat_history(chat_id)
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('DELETE FROM IncidentChatHistory WHERE ChatID = ?', (chat_id,))
+            cursor.execute('DELETE FROM IncidentChats WHERE ChatID = ?', (chat_id,))
+            cursor.execute('DELETE FROM IncidentChatSummary WHERE ChatID = ?', (chat_id,))
+            conn.commit()
+            cursor.close()
+        
+        return jsonify({'success': True, 'message': 'Chat deleted'})
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/clear-all', methods=['DELETE'])
+def clear_all():
+    """Delete all chats from SQL Server"""
+    try:
+        sync_chat_history()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('DELETE FROM IncidentChatHistory')
+            cursor.execute('DELETE FROM IncidentChats')
+            cursor.execute('DELETE FROM IncidentChatSummary')
+            conn.commit()
+            cursor.close()
+        
+        return jsonify({'success': True, 'message': 'All conversations cleared'})
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return jsonify({'error': str(e)}), 500 
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 503 until the agents and embedding model have loaded, with the startup timing report"""
+    report = startup_report()
+    return jsonify(report), 200 if report['ready'] else 503
+
+@app.route('/embedding-status', methods=['GET'])
+def embedding_status():
+    """Report embedding model readiness, load time and encode latency"""
+    return jsonify(get_embedding_stats())
+
+@app.route('/es-health', methods=['GET'])
+def elasticsearch_health():
+    """Probe the shared Elasticsearch client"""
+    health = es_health()
+    return jsonify(health), 200 if health['healthy'] else 503
+
+@app.route('/db-pool-status', methods=['GET'])
+def db_pool_status():
+    """Report SQL Server connection pool metrics"""
+    return jsonify(get_pool().metrics())
+
+def run_query_job(job, chat_id, user_query):
+    """Job body for one question: build the context, run the agents and persist the answer"""
+    # Imported here so the server starts without crewai; waits for the preload thread if it is mid-import
+    from Crewai_agents import Multiagentsystem
+
+    with trace_request() as trace:
+        query_with_context = build_query_with_context(chat_id, user_query)
+        # Cancelling or expiring the job only drops its result; cancelling the LLM budget stops the crew spending
+        result = Multiagentsystem(user_query, query_with_context, on_event=job.emit, deadline=job.deadline,
+                                  on_budget=lambda budget: job.on_cancel(budget.cancel))
+        
+        # Extract response and process_flow
+        response = result.get('response', '')
+        process_flow = result.get('process_flow', [])
+        print(f"Process Flow: {process_flow}")
+        if not job.cancel_requested:
+            save_to_database(chat_id, user_query, response)
+    
+    return {
+        'chatId': chat_id,
+        'response': response,
+        'process_flow': process_flow,
+        'usage': result.get('usage'),
+        'degraded': result.get('degraded', False),
+        'spans': trace.to_list()
+    }
+
+
+def run_batch_job(job, chat_id, questions):
+    """Job body for /query-batch: answer every question, emitting an 'item' event as each one finishes"""
+    from batch_query import run_batch
+
+    with trace_request() as trace:
+        # One context read for the whole batch; every question sees the chat as it was when the batch started
+        formatted_context = build_chat_context(chat_id) if chat_id else ""
+
+        def on_item(item):
+            job.emit('item', item)
+            if chat_id and 'response' in item and not job.cancel_requested:
+                save_to_database(chat_id, item['query'], item['response'])
+
+        questions_with_context = [format_query_with_context(question, formatted_context) for question in questions]
+        summary = run_batch(questions, questions_with_context, deadline=job.deadline, on_item=on_item,
+                            is_cancelled=lambda: job.cancel_requested or job.is_finished(),
+                            on_budget=lambda budget: job.on_cancel(budget.cancel))
+    return {'chatId': chat_id, **summary, 'spans': trace.to_list()}
+
+
+def parse_deadline_seconds(value):
+    """deadlineSeconds from a request as a positive float, or None when absent; raises ValueError otherwise"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(value)
+    seconds = float(value)
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(value)
+    return seconds
+
+
+def queue_job(fn, *args):
+    """Queue a job with the request's deadlineSeconds; returns (job, None) or (None, error response)"""
+    try:
+        deadline_seconds = parse_deadline_seconds(request.json.get('deadlineSeconds'))
+    except (TypeError, ValueError):
+        return None, (jsonify({'error': 'deadlineSeconds must be a positive number of seconds'}), 400)
+    try:
+        job = get_job_manager().submit(fn, *args, deadline_seconds=deadline_seconds)
+    except JobQueueFull as e:
+        return None, (jsonify({'error': str(e)}), 429, {'Retry-After': str(JOB_RETRY_AFTER_SECONDS)})
+    except JobManagerClosed as e:
+        return None, (jsonify({'error': str(e)}), 503)
+    return job, None
+
+
+def submit_query_job():
+    """Validate a query request and queue it; returns (job, None) or (None, error response)"""
+    user_query = request.json.get('query', '')
+    chat_id = request.json.get('chatId', '')  # Receive chatId from frontend
+    
+    if not user_query:
+        return None, (jsonify({'error': 'Query cannot be empty'}), 400)
+    
+    if not chat_id:
+        return None, (jsonify({'error': 'Chat ID missing'}), 400)
+
+    return queue_job(run_query_job, chat_id, user_query)
+
+@app.route('/query', methods=['POST'])
+def query():
+    job, error_response = submit_query_job()
+    if error_response:
+        return error_response
+    
+    job.wait(max(0, job.deadline - time.time()) + 1)
+    if job.status == 'succeeded':
+        return jsonify(job.result)
+    if job.status == 'expired' or not job.is_finished():
+        get_job_manager().cancel(job.id)
+        return jsonify({'error': 'Query did not complete before its deadline'}), 504
+    return jsonify({'error': job.error}), 500
+
+def stream_job_events(job):
+    """Server-Sent Events response replaying and then following a job's events"""
+    def generate():
+        for item in job.iter_events(keepalive_seconds=STREAM_KEEPALIVE_SECONDS):
+            if item is None:
+                yield ": keep-alive\n\n"
+                continue
+            event, data = item
+            yield format_sse(event, data)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/query-stream', methods=['POST'])
+def query_stream():
+    """Same as /query, but streams process_flow steps and answer tokens as Server-Sent Events"""
+    job, error_response = submit_query_job()
+    if error_response:
+        return error_response
+    return stream_job_events(job)
+
+@app.route('/query-batch', methods=['POST'])
+def query_batch():
+    """Answer many questions in one request, streamed back as NDJSON: one 'item' line per question as it finishes,
+    then a 'done' line with the summary (or an 'error' line); blank lines are keep-alives"""
+    questions = request.json.get('queries')
+    chat_id = request.json.get('chatId', '')
+    if not isinstance(questions, list) or not questions:
+        return jsonify({'error': 'queries must be a non-empty list of questions'}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_QUESTIONS} questions per batch'}), 400
+    if not all(isinstance(question, str) and question.strip() for question in questions):
+        return jsonify({'error': 'Every query must be a non-empty string'}), 400
+
+    job, error_response = queue_job(run_batch_job, chat_id, questions)
+    if error_response:
+        return error_response
+
+    def generate():
+        yield json.dumps({'type': 'accepted', 'jobId': job.id, 'count': len(questions)}) + "\n"
+        for item in job.iter_events(keepalive_seconds=STREAM_KEEPALIVE_SECONDS):
+            if item is None:
+                yield "\n"
+                continue
+            event, data = item
+            if event == 'done':
+                # Items were already streamed one by one
+                data = {key: value for key, value in data.items() if key != 'items'}
+            yield json.dumps({'type': event, **data}, default=str) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a query and return immediately with the job ID"""
+    job, error_response = submit_query_job()
+    if error_response:
+        return error_response
+    return jsonify({
+        **job.to_dict(include_result=False),
+        'statusUrl': f'/jobs/{job.id}',
+        'streamUrl': f'/jobs/{job.id}/stream'
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a job's status and, once finished, its result"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/stream', methods=['GET'])
+def stream_job(job_id):
+    """Stream a job's events as Server-Sent Events"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return stream_job_events(job)
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict(include_result=False))
+
+@app.route('/semantic-cache-status', methods=['GET'])
+def semantic_cache_status():
+    """Report SOP answer cache hit and miss counters"""
+    return jsonify(get_semantic_cache().stats())
+
+@app.route('/semantic-cache', methods=['DELETE'])
+def clear_semantic_cache():
+    """Drop every cached SOP answer"""
+    get_semantic_cache().invalidate_all('cleared via API')
+    return jsonify({'success': True, 'message': 'Semantic cache cleared'})
+
+@app.route('/query-cache-status', methods=['GET'])
+def query_cache_status():
+    """Report Incidents query cache hit ratio and size"""
+    return jsonify(get_query_cache().stats())
+
+@app.route('/query-cache', methods=['DELETE'])
+def clear_query_cache():
+    """Drop every cached Incidents query result"""
+    get_query_cache().invalidate_all('cleared via API')
+    return jsonify({'success': True, 'message': 'Query cache cleared'})
+
+@app.route('/query-cache/incidents/<incident_id>', methods=['DELETE'])
+def invalidate_incident_cache(incident_id):
+    """Invalidation hook for systems that update an incident: drop cached results that include it"""
+    dropped = get_query_cache().invalidate_incident(incident_id)
+    return jsonify({'success': True, 'incidentId': incident_id, 'invalidated': dropped})
+
+@app.route('/aggregates', methods=['GET'])
+def incident_aggregates():
+    """Precomputed incident statistics for dashboards; filters and groupBy narrow the result to one window"""
+    store = get_aggregate_store()
+    window = request.args.get('window')
+    group_by = request.args.get('groupBy')
+    filters = {name: request.args.get(name) for name in ('severity', 'service', 'team', 'status')}
+    try:
+        if not window and not group_by and not any(filters.values()):
+            snapshot = store.snapshot() or store.refresh()
+            return jsonify(snapshot)
+        window = window or '7d'
+        result = store.query(window, group_by, **filters)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'windows': list(AGGREGATE_WINDOWS)}), 400
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'window': window, 'groupBy': group_by, 'filters': {k: v for k, v in filters.items() if v},
+                    'generated_at': store.snapshot()['generated_at'], 'result': result})
+
+@app.route('/aggregates-status', methods=['GET'])
+def aggregates_status():
+    """Report aggregate store size, watermark and refresh timings"""
+    return jsonify(get_aggregate_store().stats())
+
+@app.route('/typeahead', methods=['GET'])
+def typeahead():
+    """Completions for the incident ID, service, team or engineer name at the end of the chat box text"""
+    text = request.args.get('q', '')
+    kinds = [kind for kind in request.args.get('kinds', '').split(',') if kind]
+    unknown = [kind for kind in kinds if kind not in ENTITY_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown kinds: {', '.join(unknown)}", 'kinds': list(ENTITY_FIELDS)}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', ENTITY_TYPEAHEAD_LIMIT)), 1), ENTITY_TYPEAHEAD_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    index = get_entity_index()
+    fragment, suggestions = index.suggest(text, limit, kinds or None)
+    return jsonify({'fragment': fragment, 'suggestions': suggestions, 'ready': index.is_ready()})
+
+@app.route('/entity-index-status', methods=['GET'])
+def entity_index_status():
+    """Report entity index size, watermark, refresh timings and resolution counts"""
+    return jsonify(get_entity_index().stats())
+
+@app.route('/local-index-status', methods=['GET'])
+def local_index_status():
+    """Report the in-process SOP index size and last sync time"""
+    return jsonify(get_local_index().stats())
+
+@app.route('/chat-writer-status', methods=['GET'])
+def chat_writer_status():
+    """Report queued, written and dropped chat history rows"""
+    return jsonify(get_chat_writer().stats())
+
+@app.route('/job-queue-status', methods=['GET'])
+def job_queue_status():
+    """Report worker pool and queue depth counters"""
+    return jsonify(get_job_manager().stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: span and request latency histograms plus pool, queue and cache gauges"""
+    pool = get_pool().metrics()
+    jobs = get_job_manager().stats()
+    semantic_cache = get_semantic_cache().stats()
+    query_cache = get_query_cache().stats()
+    chat_writer = get_chat_writer().stats()
+    gauges = {
+        'db_pool_connections': {(('state', 'in_use'),): pool['in_use'], (('state', 'idle'),): pool['idle']},
+        'job_queue_jobs': {(('state', 'running'),): jobs['running'], (('state', 'queued'),): jobs['queued']},
+        'cache_hit_ratio': {(('cache', 'semantic'),): semantic_cache['hit_ratio'],
+                            (('cache', 'query'),): query_cache['hit_ratio']},
+        'chat_writer_pending_rows': chat_writer['pending'],
+    }
+    return Response(get_metrics().render(gauges), mimetype='text/plain; version=0.0.4')
+
+mark_phase('app_ready')
+print(format_startup_report())
+
+if __name__ == '__main__':
+    # Use a production WSGI server when available; the Flask development server is for local debugging only
+    try:
+        from waitress import serve
+    except ImportError:
+        app.run(debug=True, port=5000, threaded=True)
+    else:
+        serve(app, host='0.0.0.0', port=5000, threads=JOB_MAX_WORKERS + JOB_MAX_QUEUE_DEPTH)
@@ -0,0 +1,156 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from Crewai_agents import Multiagentsystem, search_sop_chunks_batch, FAST_PATH_ENABLED, SQL_QUERY_TIMEOUT
+from db_pool import get_connection, fetch_limited
+from embeddings import encode_batch
+from router import route_query, INCIDENT_COLUMNS
+from tracing import span
+
+# /query-batch answers many questions in one request, sharing embedding, SOP retrieval and incident lookups.
+# Questions answered at once across all batches; each may run a crew, so this bounds batch LLM traffic
+BATCH_MAX_CONCURRENCY = 4
+# Incident IDs per combined IN (...) query; SQL Server allows at most 2100 parameters per statement
+BATCH_LOOKUP_CHUNK_SIZE = 500
+# Paths answered straight from SQL; they are scheduled first so their results stream back immediately
+NO_LLM_PATHS = ('incident_lookup', 'incident_filter')
+
+_batch_executor = None
+_batch_lock = threading.Lock()
+
+
+def get_batch_executor():
+    """Return the thread pool that answers batch questions, creating it on first use"""
+    global _batch_executor
+    if _batch_executor is not None:
+        return _batch_executor
+
+    with _batch_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_CONCURRENCY, thread_name_prefix='batch-query')
+    return _batch_executor
+
+
+def fetch_incidents_by_id(incident_ids):
+    """Rows for many incident IDs from combined WHERE Incident_ID IN (...) queries; returns (columns, {id: row})"""
+    incident_ids = sorted(incident_ids)
+    columns = []
+    rows_by_id = {}
+    for start in range(0, len(incident_ids), BATCH_LOOKUP_CHUNK_SIZE):
+        chunk = incident_ids[start:start + BATCH_LOOKUP_CHUNK_SIZE]
+        sql = f"SELECT {INCIDENT_COLUMNS} FROM Incidents WHERE Incident_ID IN ({', '.join('?' for _ in chunk)})"
+        with span('db.batch_lookup', ids=len(chunk)), get_connection() as conn:
+            # One row over the ID count, so a complete result never triggers fetch_limited's COUNT(*)
+            columns, rows, _ = fetch_limited(conn, sql, chunk, max_rows=len(chunk) + 1, timeout=SQL_QUERY_TIMEOUT)
+        id_column = columns.index('Incident_ID')
+        for row in rows:
+            rows_by_id[str(row[id_column]).upper()] = row
+    return columns, rows_by_id
+
+
+def prefetch(questions, routes):
+    """Do the retrieval shared by a batch up front: one incident lookup for every ID question, one encode call and
+    one msearch for every SOP question.
+
+    Returns (one prefetched dict per question for Multiagentsystem, stats). A failed step is logged and skipped;
+    the questions it covered then fetch their own data.
+    """
+    prefetched = [{} for _ in questions]
+    stats = {'incident_ids': 0, 'sop_questions': 0, 'encode_ms': None}
+
+    lookups = [index for index, route in enumerate(routes) if route and route['path'] == 'incident_lookup']
+    if lookups:
+        incident_ids = {incident_id for index in lookups for incident_id in routes[index]['params']}
+        stats['incident_ids'] = len(incident_ids)
+        try:
+            columns, rows_by_id = fetch_incidents_by_id(incident_ids)
+        except Exception as e:
+            print(f"Batched incident lookup failed: {str(e)}")
+        else:
+            for index in lookups:
+                rows = [rows_by_id[incident_id] for incident_id in routes[index]['params'] if incident_id in rows_by_id]
+                prefetched[index]['incident_records'] = (columns, rows, len(rows))
+
+    sop = [index for index, route in enumerate(routes) if route and route['path'] in ('sop', 'mixed')]
+    if sop:
+        sop_questions = [questions[index] for index in sop]
+        stats['sop_questions'] = len(sop)
+        try:
+            embeddings, encode_ms = encode_batch(sop_questions)
+        except Exception as e:
+            print(f"Batched embedding failed: {str(e)}")
+            return prefetched, stats
+        stats['encode_ms'] = round(encode_ms, 1)
+        for index, embedding in zip(sop, embeddings):
+            prefetched[index]['embedding'] = embedding
+        try:
+            hits = search_sop_chunks_batch(sop_questions, [embedding.tolist() for embedding in embeddings])
+        except Exception as e:
+            print(f"Batched SOP search failed: {str(e)}")
+        else:
+            for index, question_hits in zip(sop, hits):
+                if question_hits is not None:
+                    prefetched[index]['sop_hits'] = question_hits
+    return prefetched, stats
+
+
+def _answer(index, question, question_with_context, deadline, prefetched, on_budget):
+    start = time.perf_counter()
+    result = Multiagentsystem(question, question_with_context, deadline=deadline, prefetched=prefetched,
+                              on_budget=on_budget)
+    return {
+        'index': index,
+        'query': question,
+        'route': result['route'],
+        'response': result['response'],
+        'process_flow': result['process_flow'],
+        'usage': result['usage'],
+        'degraded': result['degraded'],
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def run_batch(questions, questions_with_context=None, deadline=None, on_item=None, is_cancelled=None,
+              on_budget=None):
+    """Answer many questions, sharing embedding, SOP retrieval and incident lookups between them.
+
+    Questions are answered on the shared batch pool, SQL-only ones first. on_item(item) is called on the calling
+    thread as each one finishes; a failed question produces an item with 'error' instead of 'response'.
+    is_cancelled() is checked before each question starts, and on_budget is passed on to Multiagentsystem for each
+    question. Returns a summary with the items in question order.
+    """
+    start = time.perf_counter()
+    questions_with_context = questions_with_context or questions
+    routes = [route_query(question) if FAST_PATH_ENABLED else None for question in questions]
+    with span('batch.prefetch', questions=len(questions)):
+        prefetched, stats = prefetch(questions, routes)
+
+    def answer(index):
+        if is_cancelled is not None and is_cancelled():
+            return {'index': index, 'query': questions[index], 'error': 'Batch was cancelled or passed its deadline'}
+        try:
+            return _answer(index, questions[index], questions_with_context[index], deadline, prefetched[index],
+                           on_budget)
+        except Exception as e:
+            return {'index': index, 'query': questions[index], 'error': str(e)}
+
+    needs_llm = [not (route and route['path'] in NO_LLM_PATHS) for route in routes]
+    order = sorted(range(len(questions)), key=lambda index: needs_llm[index])
+    executor = get_batch_executor()
+    futures = [executor.submit(answer, index) for index in order]
+    items = [None] * len(questions)
+    for future in as_completed(futures):
+        item = future.result()
+        items[item['index']] = item
+        if on_item is not None:
+            on_item(item)
+
+    return {
+        'count': len(items),
+        'answered': sum(1 for item in items if 'error' not in item),
+        'failed': sum(1 for item in items if 'error' in item),
+        'prefetch': stats,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+        'items': items,
+    }
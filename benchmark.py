@@ -0,0 +1,211 @@
+"""Offline load test: run app.py and Multiagentsystem against local stand-ins and report latency percentiles.
+
+The LLM, Elasticsearch, the embedding model and SQL Server are replaced by the deterministic fakes in
+benchmark_fakes.py (a scripted ReAct LLM, an in-memory kNN store, a hashing embedder and a seeded SQLite
+database), so runs are repeatable and need no network.
+
+Usage:
+    python benchmark.py [--requests 200] [--concurrency 8] [--llm-latency-ms 800] [--db-latency-ms 2]
+                        [--mix query=6,get-conversations=1,conversations=1,get-chat=2]
+                        [--json results.json] [--baseline previous.json --tolerance 0.2]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import benchmark_fakes
+import chat_writer
+import db_pool
+import embeddings
+import es_client
+
+DEFAULT_MIX = "query=6,get-conversations=1,conversations=1,get-chat=2"
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(value):
+    """'query=6,get-chat=2' -> {'query': 6.0, 'get-chat': 2.0}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ('query', 'get-conversations', 'conversations', 'get-chat'):
+            raise argparse.ArgumentTypeError(f"Unknown endpoint '{name.strip()}' in --mix")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def install_fakes(db_path, args):
+    """Point every external dependency at its local stand-in; must run before app.py is imported"""
+    embedder = benchmark_fakes.HashingEmbedder(latency_ms=args.embed_latency_ms)
+    embeddings.set_embedding_model(embedder)
+    es_client.set_es_client(benchmark_fakes.InMemoryKNNStore(
+        benchmark_fakes.make_sop_chunks(), embedder, latency_ms=args.es_latency_ms))
+    db_pool.set_pool(db_pool.ConnectionPool(
+        db_path, connect=lambda path: benchmark_fakes.SQLiteConnection(path, latency_ms=args.db_latency_ms)))
+
+    import Crewai_agents
+    llm = benchmark_fakes.ScriptedLLM(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms, seed=args.seed)
+    Crewai_agents.set_llm(llm)
+    return llm
+
+
+def build_workload(args, chat_ids):
+    """A reproducible list of (endpoint, method, path, json body) requests drawn from the mix"""
+    rng = random.Random(args.seed)
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    workload = []
+    for _ in range(args.warmup + args.requests):
+        name = rng.choices(names, weights=weights)[0]
+        chat_id = rng.choice(chat_ids)
+        if name == 'query':
+            body = {'query': benchmark_fakes.make_question(rng, args.incidents), 'chatId': chat_id}
+            workload.append((name, 'POST', '/query', body))
+        elif name == 'get-conversations':
+            workload.append((name, 'GET', '/get-conversations', None))
+        elif name == 'conversations':
+            workload.append((name, 'GET', '/conversations?limit=20', None))
+        else:
+            workload.append((name, 'GET', f'/get-chat/{chat_id}', None))
+    return workload
+
+
+def run_workload(app, workload, concurrency):
+    """Send every request through the WSGI app from `concurrency` threads; returns (samples, wall seconds)"""
+    local = threading.local()
+
+    def send(item):
+        name, method, path, body = item
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        return name, response.status_code, elapsed_ms
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(send, workload))
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, wall_seconds):
+    """Throughput plus count, error count and latency percentiles per endpoint and overall"""
+    report = {'wall_seconds': round(wall_seconds, 3),
+              'throughput_rps': round(len(samples) / wall_seconds, 2) if wall_seconds else None,
+              'endpoints': {}}
+    groups = {}
+    for name, status, elapsed_ms in samples:
+        groups.setdefault(name, []).append((status, elapsed_ms))
+    groups['all'] = [(status, elapsed_ms) for _, status, elapsed_ms in samples]
+
+    for name, entries in groups.items():
+        latencies = np.array([elapsed_ms for _, elapsed_ms in entries])
+        statuses = {}
+        for status, _ in entries:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        stats = {
+            'count': len(entries),
+            'errors': sum(1 for status, _ in entries if status >= 400),
+            'statuses': statuses,
+            'mean_ms': round(float(latencies.mean()), 2),
+            'max_ms': round(float(latencies.max()), 2),
+        }
+        for pct, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+            stats[f'p{pct}_ms'] = round(float(value), 2)
+        report['endpoints'][name] = stats
+    return report
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Endpoints whose p95 grew by more than tolerance (a fraction) over the baseline run"""
+    regressions = []
+    for name, stats in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if previous and stats['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {stats['p95_ms']} ms vs baseline {previous['p95_ms']} ms")
+    return regressions
+
+
+def print_report(report):
+    print(f"\n{report['requests']} requests at concurrency {report['concurrency']} in {report['wall_seconds']}s "
+          f"-> {report['throughput_rps']} req/s ({report['llm_calls']} LLM calls)\n")
+    header = f"{'endpoint':<20}{'count':>7}{'errors':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}"
+    print(header)
+    print('-' * len(header))
+    for name, stats in report['endpoints'].items():
+        print(f"{name:<20}{stats['count']:>7}{stats['errors']:>8}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+    print("\nLatencies in milliseconds.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test against local stand-ins for LLM, ES and SQL Server")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests sent first")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help="Relative weights per endpoint: query, get-conversations, conversations, get-chat")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--es-latency-ms", type=float, default=5)
+    parser.add_argument("--db-latency-ms", type=float, default=2)
+    parser.add_argument("--embed-latency-ms", type=float, default=5)
+    parser.add_argument("--incidents", type=int, default=2000, help="Synthetic Incidents rows")
+    parser.add_argument("--chats", type=int, default=200, help="Synthetic chats in IncidentChatHistory")
+    parser.add_argument("--turns", type=int, default=6, help="Turns per synthetic chat")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Report from an earlier run; exit 1 if any endpoint's p95 regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 growth over the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's and crewai's console output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='incident-bench-') as tmp:
+        db_path = os.path.join(tmp, 'bench.sqlite')
+        chat_ids = benchmark_fakes.seed_database(db_path, args.incidents, args.chats, args.turns, args.seed)
+        llm = install_fakes(db_path, args)
+        from app import app
+
+        workload = build_workload(args, chat_ids)
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+            run_workload(app, workload[:args.warmup], args.concurrency)
+            llm_calls_before = llm.calls
+            samples, wall_seconds = run_workload(app, workload[args.warmup:], args.concurrency)
+
+        report = summarize(samples, wall_seconds)
+        report.update(requests=len(samples), concurrency=args.concurrency, llm_calls=llm.calls - llm_calls_before,
+                      config={key: value for key, value in vars(args).items()
+                              if key not in ('json', 'baseline', 'verbose')})
+        chat_writer.shutdown_chat_writer()
+        db_pool.get_pool().close_all()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions over baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo p95 regressions over baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,441 @@
+"""Deterministic local stand-ins for Azure OpenAI, Elasticsearch and SQL Server, used by benchmark.py.
+
+Nothing here is imported by the application itself; benchmark.py installs these through the
+set_llm / set_es_client / set_embedding_model / set_pool seams before importing app.py.
+"""
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from router import INCIDENT_ID_PATTERN, SEVERITY_PATTERN
+
+try:
+    from crewai import BaseLLM as _LLMBase
+except ImportError:
+    from crewai import LLM as _LLMBase
+
+DATA_AGENT_ROLE = "Incident Data Management Assistant"
+SOP_AGENT_ROLE = "Incident Management SOP Assistant"
+MANAGER_ROLE = "Multi-Agent System Manager"
+DELEGATE_TOOL_PATTERN = re.compile(r'Tool Name:\s*(Delegate work to co-?worker)', re.IGNORECASE)
+QUESTION_PATTERN = re.compile(r'user query:\s*\n(.+?)(?:\n|$)')
+CURRENT_TASK_PATTERN = re.compile(r'Current Task:\s*(.+?)(?:\n|$)')
+FINDINGS_PATTERN = re.compile(r'Incident data findings:\n(.*?)\n\nSOP findings:\n(.*)', re.DOTALL)
+DATA_WORDS_PATTERN = re.compile(r'\b(?:status|handling|assigned|engineer|open|breached|mttr|overview)\b', re.IGNORECASE)
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+SERVICES = ['Payments', 'Authentication', 'Checkout', 'Search', 'Notifications', 'Billing', 'Inventory', 'Shipping']
+TEAMS = ['Platform', 'Payments SRE', 'Identity', 'Commerce', 'Messaging', 'Data']
+ENGINEERS = ['Charles Taylor', 'Priya Sharma', 'Maria Garcia', 'James Wilson', 'Wei Chen', 'Aisha Khan']
+SEVERITIES = ['P1', 'P2', 'P3', 'P4']
+STATUSES = ['Open', 'In Progress', 'Resolved', 'Closed']
+ISSUES = [
+    'Elevated error rate on {service} API',
+    '{service} latency above SLO, p99 over 2s',
+    'Database connection exhaustion in {service}',
+    'Failed deployment rolled back for {service}',
+    'Certificate expiry caused {service} outage',
+]
+SOP_TOPICS = [
+    'Escalation for {severity} incidents: page the on-call engineer immediately, notify the escalation contact within '
+    '{minutes} minutes and open a bridge call if the incident is not mitigated within {double} minutes.',
+    'SLA for {severity} incidents: acknowledge within {minutes} minutes and restore service within {hours} hours. '
+    'Breaches are reported to the owning team lead and reviewed in the weekly incident review.',
+    'Handling a {severity} outage: confirm impact, assign an incident commander, post status updates every '
+    '{minutes} minutes, and record a timeline for the post-incident review.',
+    'Post-incident review for {severity} incidents must be completed within {days} business days and list root cause, '
+    'contributing factors and follow-up actions with owners.',
+]
+
+QUESTION_TEMPLATES = [
+    "What is the status of incident {incident_id}?",
+    "Who is handling incident {incident_id}?",
+    "Show all open {severity} incidents",
+    "Which incidents have breached SLA?",
+    "What is the escalation procedure for {severity} incidents?",
+    "How should we handle a {severity} outage in {service}?",
+    "Who is handling {incident_id} and what is the escalation procedure for it?",
+    "Give me an overview of the {service} incidents",
+]
+
+
+class ScriptedLLM(_LLMBase):
+    """Stand-in for the Azure OpenAI model that answers in the ReAct format crewai parses, after a configurable delay.
+
+    The manager delegates to the data or SOP agent, the data agent calls get_sql_data_tool, the SOP agent calls
+    get_chunks_tool, and every agent turns the first observation it sees into its final answer. Fan-out synthesis
+    calls get both findings back, concatenated.
+    """
+
+    def __init__(self, latency_ms=800, jitter_ms=200, seed=0):
+        super().__init__(model="scripted/benchmark")
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def supports_function_calling(self):
+        return False
+
+    def supports_stop_words(self):
+        return True
+
+    def get_context_window_size(self):
+        return 128000
+
+    def call(self, messages, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+            delay_ms = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms))
+        time.sleep(delay_ms / 1000)
+        if isinstance(messages, str):
+            messages = [{'role': 'user', 'content': messages}]
+        return self.respond(messages)
+
+    def respond(self, messages):
+        prompt = messages[0].get('content', '') if messages else ''
+        transcript = '\n'.join(message.get('content') or '' for message in messages)
+        findings = FINDINGS_PATTERN.search(transcript)
+        if findings:
+            data, sop = (text.strip()[:400] for text in findings.groups())
+            return f"Incident records:\n{data}\n\nProcedure:\n{sop}"
+        # Observations only ever appear in the turns crewai appends after the system and task prompts
+        for message in reversed(messages[2:]):
+            content = message.get('content') or ''
+            if 'Observation:' in content:
+                observation = content.rsplit('Observation:', 1)[1].strip()
+                return f"Thought: I now know the final answer\nFinal Answer: {observation[:800]}"
+
+        match = QUESTION_PATTERN.search(transcript) or CURRENT_TASK_PATTERN.search(transcript)
+        question = match.group(1).strip() if match else transcript.strip().splitlines()[-1]
+
+        if MANAGER_ROLE in prompt:
+            delegate = DELEGATE_TOOL_PATTERN.search(transcript)
+            coworker = (DATA_AGENT_ROLE if INCIDENT_ID_PATTERN.search(question) or DATA_WORDS_PATTERN.search(question)
+                        else SOP_AGENT_ROLE)
+            return self._action(
+                delegate.group(1) if delegate else "Delegate work to coworker",
+                {"task": f"user query:\n{question}", "context": question, "coworker": coworker},
+            )
+        if DATA_AGENT_ROLE in prompt:
+            return self._action("get_sql_data_tool", {"query": self._sql_for(question)})
+        if SOP_AGENT_ROLE in prompt:
+            return self._action("get_chunks_tool", {"query": question})
+        return f"Thought: I now know the final answer\nFinal Answer: {question}"
+
+    @staticmethod
+    def _action(tool_name, tool_input):
+        return f"Thought: I need to use a tool\nAction: {tool_name}\nAction Input: {json.dumps(tool_input)}"
+
+    @staticmethod
+    def _sql_for(question):
+        incident_ids = sorted({incident_id.upper() for incident_id in INCIDENT_ID_PATTERN.findall(question)})
+        if incident_ids:
+            return "SELECT * FROM Incidents WHERE Incident_ID IN ({})".format(
+                ", ".join(f"'{incident_id}'" for incident_id in incident_ids))
+        severity = SEVERITY_PATTERN.search(question)
+        if severity:
+            return f"SELECT * FROM Incidents WHERE Severity = '{severity.group(1).upper()}' ORDER BY Start_Time DESC"
+        return "SELECT * FROM Incidents WHERE Status = 'Open' ORDER BY Start_Time DESC"
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-words feature hashing in place of the SentenceTransformer; similar wording gives
+    similar vectors, so the semantic cache and kNN search behave plausibly"""
+
+    def __init__(self, dimension=384, latency_ms=0):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            digest = zlib.crc32(token.encode('utf-8'))
+            vector[digest % self.dimension] += 1.0 if digest & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, batch_size=None, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if isinstance(texts, str):
+            return self._embed(texts)
+        return np.stack([self._embed(text) for text in texts]) if texts else np.zeros((0, self.dimension))
+
+
+class _Namespace:
+    def __init__(self, **methods):
+        self.__dict__.update(methods)
+
+
+class InMemoryKNNStore:
+    """The slice of the Elasticsearch client the app uses (knn search and msearch, index stats, health), over a
+    NumPy matrix"""
+
+    def __init__(self, chunks, embedder, latency_ms=0):
+        self.chunks = chunks
+        self.latency_ms = latency_ms
+        self._matrix = embedder.encode([chunk['content'] for chunk in chunks])
+        self.searches = 0
+        self.cluster = _Namespace(health=lambda **kwargs: {'status': 'green'})
+        self.indices = _Namespace(
+            stats=self._index_stats,
+            exists=lambda **kwargs: True,
+            refresh=lambda **kwargs: None,
+        )
+
+    def _index_stats(self, **kwargs):
+        docs = {'count': len(self.chunks), 'deleted': 0}
+        return {'_all': {'primaries': {'docs': docs, 'indexing': {'index_total': len(self.chunks)}}}}
+
+    def options(self, **kwargs):
+        return self
+
+    def search(self, index=None, body=None, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._knn(body or kwargs)
+
+    def msearch(self, body=None, **kwargs):
+        """Header/body pairs as in the Elasticsearch multi-search API, answered in one round-trip"""
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return {'responses': [self._knn(search_body) for search_body in body[1::2]]}
+
+    def _knn(self, body):
+        self.searches += 1
+        knn = body['knn']
+        query = np.asarray(knn['query_vector'], dtype=np.float32)
+        scores = self._matrix @ query
+        top = np.argsort(-scores)[:knn.get('k', 5)]
+        return {'hits': {'hits': [
+            {'_id': self.chunks[idx]['chunk_id'], '_score': float(scores[idx]), '_source': dict(self.chunks[idx])}
+            for idx in top
+        ]}}
+
+    def close(self):
+        pass
+
+
+_TOP_PARAM_PATTERN = re.compile(r'\bSELECT\s+(DISTINCT\s+)?TOP\s*\(\s*\?\s*\)', re.IGNORECASE)
+_TOP_LITERAL_PATTERN = re.compile(r'\bSELECT\s+(DISTINCT\s+)?TOP\s*\(?\s*(\d+)\s*\)?', re.IGNORECASE)
+_SET_ROWCOUNT_PATTERN = re.compile(r'^\s*SET\s+ROWCOUNT\s+(\d+)\s*;?\s*$', re.IGNORECASE)
+_MERGE_PATTERN = re.compile(
+    r'^\s*MERGE\s+(?:dbo\.)?(\w+)\s+WITH\s*\(\s*HOLDLOCK\s*\)\s+AS\s+target\s+'
+    r'USING\s*\(\s*SELECT\s+\?\s+AS\s+(\w+)\s*\)\s+AS\s+source\s+ON\s+.+?\s+'
+    r'WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+(.+?)\s+'
+    r'WHEN\s+NOT\s+MATCHED\s+THEN\s+INSERT\s*\((.+?)\)\s*VALUES\s*\((.+?)\)\s*;?\s*$',
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def translate_tsql(sql, params=()):
+    """Rewrite the T-SQL this app issues into SQLite; returns (sql, params), or (None, rowcount) for SET ROWCOUNT"""
+    params = list(params)
+    rowcount = _SET_ROWCOUNT_PATTERN.match(sql)
+    if rowcount:
+        return None, int(rowcount.group(1))
+
+    merge = _MERGE_PATTERN.match(sql)
+    if merge:
+        table, key, set_clause, insert_columns, insert_values = merge.groups()
+        # Placeholders arrive as: source key, UPDATE SET values, INSERT values
+        set_params = set_clause.count('?')
+        update_params, insert_params = params[1:1 + set_params], params[1 + set_params:]
+        set_clause = re.sub(r'\btarget\.', '', set_clause)
+        return (f"INSERT INTO {table} ({insert_columns}) VALUES ({insert_values}) "
+                f"ON CONFLICT({key}) DO UPDATE SET {set_clause}", insert_params + update_params)
+
+    top = _TOP_PARAM_PATTERN.search(sql)
+    if top:
+        # TOP (?) is the statement's first placeholder; SQLite wants it last, as LIMIT ?
+        limit = params.pop(sql[:top.start()].count('?'))
+        sql = _TOP_PARAM_PATTERN.sub(lambda m: 'SELECT ' + (m.group(1) or ''), sql, count=1)
+        sql = sql.rstrip().rstrip(';') + ' LIMIT ?'
+        params.append(limit)
+    else:
+        top = _TOP_LITERAL_PATTERN.search(sql)
+        if top:
+            sql = _TOP_LITERAL_PATTERN.sub(lambda m: 'SELECT ' + (m.group(1) or ''), sql, count=1)
+            sql = sql.rstrip().rstrip(';') + f' LIMIT {top.group(2)}'
+
+    sql = re.sub(r'\bGETDATE\(\)', 'CURRENT_TIMESTAMP', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bISNULL\(', 'IFNULL(', sql, flags=re.IGNORECASE)
+    return sql, params
+
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+for _type_name in ('timestamp', 'datetime'):
+    sqlite3.register_converter(_type_name, lambda value: datetime.fromisoformat(value.decode('utf-8')))
+
+
+class SQLiteCursor:
+    """pyodbc-style cursor over SQLite that accepts the app's T-SQL"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+        self._remaining = None
+        self.description = None
+        self.fast_executemany = False
+
+    def _limit(self, rows):
+        if self._remaining is None:
+            return rows
+        rows = rows[:self._remaining]
+        self._remaining -= len(rows)
+        return rows
+
+    def execute(self, sql, params=()):
+        sql, params = translate_tsql(sql, params)
+        if sql is None:
+            self.connection.rowcount_limit = params or None
+            self.description = None
+            return self
+        if self.connection.latency_ms:
+            time.sleep(self.connection.latency_ms / 1000)
+        self._cursor.execute(sql, params)
+        self.description = self._cursor.description
+        self._remaining = self.connection.rowcount_limit
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        if not seq_of_params:
+            return self
+        translated = [translate_tsql(sql, params) for params in seq_of_params]
+        if self.connection.latency_ms:
+            time.sleep(self.connection.latency_ms / 1000)
+        self._cursor.executemany(translated[0][0], [params for _, params in translated])
+        self.description = None
+        return self
+
+    def fetchone(self):
+        rows = self._limit([row for row in [self._cursor.fetchone()] if row is not None])
+        return rows[0] if rows else None
+
+    def fetchmany(self, size=1):
+        return self._limit(self._cursor.fetchmany(size))
+
+    def fetchall(self):
+        return self._limit(self._cursor.fetchall())
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """pyodbc-style connection to a SQLite file, with an optional per-statement delay standing in for network time"""
+
+    def __init__(self, path, latency_ms=0):
+        self.raw = sqlite3.connect(path, timeout=30, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        self.raw.execute('PRAGMA journal_mode=WAL')
+        self.latency_ms = latency_ms
+        self.rowcount_limit = None
+        self.timeout = 0
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+
+SCHEMA = '''
+CREATE TABLE Incidents (
+    Incident_ID TEXT PRIMARY KEY, Service_Name TEXT, Severity TEXT, Status TEXT, Issue_Description TEXT,
+    Owner_Team TEXT, On_Call_Engineer TEXT, Escalation_Contact TEXT, Start_Time TIMESTAMP, MTTR_Minutes INTEGER,
+    SLA_Breached INTEGER
+);
+CREATE TABLE IncidentChatHistory (ChatID TEXT, Question TEXT, response TEXT, DateTime TIMESTAMP);
+CREATE INDEX IX_IncidentChatHistory_ChatID_DateTime ON IncidentChatHistory (ChatID, DateTime);
+CREATE TABLE IncidentChats (ChatID TEXT PRIMARY KEY, Title TEXT, LastActivity TIMESTAMP, MessageCount INTEGER);
+CREATE INDEX IX_IncidentChats_LastActivity_ChatID ON IncidentChats (LastActivity DESC, ChatID DESC);
+CREATE TABLE IncidentChatSummary (
+    ChatID TEXT PRIMARY KEY, Summary TEXT, SummarizedThrough TIMESTAMP, SummarizedTurns INTEGER, UpdatedAt TIMESTAMP
+);
+'''
+
+
+def incident_id(number):
+    return f"INC{number:06d}"
+
+
+def seed_database(path, incidents=2000, chats=200, turns_per_chat=6, seed=0):
+    """Create the app's tables in a SQLite file and fill them with a synthetic, reproducible dataset;
+    returns the seeded chat IDs"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.executescript(SCHEMA)
+
+    incident_rows = []
+    for number in range(1, incidents + 1):
+        service = rng.choice(SERVICES)
+        severity = rng.choices(SEVERITIES, weights=[1, 3, 6, 10])[0]
+        status = rng.choices(STATUSES, weights=[2, 2, 5, 8])[0]
+        closed = status in ('Resolved', 'Closed')
+        incident_rows.append((
+            incident_id(number), service, severity, status, rng.choice(ISSUES).format(service=service),
+            rng.choice(TEAMS), rng.choice(ENGINEERS), rng.choice(ENGINEERS),
+            now - timedelta(minutes=rng.randint(0, 60 * 24 * 60)),
+            rng.randint(5, 600) if closed else None, int(rng.random() < 0.2),
+        ))
+    conn.executemany('INSERT INTO Incidents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', incident_rows)
+
+    chat_ids = []
+    for chat in range(chats):
+        chat_id = f"bench-{chat:05d}"
+        chat_ids.append(chat_id)
+        started = now - timedelta(minutes=rng.randint(10, 60 * 24 * 30))
+        questions = [make_question(rng, incidents) for _ in range(turns_per_chat)]
+        for turn, question in enumerate(questions):
+            conn.execute('INSERT INTO IncidentChatHistory VALUES (?, ?, ?, ?)', (
+                chat_id, question, f"Synthetic answer {turn} for: {question} " + "Details follow. " * 20,
+                started + timedelta(minutes=turn),
+            ))
+        conn.execute('INSERT INTO IncidentChats VALUES (?, ?, ?, ?)', (
+            chat_id, questions[0][:200], started + timedelta(minutes=turns_per_chat - 1), turns_per_chat,
+        ))
+    conn.commit()
+    conn.close()
+    return chat_ids
+
+
+def make_question(rng, incidents):
+    return rng.choice(QUESTION_TEMPLATES).format(
+        incident_id=incident_id(rng.randint(1, incidents)),
+        severity=rng.choice(SEVERITIES),
+        service=rng.choice(SERVICES),
+    )
+
+
+def make_sop_chunks():
+    """Synthetic SOP chunks shaped like incident_sop documents"""
+    chunks = []
+    for topic_idx, template in enumerate(SOP_TOPICS):
+        for level, severity in enumerate(SEVERITIES, 1):
+            chunks.append({
+                'content': template.format(severity=severity, minutes=5 * level, double=10 * level,
+                                           hours=2 * level, days=level + 2),
+                'chunk_id': f"sop-{topic_idx}.md#{level}",
+                'source': f"sop-{topic_idx}.md",
+            })
+    return chunks
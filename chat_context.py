@@ -0,0 +1,159 @@
+import re
+from datetime import datetime
+
+from db_pool import get_connection
+from chat_writer import sync_chat_history
+from tracing import span
+
+# Prompt budget for the conversation context prepended to each query
+CONTEXT_TOKEN_BUDGET = 1500
+CONTEXT_RECENT_TURNS = 5
+SUMMARY_TOKEN_BUDGET = 300
+# Past answers (often long SQL result dumps) are cut to this many tokens in the prompt
+TURN_RESPONSE_TOKEN_CAP = 200
+SUMMARY_QUESTION_TOKENS = 40
+SUMMARY_RESPONSE_TOKENS = 60
+TOKENIZER_ENCODING = "o200k_base"
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+except Exception:
+    _encoding = None
+
+_FALLBACK_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s")
+
+
+def count_tokens(text):
+    """Token count with the local tiktoken encoder, or a word/punctuation estimate when it is unavailable"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(_FALLBACK_TOKEN_PATTERN.findall(text))
+
+
+def truncate_tokens(text, max_tokens):
+    """Cut text to at most max_tokens tokens, marking the cut with an ellipsis"""
+    if not text or count_tokens(text) <= max_tokens:
+        return text or ""
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens]).rstrip() + " ..."
+    matches = list(_FALLBACK_TOKEN_PATTERN.finditer(text))
+    return text[:matches[max_tokens - 1].end()].rstrip() + " ..." if max_tokens > 0 else " ..."
+
+
+def summarize_turn(question, response):
+    """One compact line per older turn: the question plus the first sentence of the answer"""
+    first_line = (response or "").strip().split("\n", 1)[0]
+    first_sentence = _SENTENCE_END_PATTERN.split(first_line, 1)[0]
+    return (f"- Q: {truncate_tokens(' '.join((question or '').split()), SUMMARY_QUESTION_TOKENS)} "
+            f"A: {truncate_tokens(first_sentence, SUMMARY_RESPONSE_TOKENS)}")
+
+
+def trim_summary(summary, max_tokens=SUMMARY_TOKEN_BUDGET):
+    """Drop the oldest summary lines until the summary fits max_tokens"""
+    lines = [line for line in summary.split("\n") if line]
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return truncate_tokens("\n".join(lines), max_tokens)
+
+
+def get_recent_turns(cursor, chat_id, limit=CONTEXT_RECENT_TURNS):
+    """The newest `limit` turns of a chat, returned oldest first"""
+    cursor.execute('''
+        SELECT TOP (?) Question, response, DateTime FROM IncidentChatHistory
+        WHERE ChatID = ?
+        ORDER BY DateTime DESC
+    ''', (limit, chat_id))
+    rows = cursor.fetchall()
+    return [{'question': row[0], 'response': row[1], 'dateTime': row[2]} for row in reversed(rows)]
+
+
+def update_rolling_summary(cursor, chat_id, oldest_recent):
+    """Fold turns that dropped out of the recent window into the stored summary; returns the summary text"""
+    cursor.execute('SELECT Summary, SummarizedThrough FROM IncidentChatSummary WHERE ChatID = ?', (chat_id,))
+    row = cursor.fetchone()
+    summary, summarized_through = (row[0] or "", row[1]) if row else ("", None)
+
+    # Only turns newer than the last summarized one and older than the recent window need folding in
+    if summarized_through is None:
+        cursor.execute('''
+            SELECT Question, response, DateTime FROM IncidentChatHistory
+            WHERE ChatID = ? AND DateTime < ?
+            ORDER BY DateTime ASC
+        ''', (chat_id, oldest_recent))
+    else:
+        cursor.execute('''
+            SELECT Question, response, DateTime FROM IncidentChatHistory
+            WHERE ChatID = ? AND DateTime < ? AND DateTime > ?
+            ORDER BY DateTime ASC
+        ''', (chat_id, oldest_recent, summarized_through))
+    new_rows = cursor.fetchall()
+    if not new_rows:
+        return summary
+
+    lines = [summary] if summary else []
+    lines.extend(summarize_turn(question, response) for question, response, _ in new_rows)
+    summary = trim_summary("\n".join(lines))
+    last_summarized = new_rows[-1][2]
+
+    cursor.execute('''
+        MERGE IncidentChatSummary WITH (HOLDLOCK) AS target
+        USING (SELECT ? AS ChatID) AS source ON target.ChatID = source.ChatID
+        WHEN MATCHED THEN
+            UPDATE SET Summary = ?, SummarizedThrough = ?, SummarizedTurns = target.SummarizedTurns + ?, UpdatedAt = ?
+        WHEN NOT MATCHED THEN
+            INSERT (ChatID, Summary, SummarizedThrough, SummarizedTurns, UpdatedAt) VALUES (?, ?, ?, ?, ?);
+    ''', (chat_id, summary, last_summarized, len(new_rows), datetime.now(),
+          chat_id, summary, last_summarized, len(new_rows), datetime.now()))
+    return summary
+
+
+def fit_to_budget(summary, turns, budget=CONTEXT_TOKEN_BUDGET):
+    """Assemble the context string: summary first, then as many of the newest turns as the budget allows"""
+    sections = []
+    used = 0
+    if summary:
+        summary = trim_summary(summary, min(SUMMARY_TOKEN_BUDGET, budget))
+        sections.append(f"conversation summary:\n{summary}\n")
+        used += count_tokens(sections[0])
+
+    turn_texts = []
+    for turn in reversed(turns):
+        text = (f"\nQuestion: {turn['question']}\n"
+                f"Response: {truncate_tokens(turn['response'], TURN_RESPONSE_TOKEN_CAP)}\n")
+        tokens = count_tokens(text)
+        if used + tokens > budget:
+            break
+        turn_texts.append(text)
+        used += tokens
+
+    if turn_texts:
+        sections.append("chat history:\n" + "".join(reversed(turn_texts)))
+    return "\n".join(sections)
+
+
+def build_chat_context(chat_id, budget=CONTEXT_TOKEN_BUDGET, recent_turns=CONTEXT_RECENT_TURNS):
+    """Token-budgeted context for a chat: rolling summary of older turns plus the most recent turns"""
+    try:
+        sync_chat_history(chat_id)
+        with span('db.chat_context'), get_connection() as conn:
+            cursor = conn.cursor()
+            turns = get_recent_turns(cursor, chat_id, recent_turns)
+            summary = ""
+            # Older turns can only exist once the recent window is full
+            if len(turns) >= recent_turns:
+                try:
+                    summary = update_rolling_summary(cursor, chat_id, turns[0]['dateTime'])
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Chat summary unavailable: {str(e)}")
+            cursor.close()
+    except Exception as e:
+        print(f"Database error: {str(e)}")
+        return ""
+
+    return fit_to_budget(summary, turns, budget)
@@ -0,0 +1,253 @@
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from db_pool import get_connection
+from tracing import span
+
+# Write-behind persistence of answered questions: /query returns before its IncidentChatHistory row is committed
+CHAT_WRITE_BEHIND_ENABLED = True
+CHAT_WRITE_BATCH_SIZE = 50
+CHAT_WRITE_FLUSH_INTERVAL = 0.5
+CHAT_WRITE_MAX_PENDING = 5000
+CHAT_WRITE_MAX_RETRIES = 3
+CHAT_WRITE_RETRY_BACKOFF = 0.5
+# How long a reader waits for a chat's pending turns to be committed before reading anyway
+CHAT_WRITE_SYNC_TIMEOUT = 5
+# pyodbc sends the whole batch as one parameter array; needs ODBC Driver 17+ and pyodbc 4.0.19+
+CHAT_WRITE_FAST_EXECUTEMANY = True
+CHAT_TITLE_MAX_LENGTH = 200
+
+INSERT_HISTORY_SQL = '''
+    INSERT INTO IncidentChatHistory (ChatID, Question, response, DateTime)
+    VALUES (?, ?, ?, ?)
+'''
+# Keep the one-row-per-chat summary used by /conversations in step with the history table
+MERGE_CHAT_SQL = '''
+    MERGE IncidentChats WITH (HOLDLOCK) AS target
+    USING (SELECT ? AS ChatID) AS source ON target.ChatID = source.ChatID
+    WHEN MATCHED THEN
+        UPDATE SET LastActivity = ?, MessageCount = target.MessageCount + ?
+    WHEN NOT MATCHED THEN
+        INSERT (ChatID, Title, LastActivity, MessageCount) VALUES (?, ?, ?, ?);
+'''
+
+
+def write_turns(conn, turns):
+    """Insert a batch of (seq, chat_id, question, response, timestamp) turns and update IncidentChats in one
+    transaction; the caller commits"""
+    chats = {}
+    for _, chat_id, question, _, timestamp in turns:
+        first_question, _, count = chats.get(chat_id, (question, timestamp, 0))
+        chats[chat_id] = (first_question, timestamp, count + 1)
+
+    cursor = conn.cursor()
+    try:
+        cursor.fast_executemany = CHAT_WRITE_FAST_EXECUTEMANY
+        cursor.executemany(INSERT_HISTORY_SQL, [turn[1:] for turn in turns])
+        # One MERGE per chat rather than per turn, so a chat with several queued turns takes its row lock once
+        cursor.executemany(MERGE_CHAT_SQL, [
+            (chat_id, last_activity, count, chat_id, question[:CHAT_TITLE_MAX_LENGTH], last_activity, count)
+            for chat_id, (question, last_activity, count) in chats.items()
+        ])
+    finally:
+        cursor.close()
+
+
+class ChatHistoryWriter:
+    """Queues chat turns and writes them in batches from a background thread.
+
+    A batch is flushed once batch_size turns are waiting or flush_interval seconds after the first one arrived.
+    Failed batches are retried with backoff up to max_retries times and then written one turn at a time, so only the
+    turns that still fail are dropped (and counted and logged). Readers call
+    sync(chat_id) first so a chat's own turns are committed before it is read back.
+    """
+
+    def __init__(self, batch_size=CHAT_WRITE_BATCH_SIZE, flush_interval=CHAT_WRITE_FLUSH_INTERVAL,
+                 max_pending=CHAT_WRITE_MAX_PENDING, max_retries=CHAT_WRITE_MAX_RETRIES,
+                 retry_backoff=CHAT_WRITE_RETRY_BACKOFF):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._pending = deque()
+        self._seq = itertools.count(1)
+        # Batches are written in queue order, so every turn up to _completed has been committed or dropped
+        self._completed = 0
+        self._in_flight = []
+        self._flush_requested = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'retries': 0,
+            'dropped': 0,
+            'sync_waits': 0,
+            'sync_timeouts': 0,
+            'last_batch_ms': None,
+            'last_error': None,
+        }
+        self._thread = threading.Thread(target=self._run, name='chat-writer', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, chat_id, question, response, timestamp=None):
+        """Queue one turn; returns False when the queue is full or shutting down, so the caller writes it itself"""
+        with self._cond:
+            if self._closed or len(self._pending) >= self.max_pending:
+                return False
+            self._pending.append((next(self._seq), chat_id, question, response, timestamp or datetime.now()))
+            self._stats['enqueued'] += 1
+            if len(self._pending) >= self.batch_size or len(self._pending) == 1:
+                self._cond.notify_all()
+        return True
+
+    def _last_pending_seq(self, chat_id=None):
+        turns = itertools.chain(self._in_flight, self._pending)
+        return max((turn[0] for turn in turns if chat_id is None or turn[1] == chat_id), default=0)
+
+    def sync(self, chat_id=None, timeout=CHAT_WRITE_SYNC_TIMEOUT):
+        """Flush now and wait until chat_id's queued turns (or every queued turn) are committed or dropped.
+
+        Returns True when nothing for the chat is left pending.
+        """
+        with self._cond:
+            target = self._last_pending_seq(chat_id)
+            if target <= self._completed:
+                return True
+            self._stats['sync_waits'] += 1
+            self._flush_requested = True
+            self._cond.notify_all()
+            done = self._cond.wait_for(lambda: self._completed >= target, timeout)
+            if not done:
+                self._stats['sync_timeouts'] += 1
+            return done
+
+    def _next_batch(self):
+        """Block until a batch is due; returns [] once closed and drained"""
+        with self._cond:
+            while True:
+                if self._pending and (self._closed or self._flush_requested
+                                      or len(self._pending) >= self.batch_size):
+                    break
+                if not self._pending:
+                    if self._closed:
+                        return []
+                    self._flush_requested = False
+                    self._cond.wait()
+                    continue
+                # Wait out the rest of the interval measured from the oldest queued turn
+                oldest = self._pending[0][4]
+                remaining = self.flush_interval - (datetime.now() - oldest).total_seconds()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(self.batch_size, len(self._pending))
+            self._in_flight = [self._pending.popleft() for _ in range(count)]
+            return list(self._in_flight)
+
+    def _write(self, batch):
+        """Write one batch, retrying transient failures and then falling back to single turns; returns how many
+        turns were committed"""
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                with span('db.save_chat_batch', turns=len(batch)), get_connection() as conn:
+                    write_turns(conn, batch)
+                    conn.commit()
+                with self._cond:
+                    self._stats['last_batch_ms'] = round((time.perf_counter() - start) * 1000, 1)
+                    self._stats['last_error'] = None
+                return len(batch)
+            except Exception as e:
+                with self._cond:
+                    self._stats['last_error'] = str(e)
+                    if attempt < self.max_retries:
+                        self._stats['retries'] += 1
+                if attempt < self.max_retries:
+                    print(f"Chat history batch failed, retrying: {str(e)}")
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+        if len(batch) == 1:
+            print(f"Database error: dropped chat history row for chat {batch[0][1]} after {self.max_retries} retries")
+            return 0
+        # One bad row (e.g. a value the column rejects) fails the whole batch; isolate it rather than lose the rest
+        print(f"Chat history batch of {len(batch)} failed after {self.max_retries} retries, writing rows one by one")
+        written = 0
+        for turn in batch:
+            try:
+                with span('db.save_chat_turn'), get_connection() as conn:
+                    write_turns(conn, [turn])
+                    conn.commit()
+                written += 1
+            except Exception as e:
+                with self._cond:
+                    self._stats['last_error'] = str(e)
+                print(f"Database error: dropped chat history row for chat {turn[1]}: {str(e)}")
+        return written
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            written = self._write(batch)
+            with self._cond:
+                self._stats['batches'] += 1
+                self._stats['written'] += written
+                self._stats['dropped'] += len(batch) - written
+                self._completed = batch[-1][0]
+                self._in_flight = []
+                self._cond.notify_all()
+
+    def shutdown(self, timeout=30):
+        """Stop accepting turns and wait up to timeout seconds for the queue to drain"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        with self._cond:
+            left = len(self._pending) + len(self._in_flight)
+        if left:
+            print(f"Chat history writer stopped with {left} rows unwritten")
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending) + len(self._in_flight)
+        stats['enabled'] = CHAT_WRITE_BEHIND_ENABLED
+        stats['batch_size'] = self.batch_size
+        stats['flush_interval'] = self.flush_interval
+        return stats
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_chat_writer():
+    """Return the process-wide chat history writer, starting its thread on first use"""
+    global _writer
+    if _writer is not None:
+        return _writer
+
+    with _writer_lock:
+        if _writer is None:
+            _writer = ChatHistoryWriter()
+    return _writer
+
+
+def sync_chat_history(chat_id=None):
+    """Make queued turns for chat_id (or all chats) visible to readers; a no-op when nothing was queued"""
+    if _writer is not None:
+        _writer.sync(chat_id)
+
+
+def shutdown_chat_writer(timeout=30):
+    """Drain the process-wide chat history writer if it was ever started"""
+    if _writer is not None:
+        _writer.shutdown(timeout)
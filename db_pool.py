@@ -0,0 +1,284 @@
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pyodbc
+
+from tracing import span
+
+DB_CONNECTION_STRING = 'Driver={ODBC Driver 17 for SQL Server};Server=<your_server>;Database=<your_database>;Trusted_Connection=yes;'
+
+# Pool settings shared by app.py and the agent tools
+DB_POOL_MAX_SIZE = 10
+DB_POOL_CHECKOUT_TIMEOUT = 5
+DB_POOL_MAX_LIFETIME = 1800
+DB_POOL_VALIDATE_AFTER_IDLE = 30
+
+# SQLSTATE class of errors where the connection itself failed, as opposed to the statement (HYT00 is a timeout)
+DB_CONNECTION_FAILURE_SQLSTATE = '08'
+
+_ORDER_BY_PATTERN = re.compile(r'\bORDER\s+BY\b', re.IGNORECASE)
+# Connections flagged by mark_broken, by id, until their pool releases them
+_broken = {}
+_broken_lock = threading.Lock()
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class _PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of pyodbc connections"""
+
+    def __init__(self, connection_string, max_size=DB_POOL_MAX_SIZE, checkout_timeout=DB_POOL_CHECKOUT_TIMEOUT,
+                 max_lifetime=DB_POOL_MAX_LIFETIME, validate_after_idle=DB_POOL_VALIDATE_AFTER_IDLE, connect=None):
+        self.connection_string = connection_string
+        # Any DB-API style connect(connection_string) callable; benchmark.py passes a SQLite stand-in
+        self.connect = connect or pyodbc.connect
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_lifetime = max_lifetime
+        self.validate_after_idle = validate_after_idle
+
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._metrics = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'validation_failures': 0,
+            'expired': 0,
+            'total_wait_ms': 0.0,
+        }
+
+    def _open(self):
+        with span('db.connect'):
+            conn = self.connect(self.connection_string)
+        with self._cond:
+            self._metrics['created'] += 1
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._metrics['closed'] += 1
+            self._cond.notify()
+
+    def _is_usable(self, pooled):
+        """Drop connections past their lifetime and ping ones that sat idle too long"""
+        now = time.monotonic()
+        if now - pooled.created_at > self.max_lifetime:
+            with self._cond:
+                self._metrics['expired'] += 1
+            return False
+        if now - pooled.last_used > self.validate_after_idle:
+            try:
+                cursor = pooled.conn.cursor()
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+                cursor.close()
+            except Exception:
+                with self._cond:
+                    self._metrics['validation_failures'] += 1
+                return False
+        return True
+
+    def acquire(self):
+        """Check out a connection, waiting up to checkout_timeout seconds for one to free up"""
+        start = time.monotonic()
+        deadline = start + self.checkout_timeout
+        with self._cond:
+            self._metrics['checkouts'] += 1
+
+        while True:
+            pooled = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._metrics['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available after {self.checkout_timeout}s "
+                            f"(pool size {self.max_size})"
+                        )
+                    self._metrics['waits'] += 1
+                    self._cond.wait(remaining)
+                if self._idle:
+                    pooled = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if pooled is None:
+                try:
+                    pooled = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_usable(pooled):
+                self._discard(pooled)
+                continue
+
+            with self._cond:
+                self._metrics['total_wait_ms'] += (time.monotonic() - start) * 1000
+            return pooled
+
+    def release(self, pooled, discard=False):
+        """Return a connection to the pool, rolling back any open transaction first"""
+        with _broken_lock:
+            if _broken.pop(id(pooled.conn), None) is not None:
+                discard = True
+        if not discard:
+            try:
+                pooled.conn.rollback()
+            except Exception:
+                discard = True
+        if discard:
+            self._discard(pooled)
+            return
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled pyodbc connection"""
+        with span('db.acquire'):
+            pooled = self.acquire()
+        broken = False
+        try:
+            yield pooled.conn
+        except pyodbc.OperationalError:
+            broken = True
+            raise
+        finally:
+            self.release(pooled, discard=broken)
+
+    def close_all(self):
+        """Close every idle connection, e.g. on shutdown"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def metrics(self):
+        """Snapshot of pool size and checkout counters"""
+        with self._cond:
+            metrics = dict(self._metrics)
+            metrics['size'] = self._size
+            metrics['idle'] = len(self._idle)
+            metrics['in_use'] = self._size - len(self._idle)
+            metrics['max_size'] = self.max_size
+        metrics['total_wait_ms'] = round(metrics['total_wait_ms'], 2)
+        return metrics
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool"""
+    global _pool
+    if _pool is not None:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(DB_CONNECTION_STRING)
+    return _pool
+
+
+def set_pool(pool):
+    """Replace the process-wide pool, closing the previous one's idle connections"""
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, pool
+    if previous is not None:
+        previous.close_all()
+
+
+def get_connection():
+    """Shortcut for get_pool().connection()"""
+    return get_pool().connection()
+
+
+def mark_broken(conn):
+    """Have the pool discard conn when it is released instead of reusing it, without failing the caller"""
+    with _broken_lock:
+        _broken[id(conn)] = conn
+
+
+def is_connection_failure(error):
+    """Whether a pyodbc error means the connection is unusable, judged by its SQLSTATE"""
+    sqlstate = error.args[0] if error.args else ''
+    return isinstance(sqlstate, str) and sqlstate.startswith(DB_CONNECTION_FAILURE_SQLSTATE)
+
+
+def strip_order_by(sql):
+    """Drop a trailing top-level ORDER BY (with any OFFSET/FETCH) so the query can be used as a derived table"""
+    sql = sql.strip().rstrip(';').rstrip()
+    for match in reversed(list(_ORDER_BY_PATTERN.finditer(sql))):
+        prefix = sql[:match.start()]
+        if prefix.count('(') == prefix.count(')'):
+            return prefix.rstrip()
+    return sql
+
+
+def fetch_limited(conn, sql, params=(), max_rows=20, timeout=0):
+    """Run a query with a server-side row cap and query timeout; returns (columns, rows, total_rows)
+
+    Rows are capped with SET ROWCOUNT and read with fetchmany. When the cap is hit, total_rows comes from a
+    separate COUNT(*) over the same query, or is None if that count fails or times out; the rows are returned
+    either way, and a connection the count found broken is marked for discard.
+    """
+    cursor = conn.cursor()
+    conn.timeout = timeout
+    try:
+        cursor.execute(f"SET ROWCOUNT {int(max_rows)}")
+        try:
+            with span('db.query') as record:
+                cursor.execute(sql, params)
+                columns = [description[0] for description in cursor.description] if cursor.description else []
+                rows = cursor.fetchmany(max_rows) if cursor.description else []
+                record['rows'] = len(rows)
+        finally:
+            # ROWCOUNT is session state; a pooled connection must never go back with it still set
+            try:
+                cursor.execute("SET ROWCOUNT 0")
+            except pyodbc.Error as e:
+                raise pyodbc.OperationalError(f"Could not reset ROWCOUNT: {str(e)}")
+
+        total_rows = len(rows)
+        if total_rows >= max_rows:
+            try:
+                with span('db.count'):
+                    cursor.execute(f"SELECT COUNT(*) FROM ({strip_order_by(sql)}) AS limited_query", params)
+                    total_rows = cursor.fetchone()[0]
+            except pyodbc.Error as e:
+                total_rows = None
+                if is_connection_failure(e):
+                    mark_broken(conn)
+        return columns, rows, total_rows
+    finally:
+        conn.timeout = 0
+        cursor.close()
@@ -0,0 +1,236 @@
+"""Embedding backends for query and chunk encoding, plus tools to export and verify the ONNX int8 model.
+
+Backends share the subset of the SentenceTransformer interface the app uses: encode(str) returns a vector,
+encode(list) a matrix, and get_sentence_embedding_dimension(). Select one with EMBEDDING_BACKEND in embeddings.py.
+
+Usage:
+    python embedding_backends.py export [--output-dir onnx_models/all-MiniLM-L6-v2]
+    python embedding_backends.py parity [--output-dir ...] [--samples questions.txt] [--min-cosine 0.99]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+EMBEDDING_ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'onnx_models', 'all-MiniLM-L6-v2')
+EMBEDDING_ONNX_FILE = 'model_int8.onnx'
+# Intra-op threads per ONNX session; keep low so several workers share a node's cores without oversubscribing
+EMBEDDING_ONNX_THREADS = 1
+# all-MiniLM-L6-v2 is trained with 256-token inputs; SentenceTransformer truncates there too
+EMBEDDING_MAX_SEQ_LENGTH = 256
+EMBEDDING_PARITY_MIN_COSINE = 0.99
+
+ONNX_INPUT_NAMES = ('input_ids', 'attention_mask', 'token_type_ids')
+
+# Default parity sample: the kinds of questions get_chunks_tool encodes
+PARITY_SAMPLES = (
+    "What is the escalation path for a P1 incident?",
+    "How long do we have to acknowledge a Sev2 alert before it breaches SLA?",
+    "Who should be paged when the payments service is down?",
+    "Steps to follow for a database failover during business hours",
+    "What information must be included in a post-incident review?",
+    "When do we notify customers about an outage?",
+    "How do I hand over an open incident at the end of my on-call shift?",
+    "What is the MTTR target for severity 3 incidents?",
+    "Rollback procedure for a failed production deployment",
+    "Which team owns the authentication service and how do I reach them?",
+    "incident",
+    "Is INC0012345 still open and who is the assigned engineer?",
+)
+
+
+class SentenceTransformerBackend:
+    """Full-precision PyTorch model through sentence_transformers"""
+
+    name = 'torch'
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, batch_size=32):
+        return self.model.encode(texts, batch_size=batch_size)
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+
+class OnnxInt8Backend:
+    """int8-quantized ONNX export of the same model run with ONNX Runtime; needs neither torch nor transformers.
+
+    Reproduces the SentenceTransformer pipeline: BERT tokenization, mean pooling over the attention mask and L2
+    normalization.
+    """
+
+    name = 'onnx-int8'
+
+    def __init__(self, model_dir=EMBEDDING_ONNX_DIR, model_file=EMBEDDING_ONNX_FILE, threads=EMBEDDING_ONNX_THREADS,
+                 max_seq_length=EMBEDDING_MAX_SEQ_LENGTH):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found; run 'python embedding_backends.py export' first")
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id('[PAD]') or 0, pad_token='[PAD]')
+        self._dimension = None
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            'attention_mask': np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            'token_type_ids': np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        token_embeddings = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+
+        mask = inputs['attention_mask'][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts, batch_size=32):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        embeddings = np.vstack([self._encode_batch(texts[start:start + batch_size])
+                                for start in range(0, len(texts), batch_size)]).astype(np.float32)
+        return embeddings[0] if single else embeddings
+
+    def get_sentence_embedding_dimension(self):
+        if self._dimension is None:
+            self._dimension = int(self.encode("dimension probe").shape[0])
+        return self._dimension
+
+
+EMBEDDING_BACKENDS = {
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+    OnnxInt8Backend.name: OnnxInt8Backend,
+}
+
+
+def load_backend(name):
+    """Construct the backend registered under name"""
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}', expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[name]()
+
+
+def export_onnx_int8(output_dir=EMBEDDING_ONNX_DIR, model_name=EMBEDDING_MODEL_NAME, opset=14):
+    """Export the transformer to ONNX and quantize its weights to int8; needs torch, transformers and onnxruntime"""
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    # Writes tokenizer.json, which OnnxInt8Backend loads with the standalone tokenizers package
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["export sample sentence"], return_tensors='pt')
+    fp32_path = os.path.join(output_dir, 'model.onnx')
+    int8_path = os.path.join(output_dir, EMBEDDING_ONNX_FILE)
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in (*ONNX_INPUT_NAMES, 'last_hidden_state')}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in ONNX_INPUT_NAMES),
+            fp32_path,
+            input_names=list(ONNX_INPUT_NAMES),
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"Exported {model_name}: {fp32_path} ({os.path.getsize(fp32_path) / 2**20:.1f} MB) -> "
+          f"{int8_path} ({os.path.getsize(int8_path) / 2**20:.1f} MB)")
+    return int8_path
+
+
+def _time_encode(backend, samples, repeats):
+    """Average single-query encode latency in milliseconds, after one warm-up pass"""
+    for text in samples:
+        backend.encode(text)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for text in samples:
+            backend.encode(text)
+    return (time.perf_counter() - start) * 1000 / (repeats * len(samples))
+
+
+def check_parity(candidate, reference, samples=PARITY_SAMPLES, min_cosine=EMBEDDING_PARITY_MIN_COSINE, repeats=5):
+    """Compare a backend against the reference (torch) model on sample texts.
+
+    Returns a report with min/mean cosine similarity between the two embeddings of each sample, whether each
+    sample's nearest other sample is the same under both models, and per-query encode latency for each.
+    """
+    samples = list(samples)
+    expected = np.asarray(reference.encode(samples), dtype=np.float32)
+    actual = np.asarray(candidate.encode(samples), dtype=np.float32)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    actual /= np.linalg.norm(actual, axis=1, keepdims=True)
+    cosines = (expected * actual).sum(axis=1)
+
+    def nearest(matrix):
+        similarities = matrix @ matrix.T
+        np.fill_diagonal(similarities, -np.inf)
+        return similarities.argmax(axis=1)
+
+    worst = int(cosines.argmin())
+    return {
+        'samples': len(samples),
+        'min_cosine': round(float(cosines.min()), 5),
+        'mean_cosine': round(float(cosines.mean()), 5),
+        'worst_sample': samples[worst],
+        'nearest_neighbour_agreement': round(float((nearest(expected) == nearest(actual)).mean()), 4),
+        'reference_encode_ms': round(_time_encode(reference, samples, repeats), 2),
+        'candidate_encode_ms': round(_time_encode(candidate, samples, repeats), 2),
+        'passed': bool(cosines.min() >= min_cosine),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and verify the ONNX int8 embedding backend")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help="Export and quantize the model")
+    export_parser.add_argument("--output-dir", default=EMBEDDING_ONNX_DIR)
+    export_parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parity_parser = subparsers.add_parser('parity', help="Compare the ONNX int8 model with the torch model")
+    parity_parser.add_argument("--output-dir", default=EMBEDDING_ONNX_DIR)
+    parity_parser.add_argument("--samples", help="Text file with one sample query per line")
+    parity_parser.add_argument("--min-cosine", type=float, default=EMBEDDING_PARITY_MIN_COSINE)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_onnx_int8(args.output_dir, args.model)
+        return
+
+    samples = PARITY_SAMPLES
+    if args.samples:
+        with open(args.samples, encoding='utf-8') as f:
+            samples = [line.strip() for line in f if line.strip()]
+    report = check_parity(OnnxInt8Backend(args.output_dir), SentenceTransformerBackend(), samples, args.min_cosine)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    if not report['passed']:
+        print(f"Parity check failed: min cosine {report['min_cosine']} < {args.min_cosine}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
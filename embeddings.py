@@ -0,0 +1,133 @@
+import threading
+import time
+
+from embedding_backends import load_backend, EMBEDDING_MODEL_NAME
+from tracing import span
+
+# 'torch' (SentenceTransformer) or 'onnx-int8' (quantized ONNX Runtime export, see embedding_backends.py);
+# run 'python embedding_backends.py parity' before switching, since the index was built with the torch model
+EMBEDDING_BACKEND = 'torch'
+# Use the torch model when the configured backend cannot load (e.g. the ONNX export is missing)
+EMBEDDING_BACKEND_FALLBACK = 'torch'
+
+_model = None
+_model_lock = threading.Lock()
+_model_ready = threading.Event()
+_stats_lock = threading.Lock()
+_stats = {
+    'model_name': EMBEDDING_MODEL_NAME,
+    'backend': None,
+    'load_seconds': None,
+    'load_error': None,
+    'encode_count': 0,
+    'encode_total_ms': 0.0,
+    'last_encode_ms': None,
+}
+
+
+def get_embedding_model():
+    """Return the shared embedding backend selected by EMBEDDING_BACKEND, loading it on first use"""
+    global _model
+    if _model is not None:
+        return _model
+
+    with _model_lock:
+        if _model is None:
+            start = time.perf_counter()
+            load_error = None
+            try:
+                # Backends import their runtime on construction: torch alone dominates cold start
+                model = load_backend(EMBEDDING_BACKEND)
+            except Exception as e:
+                if not EMBEDDING_BACKEND_FALLBACK or EMBEDDING_BACKEND_FALLBACK == EMBEDDING_BACKEND:
+                    with _stats_lock:
+                        _stats['load_error'] = str(e)
+                    raise
+                load_error = f"{EMBEDDING_BACKEND}: {str(e)}"
+                print(f"Embedding backend {EMBEDDING_BACKEND} unavailable, using {EMBEDDING_BACKEND_FALLBACK}: {str(e)}")
+                try:
+                    model = load_backend(EMBEDDING_BACKEND_FALLBACK)
+                except Exception as fallback_error:
+                    with _stats_lock:
+                        _stats['load_error'] = f"{load_error}; {EMBEDDING_BACKEND_FALLBACK}: {str(fallback_error)}"
+                    raise
+            _model = model
+            load_seconds = time.perf_counter() - start
+            with _stats_lock:
+                _stats['load_seconds'] = round(load_seconds, 3)
+                _stats['load_error'] = load_error
+                _stats['backend'] = model.name
+            _model_ready.set()
+            print(f"Embedding model {EMBEDDING_MODEL_NAME} ({model.name}) loaded in {load_seconds:.2f}s")
+    return _model
+
+
+def set_embedding_model(model):
+    """Use an already constructed model (anything with encode()) instead of loading EMBEDDING_BACKEND"""
+    global _model
+    with _model_lock:
+        _model = model
+    with _stats_lock:
+        _stats['backend'] = getattr(model, 'name', type(model).__name__)
+    _model_ready.set()
+
+
+def encode(text):
+    """Encode a query with the shared model and record the encode latency in milliseconds"""
+    model = get_embedding_model()
+    start = time.perf_counter()
+    with span('embedding.encode'):
+        embedding = model.encode(text)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with _stats_lock:
+        _stats['encode_count'] += 1
+        _stats['encode_total_ms'] += elapsed_ms
+        _stats['last_encode_ms'] = round(elapsed_ms, 2)
+    return embedding, elapsed_ms
+
+
+def encode_batch(texts, batch_size=64):
+    """Encode many texts in one call; returns (embeddings matrix, total encode milliseconds)"""
+    model = get_embedding_model()
+    start = time.perf_counter()
+    with span('embedding.encode_batch', texts=len(texts)):
+        embeddings = model.encode(list(texts), batch_size=batch_size)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with _stats_lock:
+        _stats['encode_count'] += len(texts)
+        _stats['encode_total_ms'] += elapsed_ms
+        _stats['last_encode_ms'] = round(elapsed_ms / max(len(texts), 1), 2)
+    return embeddings, elapsed_ms
+
+
+def warm_up(background=True):
+    """Load the model at startup, optionally in a daemon thread so the server can start serving immediately"""
+    def _load():
+        try:
+            get_embedding_model()
+        except Exception as e:
+            print(f"Embedding model warm-up failed: {str(e)}")
+
+    if not background:
+        _load()
+        return None
+
+    thread = threading.Thread(target=_load, name='embedding-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready():
+    """True once the model has been loaded"""
+    return _model_ready.is_set()
+
+
+def get_embedding_stats():
+    """Snapshot of load time and encode latency counters"""
+    with _stats_lock:
+        stats = dict(_stats)
+    count = stats['encode_count']
+    stats['avg_encode_ms'] = round(stats['encode_total_ms'] / count, 2) if count else None
+    stats['encode_total_ms'] = round(stats['encode_total_ms'], 2)
+    stats['ready'] = is_ready()
+    return stats
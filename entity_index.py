@@ -0,0 +1,372 @@
+import re
+import threading
+import time
+from datetime import datetime
+
+from db_pool import get_connection
+from incident_aggregates import fetch_incident_rows, CLOSED_STATUSES
+from tracing import span
+
+# In-memory index of the names questions refer to, so misspelled services, teams and engineers resolve to the exact
+# Incidents values before any SQL is written, and the chat box can offer completions
+ENTITY_INDEX_ENABLED = True
+ENTITY_REFRESH_INTERVAL = 60
+ENTITY_FULL_RELOAD_INTERVAL = 3600
+# Entity kind -> Incidents column
+ENTITY_FIELDS = {
+    'incident': 'Incident_ID',
+    'service': 'Service_Name',
+    'team': 'Owner_Team',
+    'engineer': 'On_Call_Engineer',
+}
+# Kinds resolved in free text; incident IDs are matched exactly by the router's pattern
+ENTITY_RESOLVED_KINDS = ('service', 'team', 'engineer')
+# Longest run of question words compared against a name
+ENTITY_MAX_WORDS = 4
+# Mentions shorter than this must match exactly; up to 7 characters allow one typo, longer ones two
+ENTITY_FUZZY_MIN_LENGTH = 4
+ENTITY_TYPEAHEAD_LIMIT = 8
+ENTITY_TYPEAHEAD_MIN_CHARS = 2
+# Prefix matches examined per kind before ranking by incident count, so a one-letter prefix stays cheap
+ENTITY_TYPEAHEAD_SCAN = 200
+# Common question words: never a one-word mention, and a run of words starting or ending with one is only matched
+# exactly, which keeps the fuzzy search to plausible spans
+ENTITY_STOPWORDS = frozenset((
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'at', 'by', 'is', 'me', 'my', 'for', 'all', 'any', 'are',
+    'was', 'who', 'what', 'which', 'when', 'how', 'did', 'does', 'do', 'about', 'show', 'list', 'find', 'get',
+    'with', 'from', 'this', 'that', 'open', 'closed', 'resolved', 'incident', 'incidents', 'status', 'team',
+    'service', 'engineer', 'severity', 'assigned', 'handled', 'owner', 'call', 'many', 'last', 'week', 'today',
+))
+# A one-word name is often a common word ("data", "search", "identity"), so it only resolves from a single word
+# written capitalized like the stored value (not as the question's first word) or next to a word naming its column
+ENTITY_KIND_CUES = {
+    'service': frozenset(('service', 'services')),
+    'team': frozenset(('team', 'teams')),
+    'engineer': frozenset(('engineer', 'engineers')),
+}
+ENTITY_CUE_DISTANCE = 2
+
+ENTITY_COLUMNS = "Incident_ID, Service_Name, Owner_Team, On_Call_Engineer, Status, Start_Time"
+_WORD_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[-_.'][A-Za-z0-9]+)*")
+_END = '\0'
+
+
+def normalize(text):
+    """Lower-cased words joined by single spaces: the key names are indexed and looked up under"""
+    return " ".join(word.lower() for word in _WORD_PATTERN.findall(text or ""))
+
+
+def max_distance(key):
+    """Typos tolerated when resolving a mention of this length"""
+    if len(key) < ENTITY_FUZZY_MIN_LENGTH:
+        return 0
+    return 1 if len(key) < 8 else 2
+
+
+def _single_word_evidence(words, position, kind, value):
+    """Whether a one-word mention is capitalized like value, or has a cue for its column within a couple of words"""
+    mention = words[position].group()
+    if position > 0 and mention[0].isupper() == value[0].isupper():
+        return True
+    nearby = words[max(0, position - ENTITY_CUE_DISTANCE):position] + words[position + 1:position + 1 + ENTITY_CUE_DISTANCE]
+    return any(word.group().lower() in ENTITY_KIND_CUES[kind] for word in nearby)
+
+
+class EntityTrie:
+    """Prefix tree over normalized keys; the terminal node of a key holds the canonical values filed under it"""
+
+    def __init__(self):
+        self.root = {}
+        self.keys = 0
+        self.max_length = 0
+
+    def insert(self, key, value):
+        self.max_length = max(self.max_length, len(key))
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        if _END not in node:
+            node[_END] = set()
+            self.keys += 1
+        node[_END].add(value)
+
+    def lookup(self, key):
+        """Values filed under exactly this key"""
+        node = self.root
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return set()
+        return node.get(_END, set())
+
+    def prefix(self, prefix, limit=ENTITY_TYPEAHEAD_SCAN):
+        """Up to limit values whose key starts with prefix, shortest keys first"""
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        values = []
+        level = [node]
+        while level and len(values) < limit:
+            next_level = []
+            for current in level:
+                values.extend(current.get(_END, ()))
+                next_level.extend(child for char, child in sorted(current.items()) if char != _END)
+            level = next_level
+        return values[:limit]
+
+    def fuzzy(self, key, distance):
+        """{value: edit distance} for keys within distance edits of key.
+
+        Walks the trie computing one Levenshtein row per node, so subtrees that are already too far away are skipped.
+        """
+        matches = {}
+        # Every key is at least this many edits away from a longer query
+        if len(key) - distance > self.max_length:
+            return matches
+        stack = [(child, char, list(range(len(key) + 1))) for char, child in self.root.items() if char != _END]
+        while stack:
+            node, char, previous = stack.pop()
+            row = [previous[0] + 1]
+            for column in range(1, len(key) + 1):
+                row.append(min(row[column - 1] + 1, previous[column] + 1,
+                               previous[column - 1] + (key[column - 1] != char)))
+            if row[-1] <= distance and _END in node:
+                for value in node[_END]:
+                    matches[value] = min(matches.get(value, row[-1]), row[-1])
+            if min(row) <= distance:
+                stack.extend((child, next_char, row) for next_char, child in node.items() if next_char != _END)
+        return matches
+
+
+class EntityIndex:
+    """Distinct Incident_ID, Service_Name, Owner_Team and On_Call_Engineer values, kept current incrementally.
+
+    Each kind has a trie of whole names (exact and fuzzy resolution, typeahead) and one of the later words of
+    multi-word names, so 'tay' completes to 'Charles Taylor'. Values whose incidents all changed away stay in the
+    tries until the next full reload but are skipped, since every lookup checks the live incident count.
+    """
+
+    def __init__(self, refresh_interval=ENTITY_REFRESH_INTERVAL, full_reload_interval=ENTITY_FULL_RELOAD_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self._rows = {}
+        self._open_ids = set()
+        self._counts = {kind: {} for kind in ENTITY_FIELDS}
+        self._names = {kind: EntityTrie() for kind in ENTITY_FIELDS}
+        self._words = {kind: EntityTrie() for kind in ENTITY_FIELDS}
+        self._watermark = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._last_full_reload = None
+        self._refresh_thread = None
+        self._stop = threading.Event()
+        self._stats = {'refreshes': 0, 'full_reloads': 0, 'rows_loaded': 0, 'last_refresh_ms': None,
+                       'last_refresh': None, 'last_error': None, 'resolutions': 0, 'fuzzy_resolutions': 0}
+
+    def is_ready(self):
+        return self._ready
+
+    def _fetch(self, cursor, full):
+        """Full reload, or rows started since the watermark, still open, or held open here but since resolved"""
+        with self._lock:
+            open_ids = [] if full else list(self._open_ids)
+        return fetch_incident_rows(cursor, ENTITY_COLUMNS, full, self._watermark, open_ids)
+
+    @staticmethod
+    def _file(names, words, value):
+        key = normalize(value)
+        if not key:
+            return
+        names.insert(key, value)
+        parts = key.split(' ')
+        for start in range(1, len(parts)):
+            words.insert(" ".join(parts[start:]), value)
+
+    def refresh(self, full=False):
+        """Pull new, open and newly resolved incidents (or everything, when full) and index any names not seen before"""
+        with self._refresh_lock, span('entity_index.refresh'):
+            start = time.perf_counter()
+            full = (full or self._last_full_reload is None
+                    or time.monotonic() - self._last_full_reload > self.full_reload_interval)
+            with get_connection() as conn:
+                cursor = conn.cursor()
+                loaded = list(self._fetch(cursor, full))
+                cursor.close()
+
+            rows = {} if full else dict(self._rows)
+            open_ids = set() if full else set(self._open_ids)
+            for incident_id, service, team, engineer, status, _ in loaded:
+                rows[incident_id] = (incident_id, service, team, engineer)
+                if status in CLOSED_STATUSES:
+                    open_ids.discard(incident_id)
+                else:
+                    open_ids.add(incident_id)
+            counts = {kind: {} for kind in ENTITY_FIELDS}
+            for row in rows.values():
+                for kind, value in zip(ENTITY_FIELDS, row):
+                    if value:
+                        counts[kind][value] = counts[kind].get(value, 0) + 1
+
+            if full:
+                # Build fresh tries off to the side and swap them in, dropping names no incident uses any more
+                names = {kind: EntityTrie() for kind in ENTITY_FIELDS}
+                words = {kind: EntityTrie() for kind in ENTITY_FIELDS}
+                for kind in ENTITY_FIELDS:
+                    for value in counts[kind]:
+                        self._file(names[kind], words[kind], value)
+            start_times = [row[5] for row in loaded if row[5] is not None]
+
+            with self._lock:
+                if full:
+                    self._names, self._words = names, words
+                    self._last_full_reload = time.monotonic()
+                    self._stats['full_reloads'] += 1
+                else:
+                    for kind in ENTITY_FIELDS:
+                        for value in counts[kind].keys() - self._counts[kind].keys():
+                            self._file(self._names[kind], self._words[kind], value)
+                self._rows = rows
+                self._open_ids = open_ids
+                self._counts = counts
+                if start_times:
+                    self._watermark = max([self._watermark, *start_times] if self._watermark else start_times)
+                self._ready = True
+
+            self._stats['refreshes'] += 1
+            self._stats['rows_loaded'] += len(loaded)
+            self._stats['last_refresh'] = datetime.now().isoformat(timespec='seconds')
+            self._stats['last_refresh_ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+    def _resolve_key(self, kind, key, fuzzy=True):
+        """(value, distance) of the one live name closest to key, or None when nothing or several names are closest"""
+        exact = [value for value in self._names[kind].lookup(key) if self._counts[kind].get(value)]
+        if exact:
+            return exact[0], 0
+        distance = max_distance(key) if fuzzy else 0
+        if not distance:
+            return None
+        matches = sorted((found, value) for value, found in self._names[kind].fuzzy(key, distance).items()
+                         if self._counts[kind].get(value))
+        if not matches or (len(matches) > 1 and matches[1][0] == matches[0][0]):
+            return None
+        value_distance, value = matches[0]
+        return value, value_distance
+
+    def resolve(self, text, kinds=ENTITY_RESOLVED_KINDS):
+        """Names mentioned in free text, exactly or within a few typos, in the order they appear.
+
+        Returns [{'kind', 'column', 'mention', 'value', 'distance'}]. Closer and longer matches win over the
+        overlapping shorter ones, and a name equally close to two values is left unresolved. One-word names need
+        the evidence _single_word_evidence looks for.
+        """
+        if not self._ready:
+            return []
+        words = list(_WORD_PATTERN.finditer(text or ""))
+        candidates = []
+        with self._lock:
+            for size in range(min(ENTITY_MAX_WORDS, len(words)), 0, -1):
+                for first in range(len(words) - size + 1):
+                    parts = [match.group().lower() for match in words[first:first + size]]
+                    key = " ".join(parts)
+                    if size == 1 and (key in ENTITY_STOPWORDS or len(key) < 3):
+                        continue
+                    fuzzy = parts[0] not in ENTITY_STOPWORDS and parts[-1] not in ENTITY_STOPWORDS
+                    for kind in kinds:
+                        resolved = self._resolve_key(kind, key, fuzzy)
+                        if resolved is None:
+                            continue
+                        one_word = ' ' not in resolved[0]
+                        if one_word and (size > 1 or not _single_word_evidence(words, first, kind, resolved[0])):
+                            continue
+                        candidates.append((resolved[1], -size, first, kind, resolved[0]))
+
+        taken = set()
+        entities = []
+        for distance, negative_size, first, kind, value in sorted(candidates):
+            positions = set(range(first, first - negative_size))
+            if positions & taken:
+                continue
+            taken |= positions
+            mention = text[words[first].start():words[first - negative_size - 1].end()]
+            entities.append({'kind': kind, 'column': ENTITY_FIELDS[kind], 'mention': mention, 'value': value,
+                             'distance': distance, 'position': first})
+        entities.sort(key=lambda entity: entity.pop('position'))
+        self._stats['resolutions'] += len(entities)
+        self._stats['fuzzy_resolutions'] += sum(1 for entity in entities if entity['distance'])
+        return entities
+
+    def suggest(self, text, limit=ENTITY_TYPEAHEAD_LIMIT, kinds=None):
+        """Completions for the name being typed at the end of text.
+
+        The last ENTITY_MAX_WORDS words down to the last one are tried in turn, first as a prefix and then as a close
+        misspelling of a whole name, so 'assigned to Charles Tay' completes the two-word fragment and 'Aisa Khan'
+        is corrected as a whole. Returns (fragment, suggestions): fragment is the tail of text a suggestion replaces.
+        """
+        kinds = kinds or tuple(ENTITY_FIELDS)
+        words = list(_WORD_PATTERN.finditer(text or ""))
+        if not self._ready or not words or words[-1].end() != len(text.rstrip("'-_.")):
+            return "", []
+
+        with self._lock:
+            for size in range(min(ENTITY_MAX_WORDS, len(words)), 0, -1):
+                fragment = text[words[-size].start():]
+                key = normalize(fragment)
+                if len(key) < ENTITY_TYPEAHEAD_MIN_CHARS:
+                    continue
+                for fuzzy in (False, True):
+                    found = {}
+                    for kind in kinds:
+                        if fuzzy:
+                            values = self._names[kind].fuzzy(key, max_distance(key)) if max_distance(key) else {}
+                        else:
+                            values = self._names[kind].prefix(key) + self._words[kind].prefix(key)
+                        for value in values:
+                            if self._counts[kind].get(value):
+                                found[(kind, value)] = self._counts[kind][value]
+                    if found:
+                        ranked = sorted(found.items(), key=lambda item: (-item[1], item[0][1]))[:limit]
+                        return fragment, [{'value': value, 'kind': kind, 'column': ENTITY_FIELDS[kind],
+                                           'incidents': count} for (kind, value), count in ranked]
+        return "", []
+
+    def start_background_refresh(self, interval=None):
+        """Refresh on a daemon thread every refresh_interval seconds"""
+        if self._refresh_thread is not None:
+            return self._refresh_thread
+        interval = interval or self.refresh_interval
+
+        def _run():
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                    self._stats['last_error'] = None
+                except Exception as e:
+                    self._stats['last_error'] = str(e)
+                    print(f"Entity index refresh failed: {str(e)}")
+                self._stop.wait(interval)
+
+        self._refresh_thread = threading.Thread(target=_run, name='entity-index', daemon=True)
+        self._refresh_thread.start()
+        return self._refresh_thread
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            entities = {kind: sum(1 for count in counts.values() if count) for kind, counts in self._counts.items()}
+            incidents = len(self._rows)
+            watermark = self._watermark
+        return dict(self._stats, enabled=ENTITY_INDEX_ENABLED, ready=self.is_ready(), incidents=incidents,
+                    entities=entities, watermark=watermark.isoformat() if watermark else None)
+
+
+_index = EntityIndex()
+
+
+def get_entity_index():
+    """Return the process-wide entity index"""
+    return _index
@@ -0,0 +1,98 @@
+import threading
+import time
+
+ELASTIC_HOST = "<your_elasticsearch_host>"
+ELASTIC_PORT = 9200
+ELASTIC_USERNAME = "<your_elasticsearch_username>"
+ELASTIC_PASSWORD = "<your_elasticsearch_password>"
+ELASTIC_CA_CERT = r"<path_to_elasticsearch_ca_cert>"
+ELASTIC_INDEX = "incident_sop"
+
+# Connection pool and retry settings for the shared client
+ELASTIC_CONNECTIONS_PER_NODE = 10
+ELASTIC_REQUEST_TIMEOUT = 10
+ELASTIC_MAX_RETRIES = 3
+ELASTIC_RETRY_ON_TIMEOUT = True
+ELASTIC_HEALTH_TIMEOUT = 2
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _build_client():
+    """Create the Elasticsearch client; urllib3 keeps connections alive and pools them per node"""
+    from elasticsearch import Elasticsearch
+
+    return Elasticsearch(
+        hosts=[f"https://{ELASTIC_HOST}:{ELASTIC_PORT}"],
+        basic_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD),
+        ca_certs=ELASTIC_CA_CERT,
+        verify_certs=True,
+        connections_per_node=ELASTIC_CONNECTIONS_PER_NODE,
+        request_timeout=ELASTIC_REQUEST_TIMEOUT,
+        max_retries=ELASTIC_MAX_RETRIES,
+        retry_on_timeout=ELASTIC_RETRY_ON_TIMEOUT,
+    )
+
+
+def get_es_client():
+    """Return the process-wide Elasticsearch client, creating it on first use"""
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            _client = _build_client()
+    return _client
+
+
+def set_es_client(client):
+    """Replace the shared client, e.g. with the in-memory stand-in used by benchmark.py"""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def close_es_client():
+    """Close the shared client and its pooled connections"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def es_health():
+    """Probe the cluster and report status and round-trip latency"""
+    start = time.perf_counter()
+    try:
+        client = get_es_client().options(request_timeout=ELASTIC_HEALTH_TIMEOUT, max_retries=0)
+        health = client.cluster.health()
+        return {
+            'healthy': health.get('status') in ('green', 'yellow'),
+            'status': health.get('status'),
+            'latency_ms': round((time.perf_counter() - start) * 1000, 2),
+        }
+    except Exception as e:
+        return {
+            'healthy': False,
+            'status': 'unreachable',
+            'error': str(e),
+            'latency_ms': round((time.perf_counter() - start) * 1000, 2),
+        }
+
+
+def index_fingerprint(index=ELASTIC_INDEX):
+    """Cheap change marker for an index: (doc count, deleted docs, total index operations), or None on error"""
+    try:
+        stats = get_es_client().indices.stats(index=index, metric='docs,indexing')
+        primaries = stats['_all']['primaries']
+        return (
+            primaries['docs']['count'],
+            primaries['docs']['deleted'],
+            primaries['indexing']['index_total'],
+        )
+    except Exception as e:
+        print(f"Index stats for {index} unavailable: {str(e)}")
+        return None
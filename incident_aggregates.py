@@ -0,0 +1,235 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from db_pool import get_connection
+from tracing import span
+
+# In-memory incident statistics for analytics questions and dashboards, refreshed from Incidents in the background
+AGGREGATES_ENABLED = True
+AGGREGATE_REFRESH_INTERVAL = 60
+AGGREGATE_FULL_RELOAD_INTERVAL = 3600
+AGGREGATE_WINDOWS = {
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+    'all': None,
+}
+AGGREGATE_GROUPS = {
+    'severity': 'Severity',
+    'service': 'Service_Name',
+    'team': 'Owner_Team',
+    'status': 'Status',
+}
+MTTR_PERCENTILES = (50, 90, 95)
+CLOSED_STATUSES = ('Resolved', 'Closed')
+# Incident IDs per re-read of rows held open; SQL Server allows at most 2100 parameters per statement
+INCREMENTAL_ID_CHUNK_SIZE = 1000
+
+AGGREGATE_COLUMNS = "Incident_ID, Severity, Status, SLA_Breached, MTTR_Minutes, Service_Name, Owner_Team, Start_Time"
+_FIELDS = [column.strip() for column in AGGREGATE_COLUMNS.split(',')]
+
+
+def _fetch_batches(cursor):
+    while True:
+        batch = cursor.fetchmany(1000)
+        if not batch:
+            break
+        yield from batch
+
+
+def fetch_incident_rows(cursor, columns, full=False, watermark=None, open_ids=()):
+    """Yield Incidents rows for a full reload, or for an incremental refresh of an in-memory copy.
+
+    An incremental refresh reads rows started since the watermark and rows still open, then re-reads by ID the rows
+    the caller holds as open that have since been resolved: the open filter no longer returns those, so they would
+    otherwise stay stale until the next full reload.
+    """
+    if full:
+        cursor.execute(f"SELECT {columns} FROM Incidents")
+        yield from _fetch_batches(cursor)
+        return
+
+    closed = ', '.join('?' for _ in CLOSED_STATUSES)
+    cursor.execute(f"SELECT {columns} FROM Incidents WHERE Start_Time >= ? OR Status NOT IN ({closed})",
+                   (watermark, *CLOSED_STATUSES))
+    yield from _fetch_batches(cursor)
+    open_ids = sorted(open_ids)
+    for start in range(0, len(open_ids), INCREMENTAL_ID_CHUNK_SIZE):
+        chunk = open_ids[start:start + INCREMENTAL_ID_CHUNK_SIZE]
+        cursor.execute(f"SELECT {columns} FROM Incidents WHERE Incident_ID IN ({', '.join('?' for _ in chunk)}) "
+                       f"AND Status IN ({closed})", (*chunk, *CLOSED_STATUSES))
+        yield from _fetch_batches(cursor)
+
+
+def summarize(rows):
+    """Counts, SLA breach rate and MTTR statistics for a list of incident row dicts"""
+    total = len(rows)
+    breached = sum(1 for row in rows if row['SLA_Breached'])
+    open_count = sum(1 for row in rows if row['Status'] not in CLOSED_STATUSES)
+    mttr = np.array([row['MTTR_Minutes'] for row in rows if row['MTTR_Minutes'] is not None], dtype=np.float64)
+    summary = {
+        'incidents': total,
+        'open': open_count,
+        'sla_breached': breached,
+        'sla_breach_rate': round(breached / total, 4) if total else None,
+        'mttr_avg': round(float(mttr.mean()), 1) if mttr.size else None,
+    }
+    for pct, value in zip(MTTR_PERCENTILES, np.percentile(mttr, MTTR_PERCENTILES) if mttr.size else [None] * 3):
+        summary[f'mttr_p{pct}'] = round(float(value), 1) if value is not None else None
+    return summary
+
+
+def group_summaries(rows, column):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[column] if row[column] is not None else 'Unknown', []).append(row)
+    return {key: summarize(group) for key, group in sorted(groups.items(), key=lambda item: str(item[0]))}
+
+
+class IncidentAggregateStore:
+    """Slim in-memory copy of Incidents kept current incrementally, plus a precomputed summary snapshot"""
+
+    def __init__(self, refresh_interval=AGGREGATE_REFRESH_INTERVAL, full_reload_interval=AGGREGATE_FULL_RELOAD_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self._rows = {}
+        self._watermark = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._last_full_reload = None
+        self._refresh_thread = None
+        self._stop = threading.Event()
+        self._stats = {'refreshes': 0, 'full_reloads': 0, 'rows_loaded': 0, 'last_refresh_ms': None,
+                       'last_refresh': None, 'last_error': None}
+
+    def is_ready(self):
+        return self._snapshot is not None
+
+    def _fetch(self, cursor, full):
+        """Full reload, or rows started since the watermark, still open, or held open here but since resolved"""
+        with self._lock:
+            open_ids = [] if full else [incident_id for incident_id, row in self._rows.items()
+                                        if row['Status'] not in CLOSED_STATUSES]
+        for row in fetch_incident_rows(cursor, AGGREGATE_COLUMNS, full, self._watermark, open_ids):
+            yield dict(zip(_FIELDS, row))
+
+    def refresh(self, full=False):
+        """Pull new, open and newly resolved incidents (or everything, when full) and rebuild the summary snapshot"""
+        with self._refresh_lock, span('aggregates.refresh'):
+            start = time.perf_counter()
+            full = (full or self._last_full_reload is None
+                    or time.monotonic() - self._last_full_reload > self.full_reload_interval)
+            with get_connection() as conn:
+                cursor = conn.cursor()
+                loaded = list(self._fetch(cursor, full))
+                cursor.close()
+
+            with self._lock:
+                if full:
+                    self._rows = {}
+                    self._last_full_reload = time.monotonic()
+                    self._stats['full_reloads'] += 1
+                for row in loaded:
+                    self._rows[row['Incident_ID']] = row
+                start_times = [row['Start_Time'] for row in loaded if row['Start_Time'] is not None]
+                if start_times:
+                    self._watermark = max([self._watermark, *start_times] if self._watermark else start_times)
+                rows = list(self._rows.values())
+
+            self._snapshot = self._build_snapshot(rows)
+            self._stats['refreshes'] += 1
+            self._stats['rows_loaded'] += len(loaded)
+            self._stats['last_refresh'] = self._snapshot['generated_at']
+            self._stats['last_refresh_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            return self._snapshot
+
+    def _build_snapshot(self, rows, now=None):
+        now = now or datetime.now()
+        windows = {}
+        for name in AGGREGATE_WINDOWS:
+            window_rows = self._window_rows(rows, name, now)
+            windows[name] = {
+                'overall': summarize(window_rows),
+                **{f'by_{group}': group_summaries(window_rows, column) for group, column in AGGREGATE_GROUPS.items()},
+            }
+        return {'generated_at': now.isoformat(timespec='seconds'), 'windows': windows}
+
+    @staticmethod
+    def _window_rows(rows, window, now):
+        window_seconds = AGGREGATE_WINDOWS[window]
+        if window_seconds is None:
+            return rows
+        since = now - window_seconds
+        return [row for row in rows if row['Start_Time'] is not None and row['Start_Time'] >= since]
+
+    def snapshot(self):
+        """The precomputed summaries for every window and grouping, or None before the first refresh"""
+        return self._snapshot
+
+    def query(self, window='7d', group_by=None, severity=None, service=None, team=None, status=None):
+        """Summaries for one window, optionally filtered and grouped; answered from memory, never from SQL.
+
+        Unfiltered questions are served from the precomputed snapshot; filtered ones are computed on the cached rows.
+        """
+        if window not in AGGREGATE_WINDOWS:
+            raise ValueError(f"Unknown window '{window}', expected one of {', '.join(AGGREGATE_WINDOWS)}")
+        if group_by and group_by not in AGGREGATE_GROUPS:
+            raise ValueError(f"Unknown group_by '{group_by}', expected one of {', '.join(AGGREGATE_GROUPS)}")
+        if self._snapshot is None:
+            self.refresh()
+
+        filters = {'Severity': severity, 'Service_Name': service, 'Owner_Team': team, 'Status': status}
+        filters = {column: value.lower() for column, value in filters.items() if value}
+        if not filters:
+            cached = self._snapshot['windows'][window]
+            return cached[f'by_{group_by}'] if group_by else cached['overall']
+
+        with self._lock:
+            rows = list(self._rows.values())
+        rows = [
+            row for row in self._window_rows(rows, window, datetime.now())
+            if all(str(row[column] or '').lower() == value for column, value in filters.items())
+        ]
+        return group_summaries(rows, AGGREGATE_GROUPS[group_by]) if group_by else summarize(rows)
+
+    def start_background_refresh(self, interval=None):
+        """Refresh on a daemon thread every refresh_interval seconds"""
+        if self._refresh_thread is not None:
+            return self._refresh_thread
+        interval = interval or self.refresh_interval
+
+        def _run():
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                    self._stats['last_error'] = None
+                except Exception as e:
+                    self._stats['last_error'] = str(e)
+                    print(f"Incident aggregate refresh failed: {str(e)}")
+                self._stop.wait(interval)
+
+        self._refresh_thread = threading.Thread(target=_run, name='incident-aggregates', daemon=True)
+        self._refresh_thread.start()
+        return self._refresh_thread
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            rows = len(self._rows)
+            watermark = self._watermark
+        return dict(self._stats, enabled=AGGREGATES_ENABLED, ready=self.is_ready(), incidents=rows,
+                    watermark=watermark.isoformat() if watermark else None)
+
+
+_store = IncidentAggregateStore()
+
+
+def get_aggregate_store():
+    """Return the process-wide incident aggregate store"""
+    return _store
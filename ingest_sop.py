@@ -0,0 +1,186 @@
+"""Build or incrementally refresh the incident_sop Elasticsearch index from SOP documents.
+
+Usage:
+    python ingest_sop.py path/to/sops [--chunk-words 200] [--overlap-words 40] [--batch-size 128] [--workers 4]
+"""
+import argparse
+import hashlib
+import os
+import time
+
+from elasticsearch import helpers
+
+from embeddings import encode_batch, get_embedding_model
+from es_client import get_es_client, ELASTIC_INDEX
+
+SOP_FILE_EXTENSIONS = ('.txt', '.md')
+DEFAULT_CHUNK_WORDS = 200
+DEFAULT_OVERLAP_WORDS = 40
+DEFAULT_BATCH_SIZE = 128
+DEFAULT_WORKERS = 4
+BULK_CHUNK_SIZE = 500
+
+INDEX_MAPPINGS = {
+    "properties": {
+        "content": {"type": "text"},
+        "chunk_id": {"type": "keyword"},
+        "source": {"type": "keyword"},
+        "content_hash": {"type": "keyword"},
+        "content_embedding": {"type": "dense_vector", "index": True, "similarity": "cosine"},
+    }
+}
+
+
+def iter_documents(path):
+    """Yield (source, text) for every SOP file under path, reading one file at a time"""
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = (
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in sorted(names)
+            if name.lower().endswith(SOP_FILE_EXTENSIONS)
+        )
+    base = path if os.path.isdir(path) else os.path.dirname(path)
+    for file_path in paths:
+        with open(file_path, encoding='utf-8', errors='replace') as f:
+            yield os.path.relpath(file_path, base).replace(os.sep, '/'), f.read()
+
+
+def chunk_text(text, chunk_words=DEFAULT_CHUNK_WORDS, overlap_words=DEFAULT_OVERLAP_WORDS):
+    """Split text into overlapping windows of chunk_words words"""
+    words = text.split()
+    if not words:
+        return []
+    step = max(chunk_words - overlap_words, 1)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(' '.join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+def content_hash(source, content):
+    return hashlib.sha256(f"{source}\n{content}".encode('utf-8')).hexdigest()
+
+
+def iter_chunks(path, chunk_words, overlap_words):
+    """Yield one dict per chunk, keyed by a content hash so unchanged chunks keep their document ID"""
+    for source, text in iter_documents(path):
+        for idx, content in enumerate(chunk_text(text, chunk_words, overlap_words)):
+            digest = content_hash(source, content)
+            yield {
+                "_id": digest,
+                "content": content,
+                "chunk_id": f"{source}#{idx}",
+                "source": source,
+                "content_hash": digest,
+            }
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ensure_index(es):
+    """Create the index with the dense_vector mapping the retrieval code expects, if it does not exist"""
+    if es.indices.exists(index=ELASTIC_INDEX):
+        return False
+    mappings = {"properties": dict(INDEX_MAPPINGS["properties"])}
+    mappings["properties"]["content_embedding"] = dict(
+        INDEX_MAPPINGS["properties"]["content_embedding"],
+        dims=get_embedding_model().get_sentence_embedding_dimension(),
+    )
+    es.indices.create(index=ELASTIC_INDEX, mappings=mappings)
+    print(f"Created index {ELASTIC_INDEX}")
+    return True
+
+
+def iter_bulk_actions(es, chunks, batch_size, stats, seen_ids):
+    """Skip chunks already indexed, encode the rest batch by batch and yield bulk index actions"""
+    for batch in batched(chunks, batch_size):
+        for chunk in batch:
+            seen_ids.setdefault(chunk["source"], set()).add(chunk["_id"])
+        existing = es.mget(index=ELASTIC_INDEX, ids=[chunk["_id"] for chunk in batch], source=False)
+        found = {doc["_id"] for doc in existing["docs"] if doc.get("found")}
+        new_chunks = [chunk for chunk in batch if chunk["_id"] not in found]
+        stats["skipped"] += len(batch) - len(new_chunks)
+        if not new_chunks:
+            continue
+
+        embeddings, encode_ms = encode_batch([chunk["content"] for chunk in new_chunks], batch_size=batch_size)
+        stats["encode_ms"] += encode_ms
+        for chunk, embedding in zip(new_chunks, embeddings):
+            doc_id = chunk.pop("_id")
+            yield {
+                "_op_type": "index",
+                "_index": ELASTIC_INDEX,
+                "_id": doc_id,
+                "_source": dict(chunk, content_embedding=embedding.tolist()),
+            }
+
+
+def delete_stale_chunks(es, seen_ids):
+    """Remove chunks of re-ingested sources that no longer appear in the new version of the document"""
+    deleted = 0
+    for source, ids in seen_ids.items():
+        response = es.delete_by_query(
+            index=ELASTIC_INDEX,
+            query={"bool": {"filter": [{"term": {"source": source}}], "must_not": [{"ids": {"values": list(ids)}}]}},
+            conflicts="proceed",
+        )
+        deleted += response.get("deleted", 0)
+    return deleted
+
+
+def ingest(path, chunk_words=DEFAULT_CHUNK_WORDS, overlap_words=DEFAULT_OVERLAP_WORDS,
+           batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS):
+    """Ingest every SOP under path; returns counters for indexed, skipped, failed and deleted chunks"""
+    es = get_es_client()
+    ensure_index(es)
+
+    start = time.perf_counter()
+    stats = {"indexed": 0, "skipped": 0, "failed": 0, "deleted": 0, "encode_ms": 0.0}
+    seen_ids = {}
+    actions = iter_bulk_actions(es, iter_chunks(path, chunk_words, overlap_words), batch_size, stats, seen_ids)
+    for ok, info in helpers.parallel_bulk(es, actions, thread_count=workers, chunk_size=BULK_CHUNK_SIZE,
+                                          raise_on_error=False):
+        if ok:
+            stats["indexed"] += 1
+        else:
+            stats["failed"] += 1
+            print(f"Failed to index chunk: {info}")
+
+    stats["deleted"] = delete_stale_chunks(es, seen_ids)
+    es.indices.refresh(index=ELASTIC_INDEX)
+    stats["encode_ms"] = round(stats["encode_ms"], 1)
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Ingest SOP documents into the {ELASTIC_INDEX} index")
+    parser.add_argument("path", help="SOP file or directory of .txt/.md files")
+    parser.add_argument("--chunk-words", type=int, default=DEFAULT_CHUNK_WORDS)
+    parser.add_argument("--overlap-words", type=int, default=DEFAULT_OVERLAP_WORDS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel bulk indexing threads")
+    args = parser.parse_args()
+
+    stats = ingest(args.path, args.chunk_words, args.overlap_words, args.batch_size, args.workers)
+    print(f"Indexed {stats['indexed']} chunks, skipped {stats['skipped']} unchanged, "
+          f"deleted {stats['deleted']} stale, {stats['failed']} failed in {stats['seconds']}s "
+          f"(encoding {stats['encode_ms']} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+import queue
+import threading
+import time
+import uuid
+
+# Worker pool and admission control settings for agent execution
+JOB_MAX_WORKERS = 4
+JOB_MAX_QUEUE_DEPTH = 20
+JOB_DEFAULT_DEADLINE = 120
+JOB_MIN_DEADLINE = 1
+JOB_MAX_DEADLINE = 600
+JOB_RESULT_TTL = 900
+JOB_RETRY_AFTER_SECONDS = 5
+
+FINISHED_STATES = ('succeeded', 'failed', 'cancelled', 'expired')
+
+
+class JobQueueFull(Exception):
+    """Raised when the queue is at capacity and the caller should retry later"""
+
+
+class JobManagerClosed(Exception):
+    """Raised when submitting to a manager that is shutting down"""
+
+
+class Job:
+    """One unit of agent work plus the events it has emitted so far"""
+
+    def __init__(self, fn, args, deadline_seconds):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.deadline = self.created_at + deadline_seconds
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self.events = []
+        self._cancel_callbacks = []
+        self._cond = threading.Condition()
+
+    def emit(self, event, data):
+        """Record an event for pollers and streaming clients"""
+        with self._cond:
+            self.events.append((event, data))
+            self._cond.notify_all()
+
+    def on_cancel(self, callback):
+        """Call callback(reason) when the job is cancelled or expires, or right away if it already was.
+
+        Finishing a job does not stop its worker, so the work registers here whatever it must stop, such as the
+        request's LLM budget.
+        """
+        with self._cond:
+            if self.status not in ('cancelled', 'expired'):
+                self._cancel_callbacks.append(callback)
+                return
+        callback(self.error)
+
+    def _finish(self, status, result=None, error=None):
+        with self._cond:
+            if self.status in FINISHED_STATES:
+                return False
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            if status == 'succeeded':
+                self.events.append(('done', result))
+            else:
+                self.events.append(('error', {'error': error, 'status': status}))
+            callbacks, self._cancel_callbacks = self._cancel_callbacks, []
+            self._cond.notify_all()
+        if status in ('cancelled', 'expired'):
+            for callback in callbacks:
+                callback(error)
+        return True
+
+    def _start(self):
+        with self._cond:
+            if self.status != 'queued':
+                return False
+            self.status = 'running'
+            self.started_at = time.time()
+        return True
+
+    def is_finished(self):
+        return self.status in FINISHED_STATES
+
+    def wait(self, timeout=None):
+        """Block until the job finishes or timeout seconds pass; returns True when finished"""
+        with self._cond:
+            return self._cond.wait_for(self.is_finished, timeout)
+
+    def iter_events(self, keepalive_seconds=15):
+        """Yield (event, data) pairs from the start, blocking for new ones; yields None as a keep-alive tick"""
+        index = 0
+        while True:
+            with self._cond:
+                if index >= len(self.events):
+                    self._cond.wait(keepalive_seconds)
+                pending = self.events[index:]
+                index += len(pending)
+                finished = self.is_finished()
+            if not pending:
+                if finished:
+                    return
+                yield None
+                continue
+            for event in pending:
+                yield event
+            if finished and index >= len(self.events):
+                return
+
+    def to_dict(self, include_result=True):
+        data = {
+            'jobId': self.id,
+            'status': self.status,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at,
+            'deadline': self.deadline,
+            'eventCount': len(self.events),
+        }
+        if include_result:
+            if self.status == 'succeeded':
+                data['result'] = self.result
+            elif self.error:
+                data['error'] = self.error
+        return data
+
+
+class JobManager:
+    """Bounded worker pool with a bounded queue; rejects work instead of letting latency grow without limit"""
+
+    def __init__(self, max_workers=JOB_MAX_WORKERS, max_queue_depth=JOB_MAX_QUEUE_DEPTH,
+                 default_deadline=JOB_DEFAULT_DEADLINE, result_ttl=JOB_RESULT_TTL):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.default_deadline = default_deadline
+        self.result_ttl = result_ttl
+
+        self._queue = queue.Queue(maxsize=max_queue_depth)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._running = 0
+        self._stats = {
+            'submitted': 0,
+            'rejected': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'expired': 0,
+        }
+        self._workers = []
+        for idx in range(max_workers):
+            worker = threading.Thread(target=self._worker, name=f'job-worker-{idx}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self._watchdog = threading.Thread(target=self._watch_deadlines, name='job-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def submit(self, fn, *args, deadline_seconds=None):
+        """Queue fn(job, *args) with a deadline clamped to [JOB_MIN_DEADLINE, JOB_MAX_DEADLINE] seconds; raises
+        JobQueueFull when the queue is at max_queue_depth"""
+        if self._closed:
+            raise JobManagerClosed("Job manager is shutting down")
+        if deadline_seconds is None:
+            deadline_seconds = self.default_deadline
+        deadline_seconds = min(max(deadline_seconds, JOB_MIN_DEADLINE), JOB_MAX_DEADLINE)
+        job = Job(fn, args, deadline_seconds)
+        self._purge_finished()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise JobQueueFull(f"Job queue is full ({self.max_queue_depth} waiting)")
+        with self._lock:
+            self._jobs[job.id] = job
+            self._stats['submitted'] += 1
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job; queued jobs never start, running ones have their result discarded and their on_cancel
+        callbacks called"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_requested = True
+        if job._finish('cancelled', error='Cancelled by client'):
+            self._count('cancelled')
+        return job
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['running'] = self._running
+            stats['tracked_jobs'] = len(self._jobs)
+        stats['queued'] = self._queue.qsize()
+        stats['max_workers'] = self.max_workers
+        stats['max_queue_depth'] = self.max_queue_depth
+        return stats
+
+    def shutdown(self, timeout=30):
+        """Stop accepting work and wait up to timeout seconds for running jobs to finish"""
+        self._closed = True
+        for _ in self._workers:
+            try:
+                self._queue.put(None, timeout=1)
+            except queue.Full:
+                break
+        end = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(0, end - time.monotonic()))
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if time.time() > job.deadline:
+                if job._finish('expired', error='Deadline passed while queued'):
+                    self._count('expired')
+                continue
+            if not job._start():
+                continue
+
+            with self._lock:
+                self._running += 1
+            try:
+                result = job.fn(job, *job.args)
+                if job._finish('succeeded', result=result):
+                    self._count('succeeded')
+            except Exception as e:
+                if job._finish('failed', error=str(e)):
+                    self._count('failed')
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+    def _watch_deadlines(self):
+        """Fail running jobs that overrun their deadline so clients get an answer; the worker result is dropped and
+        the job's on_cancel callbacks are called"""
+        while not self._closed:
+            time.sleep(1)
+            now = time.time()
+            with self._lock:
+                jobs = list(self._jobs.values())
+            for job in jobs:
+                if not job.is_finished() and now > job.deadline:
+                    job.cancel_requested = True
+                    if job._finish('expired', error='Deadline exceeded'):
+                        self._count('expired')
+
+    def _purge_finished(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the process-wide job manager, starting its workers on first use"""
+    global _manager
+    if _manager is not None:
+        return _manager
+
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+    return _manager
+
+
+def shutdown_job_manager(timeout=30):
+    """Drain the process-wide job manager if it was ever started"""
+    if _manager is not None:
+        _manager.shutdown(timeout)
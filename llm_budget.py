@@ -0,0 +1,193 @@
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from chat_context import count_tokens
+from tracing import get_metrics
+
+# Per-request LLM limits shared by the manager, the worker agents and fan-out branches; a request that runs out
+# returns what its tools already retrieved instead of failing
+LLM_BUDGET_ENABLED = True
+LLM_BUDGET_MAX_CALLS = 15
+LLM_BUDGET_MAX_TOKENS = 60000
+LLM_BUDGET_DEADLINE = 90
+# Stop starting LLM calls this many seconds before the job deadline, leaving time to answer before /query gives up
+LLM_BUDGET_DEADLINE_MARGIN = 5
+
+
+class LLMBudgetExceeded(Exception):
+    """Raised instead of starting an LLM call the request no longer has budget for"""
+
+    def __init__(self, reason):
+        super().__init__(f"LLM budget exhausted: {reason}")
+        self.reason = reason
+
+
+def _message_text(messages):
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(message.get('content') or '') for message in messages)
+
+
+class RequestBudget:
+    """Counts LLM calls, tokens and LLM time for one request and refuses calls past its limits.
+
+    Tokens are counted locally (tiktoken, or an estimate) from the prompt and the response text, so they track
+    the provider's count closely but not exactly. Once exhausted a budget stays exhausted.
+    """
+
+    def __init__(self, max_calls=LLM_BUDGET_MAX_CALLS, max_tokens=LLM_BUDGET_MAX_TOKENS,
+                 deadline_seconds=LLM_BUDGET_DEADLINE):
+        self.max_calls = max_calls
+        self.max_tokens = max_tokens
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline_seconds
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_seconds = 0.0
+        self.exhausted = None
+        self._lock = threading.Lock()
+
+    def _exhaust(self, limit, reason):
+        self.exhausted = reason
+        get_metrics().inc('llm_budget_exhausted_total', limit=limit)
+        raise LLMBudgetExceeded(reason)
+
+    def charge_call(self, messages):
+        """Account for a call about to start; returns its prompt token count or raises LLMBudgetExceeded"""
+        prompt_tokens = count_tokens(_message_text(messages))
+        with self._lock:
+            if self.exhausted is not None:
+                raise LLMBudgetExceeded(self.exhausted)
+            if time.monotonic() >= self.deadline:
+                self._exhaust('deadline', f"deadline of {round(self.deadline - self.started, 1)}s reached")
+            if self.calls >= self.max_calls:
+                self._exhaust('calls', f"calls limit of {self.max_calls} reached")
+            if self.prompt_tokens + self.completion_tokens + prompt_tokens > self.max_tokens:
+                self._exhaust('tokens', f"tokens limit of {self.max_tokens} reached")
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+        return prompt_tokens
+
+    def record_response(self, response, seconds):
+        completion_tokens = count_tokens(response if isinstance(response, str) else str(response or ""))
+        with self._lock:
+            self.completion_tokens += completion_tokens
+            self.llm_seconds += seconds
+
+    def cancel(self, reason):
+        """Refuse every further call, e.g. once the job running the request was cancelled or expired; the call
+        already in flight still completes"""
+        with self._lock:
+            if self.exhausted is not None:
+                return
+            self.exhausted = reason
+        get_metrics().inc('llm_budget_exhausted_total', limit='cancelled')
+
+    def cap_deadline(self, deadline):
+        """Bring the deadline forward to a monotonic time, e.g. the job's own deadline"""
+        with self._lock:
+            self.deadline = min(self.deadline, deadline)
+
+    def usage(self):
+        with self._lock:
+            return {
+                'llm_calls': self.calls,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'tokens': self.prompt_tokens + self.completion_tokens,
+                'llm_ms': round(self.llm_seconds * 1000, 1),
+                'elapsed_ms': round((time.monotonic() - self.started) * 1000, 1),
+                'limits': {'llm_calls': self.max_calls, 'tokens': self.max_tokens,
+                           'seconds': round(self.deadline - self.started, 1)},
+                'exhausted': self.exhausted,
+            }
+
+
+class BranchBudget:
+    """A request budget as seen by one concurrently running part of the request, such as a fan-out branch.
+
+    Calls are charged to the request's budget, but the branch also stops at its own deadline or once cancelled, so
+    a branch the request stopped waiting for cannot keep spending LLM calls after the response was returned. Only
+    the call already in flight when it is cancelled still completes.
+    """
+
+    def __init__(self, parent, deadline_seconds=None):
+        self.parent = parent
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds is not None else None
+        self.cancelled = None
+
+    def cancel(self, reason):
+        self.cancelled = reason
+
+    def charge_call(self, messages):
+        if self.cancelled is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancelled = "branch deadline reached"
+        if self.cancelled is not None:
+            get_metrics().inc('llm_budget_exhausted_total', limit='branch')
+            raise LLMBudgetExceeded(self.cancelled)
+        return self.parent.charge_call(messages)
+
+    def record_response(self, response, seconds):
+        self.parent.record_response(response, seconds)
+
+
+_current_budget = contextvars.ContextVar('current_budget', default=None)
+
+
+def current_budget():
+    return _current_budget.get()
+
+
+@contextmanager
+def request_budget(deadline=None, **limits):
+    """Make a fresh budget current for the enclosed request; deadline is an optional time.time() bound"""
+    budget = RequestBudget(**limits)
+    if deadline is not None:
+        budget.cap_deadline(budget.started + (deadline - time.time()) - LLM_BUDGET_DEADLINE_MARGIN)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def branch_budget(deadline_seconds=None):
+    """A BranchBudget of the current request's budget, or None outside a request"""
+    budget = _current_budget.get()
+    return BranchBudget(budget, deadline_seconds) if budget is not None else None
+
+
+def use_budget(budget):
+    """Make budget current for the rest of this context, e.g. a branch's copy of the request's contextvars"""
+    _current_budget.set(budget)
+
+
+def install_budget(llm):
+    """Route llm.call through the current request's budget; idempotent, and a no-op outside a request"""
+    call = getattr(llm, 'call', None)
+    if call is None:
+        # crewai releases before LLM.call route completions elsewhere, which would bypass every limit unnoticed
+        raise RuntimeError(f"{type(llm).__name__} has no call() method; the LLM budget needs a crewai release with "
+                           f"LLM.call (see requirements.txt)")
+    if getattr(call, 'charges_budget', False):
+        return llm
+
+    @functools.wraps(call)
+    def budgeted_call(messages, *args, **kwargs):
+        budget = _current_budget.get()
+        if budget is None or not LLM_BUDGET_ENABLED:
+            return call(messages, *args, **kwargs)
+        budget.charge_call(messages)
+        start = time.perf_counter()
+        response = call(messages, *args, **kwargs)
+        budget.record_response(response, time.perf_counter() - start)
+        return response
+
+    budgeted_call.charges_budget = True
+    # crewai LLM classes may be pydantic models that refuse new attributes through normal assignment
+    object.__setattr__(llm, 'call', budgeted_call)
+    return llm
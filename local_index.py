@@ -0,0 +1,249 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from es_client import get_es_client, index_fingerprint, ELASTIC_INDEX
+
+# Optional in-process mirror of the incident_sop index; get_chunks_tool falls back to Elasticsearch when it is off or empty
+LOCAL_INDEX_ENABLED = False
+LOCAL_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_index_data')
+LOCAL_INDEX_SYNC_INTERVAL = 300
+# Weight of the dense (cosine) score in the fused ranking; the rest goes to BM25
+LOCAL_INDEX_HYBRID_ALPHA = 0.7
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset(
+    'a an and are as at be by for from how i if in is it of on or should the this to we what when where which who '
+    'with do does can'.split()
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LocalSOPIndex:
+    """Memory-mapped chunk embeddings plus a BM25 inverted index, ranked with a fused hybrid score"""
+
+    def __init__(self, directory=LOCAL_INDEX_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._state = None
+        self._version = None
+        self._fingerprint = None
+        self._last_sync = None
+        self._sync_thread = None
+        self._stop = threading.Event()
+
+    # Each sync writes a new versioned snapshot and then swaps the small manifest naming it, so a snapshot is never
+    # overwritten while memory-mapped (Windows refuses to replace a mapped file)
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.directory, 'current.json')
+
+    def _embeddings_path(self, version):
+        return os.path.join(self.directory, f'embeddings-{version}.npy')
+
+    def _chunks_path(self, version):
+        return os.path.join(self.directory, f'chunks-{version}.json')
+
+    def is_ready(self):
+        return self._state is not None and len(self._state['chunks']) > 0
+
+    def _build_state(self, embeddings, chunks):
+        """Build the BM25 postings for a set of chunks; embeddings are already L2-normalized"""
+        postings = defaultdict(list)
+        doc_lengths = np.zeros(len(chunks), dtype=np.float32)
+        for idx, chunk in enumerate(chunks):
+            terms = Counter(tokenize(chunk.get('content', '')))
+            doc_lengths[idx] = sum(terms.values())
+            for term, tf in terms.items():
+                postings[term].append((idx, tf))
+
+        n_docs = len(chunks)
+        inverted = {}
+        for term, entries in postings.items():
+            doc_ids = np.fromiter((doc for doc, _ in entries), dtype=np.int32, count=len(entries))
+            tfs = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            inverted[term] = (doc_ids, tfs, idf)
+
+        return {
+            'embeddings': embeddings,
+            'chunks': chunks,
+            'inverted': inverted,
+            'doc_lengths': doc_lengths,
+            'avg_doc_length': float(doc_lengths.mean()) if n_docs else 0.0,
+        }
+
+    def load(self):
+        """Load the snapshot the manifest names; embeddings stay memory-mapped"""
+        if not os.path.exists(self._manifest_path):
+            return False
+        with open(self._manifest_path, encoding='utf-8') as f:
+            version = json.load(f)['version']
+        embeddings = np.load(self._embeddings_path(version), mmap_mode='r')
+        with open(self._chunks_path(version), encoding='utf-8') as f:
+            snapshot = json.load(f)
+        state = self._build_state(embeddings, snapshot['chunks'])
+        with self._lock:
+            self._state = state
+            self._version = version
+            self._fingerprint = tuple(snapshot['fingerprint']) if snapshot.get('fingerprint') else None
+            self._last_sync = snapshot.get('synced_at')
+        print(f"Local SOP index loaded with {len(state['chunks'])} chunks")
+        return True
+
+    def sync(self, force=False):
+        """Mirror ELASTIC_INDEX into the local snapshot when its fingerprint changed; returns True if rebuilt"""
+        fingerprint = index_fingerprint()
+        if not force and fingerprint is not None and fingerprint == self._fingerprint:
+            return False
+
+        from elasticsearch import helpers
+
+        start = time.perf_counter()
+        chunks = []
+        vectors = []
+        for hit in helpers.scan(
+            get_es_client(),
+            index=ELASTIC_INDEX,
+            query={"query": {"match_all": {}}},
+            _source=["content", "chunk_id", "source", "content_embedding"],
+        ):
+            source = hit['_source']
+            if not source.get('content_embedding'):
+                continue
+            vectors.append(source.pop('content_embedding'))
+            chunks.append(source)
+
+        if vectors:
+            embeddings = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.where(norms == 0, 1, norms)
+        else:
+            # An empty index mirrors as an empty snapshot, which is_ready() reports as not ready, so retrieval falls
+            # back to Elasticsearch; reshape(0, -1) cannot infer the width of no vectors
+            embeddings = np.zeros((0, 0), dtype=np.float32)
+
+        # Write the new snapshot under its own version, then point the manifest at it; a crash before the manifest
+        # swap leaves the previous snapshot current
+        os.makedirs(self.directory, exist_ok=True)
+        version = str(int(time.time() * 1000))
+        np.save(self._embeddings_path(version), embeddings)
+        with open(self._chunks_path(version), 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'synced_at': time.time(), 'chunks': chunks}, f)
+        tmp_manifest = self._manifest_path + '.tmp'
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump({'version': version}, f)
+        os.replace(tmp_manifest, self._manifest_path)
+
+        state = self._build_state(np.load(self._embeddings_path(version), mmap_mode='r'), chunks)
+        with self._lock:
+            self._state = state
+            self._version = version
+            self._fingerprint = fingerprint
+            self._last_sync = time.time()
+        self._remove_old_snapshots()
+        print(f"Local SOP index synced {len(chunks)} chunks in {time.perf_counter() - start:.2f}s")
+        return True
+
+    def _remove_old_snapshots(self):
+        """Delete snapshots other than the current one. A file a search still has mapped cannot be deleted on
+        Windows; it is left for the next sync to retry."""
+        current = {os.path.basename(self._embeddings_path(self._version)),
+                   os.path.basename(self._chunks_path(self._version))}
+        for name in os.listdir(self.directory):
+            if name in current or not name.startswith(('embeddings', 'chunks')):
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _bm25_scores(self, state, query_text):
+        scores = np.zeros(len(state['chunks']), dtype=np.float32)
+        if not state['avg_doc_length']:
+            return scores
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * state['doc_lengths'] / state['avg_doc_length'])
+        for term in set(tokenize(query_text)):
+            posting = state['inverted'].get(term)
+            if posting is None:
+                continue
+            doc_ids, tfs, idf = posting
+            scores[doc_ids] += idf * tfs * (BM25_K1 + 1) / (tfs + length_norm[doc_ids])
+        return scores
+
+    def search(self, query_embedding, query_text, k=5, alpha=LOCAL_INDEX_HYBRID_ALPHA):
+        """Return the top-k chunks as dicts with content, chunk_id, source and score"""
+        state = self._state
+        if state is None or not state['chunks']:
+            return []
+
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm:
+            query_vector = query_vector / norm
+        dense = np.asarray(state['embeddings'] @ query_vector)
+        # Map cosine from [-1, 1] to [0, 1] and BM25 onto [0, 1] by its max so the two are comparable
+        dense = (dense + 1) / 2
+        sparse = self._bm25_scores(state, query_text)
+        if sparse.max() > 0:
+            sparse = sparse / sparse.max()
+        fused = alpha * dense + (1 - alpha) * sparse
+
+        k = min(k, len(fused))
+        top = np.argpartition(-fused, k - 1)[:k]
+        top = top[np.argsort(-fused[top])]
+        return [dict(state['chunks'][idx], score=float(fused[idx])) for idx in top]
+
+    def start_background_sync(self, interval=LOCAL_INDEX_SYNC_INTERVAL):
+        """Load the snapshot from disk, then keep it in sync from Elasticsearch on a daemon thread"""
+        if self._sync_thread is not None:
+            return self._sync_thread
+
+        def _run():
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Local SOP index load failed: {str(e)}")
+            while not self._stop.is_set():
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"Local SOP index sync failed: {str(e)}")
+                self._stop.wait(interval)
+
+        self._sync_thread = threading.Thread(target=_run, name='local-index-sync', daemon=True)
+        self._sync_thread.start()
+        return self._sync_thread
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        state = self._state
+        return {
+            'enabled': LOCAL_INDEX_ENABLED,
+            'ready': self.is_ready(),
+            'chunks': len(state['chunks']) if state else 0,
+            'terms': len(state['inverted']) if state else 0,
+            'version': self._version,
+            'last_sync': self._last_sync,
+        }
+
+
+_index = LocalSOPIndex()
+
+
+def get_local_index():
+    """Return the process-wide local SOP index"""
+    return _index
@@ -0,0 +1,62 @@
+-- Make IncidentChatHistory indexable and add a one-row-per-chat summary table for the paginated sidebar.
+-- Run once against the application database (idempotent).
+
+-- ChatID was NVARCHAR(MAX), which cannot be an index key column
+IF EXISTS (
+    SELECT 1 FROM sys.columns
+    WHERE object_id = OBJECT_ID('dbo.IncidentChatHistory') AND name = 'ChatID' AND max_length = -1
+)
+BEGIN
+    ALTER TABLE dbo.IncidentChatHistory ALTER COLUMN ChatID NVARCHAR(100) NULL;
+END
+GO
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID('dbo.IncidentChatHistory') AND name = 'IX_IncidentChatHistory_ChatID_DateTime'
+)
+BEGIN
+    CREATE INDEX IX_IncidentChatHistory_ChatID_DateTime
+        ON dbo.IncidentChatHistory (ChatID, DateTime);
+END
+GO
+
+IF OBJECT_ID('dbo.IncidentChats') IS NULL
+BEGIN
+    CREATE TABLE dbo.IncidentChats (
+        ChatID NVARCHAR(100) NOT NULL PRIMARY KEY,
+        Title NVARCHAR(200) NOT NULL,
+        LastActivity DATETIME NOT NULL,
+        MessageCount INT NOT NULL
+    );
+END
+GO
+
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID('dbo.IncidentChats') AND name = 'IX_IncidentChats_LastActivity_ChatID'
+)
+BEGIN
+    CREATE INDEX IX_IncidentChats_LastActivity_ChatID
+        ON dbo.IncidentChats (LastActivity DESC, ChatID DESC)
+        INCLUDE (Title, MessageCount);
+END
+GO
+
+-- Backfill one summary row per existing chat; the title is the chat's first question
+INSERT INTO dbo.IncidentChats (ChatID, Title, LastActivity, MessageCount)
+SELECT h.ChatID,
+       COALESCE(first_q.Title, N''),
+       COALESCE(MAX(h.DateTime), GETDATE()),
+       COUNT(*)
+FROM dbo.IncidentChatHistory h
+OUTER APPLY (
+    SELECT TOP (1) CAST(LEFT(f.Question, 200) AS NVARCHAR(200)) AS Title
+    FROM dbo.IncidentChatHistory f
+    WHERE f.ChatID = h.ChatID
+    ORDER BY f.DateTime ASC
+) first_q
+WHERE h.ChatID IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM dbo.IncidentChats c WHERE c.ChatID = h.ChatID)
+GROUP BY h.ChatID, first_q.Title;
+GO
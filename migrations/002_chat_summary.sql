@@ -0,0 +1,14 @@
+-- Rolling per-chat summary of turns that fell out of the recent-context window (see chat_context.py).
+-- Run once against the application database (idempotent).
+
+IF OBJECT_ID('dbo.IncidentChatSummary') IS NULL
+BEGIN
+    CREATE TABLE dbo.IncidentChatSummary (
+        ChatID NVARCHAR(100) NOT NULL PRIMARY KEY,
+        Summary NVARCHAR(MAX) NOT NULL,
+        SummarizedThrough DATETIME NOT NULL,
+        SummarizedTurns INT NOT NULL,
+        UpdatedAt DATETIME NOT NULL
+    );
+END
+GO
@@ -0,0 +1,151 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from router import INCIDENT_ID_PATTERN
+
+# Short-lived cache of Incidents query results so repeated lookups of the same hot incidents skip SQL Server
+QUERY_CACHE_ENABLED = True
+QUERY_CACHE_TTL = 30
+QUERY_CACHE_MAX_ENTRIES = 1000
+
+_QUOTED_OR_SPACE_PATTERN = re.compile(r"('(?:[^']|'')*')|\s+")
+_READ_ONLY_PATTERN = re.compile(r'^\s*(?:SELECT|WITH)\b', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and uppercase everything outside string literals, so trivially different
+    spellings of the same statement share a cache key"""
+    sql = sql.strip().rstrip(';').rstrip()
+    parts = []
+    last = 0
+    for match in _QUOTED_OR_SPACE_PATTERN.finditer(sql):
+        parts.append(sql[last:match.start()].upper())
+        parts.append(match.group(1) if match.group(1) else ' ')
+        last = match.end()
+    parts.append(sql[last:].upper())
+    return ''.join(parts)
+
+
+def is_read_only(sql):
+    return bool(_READ_ONLY_PATTERN.match(sql))
+
+
+def referenced_incident_ids(sql, params, columns, rows):
+    """Incident IDs a cached result depends on: those named in the query and those present in its rows"""
+    ids = {incident_id.upper() for incident_id in INCIDENT_ID_PATTERN.findall(sql)}
+    ids.update(str(param).upper() for param in params if INCIDENT_ID_PATTERN.fullmatch(str(param)))
+    if 'Incident_ID' in columns:
+        position = columns.index('Incident_ID')
+        ids.update(str(row[position]).upper() for row in rows if row[position] is not None)
+    return ids
+
+
+class QueryCache:
+    """TTL + LRU cache of (columns, rows, total_rows) keyed by normalized SQL and parameters"""
+
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._by_incident = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    @staticmethod
+    def make_key(sql, params=(), max_rows=None):
+        return normalize_sql(sql), tuple(params), max_rows
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for incident_id in entry['incident_ids']:
+            keys = self._by_incident.get(incident_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_incident[incident_id]
+
+    def lookup(self, key):
+        """Return the cached (columns, rows, total_rows) for key, or None when absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry['created_at'] > self.ttl:
+                self._remove(key)
+                self._stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry['result']
+
+    def store(self, key, columns, rows, total_rows):
+        """Cache a query result, evicting the least recently used entries past max_entries"""
+        rows = [tuple(row) for row in rows]
+        incident_ids = referenced_incident_ids(key[0], key[1], columns, rows)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                'result': (list(columns), rows, total_rows),
+                'incident_ids': incident_ids,
+                'created_at': time.monotonic(),
+            }
+            for incident_id in incident_ids:
+                self._by_incident.setdefault(incident_id, set()).add(key)
+            self._stats['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def invalidate_incident(self, incident_id):
+        """Drop every cached result that names or contains incident_id; returns how many were dropped.
+
+        Filter queries (e.g. all open incidents) are only caught when the incident was already in their rows;
+        an incident newly matching a filter shows up once the entry's TTL runs out.
+        """
+        with self._lock:
+            keys = list(self._by_incident.get(incident_id.upper(), ()))
+            for key in keys:
+                self._remove(key)
+            if keys:
+                self._stats['invalidations'] += 1
+        return len(keys)
+
+    def invalidate_all(self, reason=""):
+        """Drop every cached result"""
+        with self._lock:
+            self._entries.clear()
+            self._by_incident.clear()
+            self._stats['invalidations'] += 1
+        if reason:
+            print(f"Query cache cleared: {reason}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['incidents_tracked'] = len(self._by_incident)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['ttl'] = self.ttl
+        stats['enabled'] = QUERY_CACHE_ENABLED
+        return stats
+
+
+_cache = QueryCache()
+
+
+def get_query_cache():
+    """Return the process-wide Incidents query result cache"""
+    return _cache
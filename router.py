@@ -0,0 +1,197 @@
+import re
+
+from entity_index import get_entity_index, ENTITY_INDEX_ENABLED
+
+# Columns returned by fast-path lookups, mirroring the Incident_Data_agent examples
+INCIDENT_COLUMNS = "Incident_ID, Service_Name, Severity, Status, Issue_Description, Owner_Team, On_Call_Engineer, Escalation_Contact, Start_Time, MTTR_Minutes, SLA_Breached"
+FAST_PATH_MAX_IDS = 20
+
+INCIDENT_ID_PATTERN = re.compile(r'\bINC\d{6}\b', re.IGNORECASE)
+SEVERITY_PATTERN = re.compile(r'\b(?:severity\s*)?(P[1-4])\b', re.IGNORECASE)
+STATUS_VALUES = {
+    'open': 'Open',
+    'in progress': 'In Progress',
+    'resolved': 'Resolved',
+    'closed': 'Closed',
+}
+STATUS_PATTERN = re.compile(r'\b(open|in progress|resolved|closed)\b', re.IGNORECASE)
+SLA_BREACH_PATTERN = re.compile(r'\b(?:breach(?:ed|ing)?\s+(?:the\s+)?sla|sla\s+breach(?:ed|es)?)\b', re.IGNORECASE)
+ENGINEER_PATTERN = re.compile(
+    r'\b(?:assigned to|handled by|owned by|on[- ]call engineer|engineer)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)'
+)
+LISTING_PATTERN = re.compile(r'\b(?:show|list|which|what are|all|get|find|display)\b', re.IGNORECASE)
+INCIDENTS_WORD_PATTERN = re.compile(r'\bincidents?\b', re.IGNORECASE)
+# Negation, exclusion, time ranges and aggregates change what a matched filter means, so the fast path's raw rows
+# would answer a different question
+QUALIFIER_PATTERN = re.compile(
+    r"\b(?:not|no|non|except|excluding|exclude|without|other than|apart from|but|nor|neither|"
+    r"last|past|since|before|after|between|during|ago|today|yesterday|week|month|year|days?|hours?|recent(?:ly)?|"
+    r"how many|count|number of|total|average|avg|mean|median|most|least|top|per|trend|oldest|newest|longest)\b"
+    r"|n['\u2019]t\b",
+    re.IGNORECASE
+)
+# Words a fast-path listing question may contain besides its filters; any other word is a condition the filters
+# do not capture, and the question goes to the manager
+FILLER_WORDS = frozenset((
+    'show', 'list', 'which', 'what', 'are', 'is', 'all', 'get', 'find', 'display', 'me', 'us', 'the', 'a', 'any',
+    'incident', 'incidents', 'with', 'for', 'in', 'on', 'of', 'by', 'to', 'from', 'that', 'have', 'has', 'there',
+    'currently', 'current', 'please', 'status', 'severity', 'service', 'team', 'engineer', 'assigned', 'handled',
+    'owned', 'sla',
+))
+# Words an incident ID lookup may contain besides the IDs and column names; anything else (why, compare, ...) asks
+# for more than the rows, and the question goes to the manager
+LOOKUP_FILLER_WORDS = FILLER_WORDS | frozenset((
+    'and', 'or', 'who', 'when', 'was', 'were', 'it', 'its', 'their', 'details', 'detail', 'info', 'information',
+    'about', 'tell', 'give', 'handling', 'working', 'owns', 'owner', 'owning', 'contact', 'started', 'start', 'time',
+    'issue', 'description', 'summary', 'do', 'does', 'did', 'i', 'can', 'you', 'id', 'ids', 'call',
+))
+# Incidents column names as questions write them; a question naming one asks about incident data
+COLUMN_PATTERN = re.compile(
+    r'\b(?:incident[_ ]ids?|service[_ ]name|severity|status|issue[_ ]description|owner[_ ]team|owning team|'
+    r'on[-_ ]call(?:[_ ]engineer)?|escalation[_ ]contact|start[_ ]time|mttr(?:[_ ]minutes)?|sla(?:[_ ]breached)?)\b',
+    re.IGNORECASE
+)
+_WORD_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[-_.'][A-Za-z0-9]+)*")
+SOP_PATTERN = re.compile(
+    r'\b(?:procedures?|process|how (?:to|do|should|can)|steps?|escalat\w*|sop|best practices?|'
+    r'guidelines?|define|definition|policy|runbook|what should)\b',
+    re.IGNORECASE
+)
+# Pronouns and ellipsis that lean on an earlier turn ("what about for P2?", "who owns it?")
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(?:and|or|also|then|so)\b|\b(?:it|its|they|them|their|those|these|that one|this one|the same|same one|"
+    r"what about|how about|instead|above|previous(?:ly)?|earlier|mentioned|else)\b",
+    re.IGNORECASE
+)
+
+
+def resolve_entities(text):
+    """{column: [exact Incidents values]} for the services, teams and engineers the text names, typos corrected,
+    and the mentions as written"""
+    resolved = {}
+    mentions = []
+    if ENTITY_INDEX_ENABLED:
+        for entity in get_entity_index().resolve(text):
+            values = resolved.setdefault(entity['column'], [])
+            if entity['value'] not in values:
+                values.append(entity['value'])
+            mentions.append(entity['mention'])
+    return resolved, mentions
+
+
+def question_entities(text):
+    """The incident IDs, severities and resolved service, team and engineer names a question mentions, as a
+    frozenset of (column, value)"""
+    entities = {('Incident_ID', match.upper()) for match in INCIDENT_ID_PATTERN.findall(text)}
+    entities.update(('Severity', match.upper()) for match in SEVERITY_PATTERN.findall(text))
+    resolved, _ = resolve_entities(text)
+    entities.update((column, value) for column, values in resolved.items() for value in values)
+    return frozenset(entities)
+
+
+def is_follow_up(text, entities=None):
+    """Whether a question leans on the conversation before it: it names no entities of its own, or uses pronoun or
+    ellipsis cues. entities defaults to question_entities(text)"""
+    if entities is None:
+        entities = question_entities(text)
+    return not entities or bool(FOLLOW_UP_PATTERN.search(text))
+
+
+def unexplained_words(text, matched, filler=FILLER_WORDS):
+    """Words of text outside the matched spans that are not filler"""
+    return [word for word in _WORD_PATTERN.findall(_blank(text, matched)) if word.lower() not in filler]
+
+
+def _blank(text, matched):
+    for start, end in matched:
+        text = text[:start] + ' ' * (end - start) + text[end:]
+    return text
+
+
+def _route(path, reason, sql=None, params=()):
+    return {'path': path, 'reason': reason, 'sql': sql, 'params': tuple(params)}
+
+
+def route_query(user_query):
+    """Classify a question into a deterministic fast path, or 'manager' when the intent is ambiguous.
+
+    Returns a dict with 'path' ('incident_lookup', 'incident_filter', 'sop', 'mixed' or 'manager'), a human
+    readable 'reason' and, for the data paths, a parameterized 'sql' statement with its 'params'. 'mixed' marks
+    questions about specific incidents that also ask for procedures.
+    """
+    text = user_query.strip()
+    incident_ids = sorted({match.upper() for match in INCIDENT_ID_PATTERN.findall(text)})
+    columns = [match.span() for match in COLUMN_PATTERN.finditer(text)]
+    # "escalation contact" names a column, not a procedure, so column names are ignored when looking for SOP words
+    asks_procedure = bool(SOP_PATTERN.search(_blank(text, columns)))
+
+    if incident_ids:
+        if asks_procedure:
+            return _route('mixed', 'Question mixes incident data with procedures')
+        if len(incident_ids) > FAST_PATH_MAX_IDS:
+            return _route('manager', f'Too many incident IDs ({len(incident_ids)}) for a fast-path lookup')
+        # The rows answer "what is the status of ..." but not "why did ... breach" or "compare ..."
+        matched = [match.span() for match in INCIDENT_ID_PATTERN.finditer(text)] + columns
+        for pattern in (SLA_BREACH_PATTERN, STATUS_PATTERN, SEVERITY_PATTERN):
+            matched.extend(match.span() for match in pattern.finditer(text))
+        unexplained = unexplained_words(text, matched, LOOKUP_FILLER_WORDS)
+        if unexplained:
+            return _route('manager', f"Incident question with unmatched terms: {', '.join(unexplained)}")
+        placeholders = ', '.join('?' for _ in incident_ids)
+        sql = f"SELECT {INCIDENT_COLUMNS} FROM Incidents WHERE Incident_ID IN ({placeholders})"
+        return _route('incident_lookup', f"Incident ID lookup for {', '.join(incident_ids)}", sql, incident_ids)
+
+    if asks_procedure:
+        # "escalated to Charles Taylor" or "the escalation contact for Payments" asks for data, not the SOP
+        if columns or SEVERITY_PATTERN.search(text) or resolve_entities(text)[0]:
+            return _route('manager', 'Procedure wording with incident data cues')
+        return _route('sop', 'Procedure or SOP question')
+
+    if not (INCIDENTS_WORD_PATTERN.search(text) and LISTING_PATTERN.search(text)):
+        return _route('manager', 'No deterministic pattern matched')
+    qualifier = QUALIFIER_PATTERN.search(text)
+    if qualifier:
+        return _route('manager', f"Listing question qualified by '{qualifier.group(0)}'")
+
+    filters = []
+    params = []
+    matched = []
+    status = STATUS_PATTERN.search(text)
+    if status:
+        filters.append("Status = ?")
+        params.append(STATUS_VALUES[status.group(1).lower()])
+        matched.append(status.span())
+    severity = SEVERITY_PATTERN.search(text)
+    if severity:
+        filters.append("Severity = ?")
+        params.append(severity.group(1).upper())
+        matched.append(severity.span())
+    sla_breach = SLA_BREACH_PATTERN.search(text)
+    if sla_breach:
+        filters.append("SLA_Breached = 1")
+        matched.append(sla_breach.span())
+    # Names are matched against the entity index so a misspelling becomes the stored value, not an empty result
+    resolved, mentions = resolve_entities(text)
+    for mention in mentions:
+        start = text.find(mention)
+        matched.append((start, start + len(mention)))
+    engineer = ENGINEER_PATTERN.search(text)
+    if engineer:
+        matched.append(engineer.span())
+        if 'On_Call_Engineer' not in resolved:
+            resolved['On_Call_Engineer'] = [engineer.group(1)]
+    for column in ('Service_Name', 'Owner_Team', 'On_Call_Engineer'):
+        values = resolved.get(column)
+        if values:
+            filters.append(f"{column} = ?" if len(values) == 1 else f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+
+    if not filters:
+        return _route('manager', 'Listing question without a recognised filter')
+    # Raw rows only answer the question when the filters account for all of it
+    unexplained = unexplained_words(text, matched)
+    if unexplained:
+        return _route('manager', f"Listing question with unmatched terms: {', '.join(unexplained)}")
+
+    sql = f"SELECT {INCIDENT_COLUMNS} FROM Incidents WHERE {' AND '.join(filters)}"
+    return _route('incident_filter', f"Incident filter on {', '.join(f.split(' ')[0] for f in filters)}", sql, params)
@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from es_client import index_fingerprint, ELASTIC_INDEX
+
+# Answers are reused when a new question embeds this close (cosine) to a cached one and names the same severities,
+# incident IDs and services, since MiniLM places "P1 escalation procedure" this close to the P2 one
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_MAX_ENTRIES = 500
+SEMANTIC_CACHE_MAX_BYTES = 20 * 1024 * 1024
+SEMANTIC_CACHE_TTL = 6 * 3600
+# How often the background check compares the incident_sop index fingerprint and drops the cache if it changed
+SEMANTIC_CACHE_INDEX_CHECK_INTERVAL = 60
+# Follow-up questions ("what about for P2?", or ones naming no entities) depend on their conversation, so they
+# bypass the cache; other questions in a chat with history still use it
+SEMANTIC_CACHE_SKIP_FOLLOW_UPS = True
+
+
+def _normalize(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """LRU + TTL cache of SOP answers keyed by query embedding.
+
+    Each entry also carries a scope, any hashable value such as the conversation context and the entities the
+    question names; a lookup only considers entries with an equal scope.
+    """
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 max_bytes=SEMANTIC_CACHE_MAX_BYTES, ttl=SEMANTIC_CACHE_TTL,
+                 index_check_interval=SEMANTIC_CACHE_INDEX_CHECK_INTERVAL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.index_check_interval = index_check_interval
+
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._bytes = 0
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        self._index_fingerprint = None
+        self._index_thread = None
+        self._stop = threading.Event()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    def _entry_size(self, query, answer, vector):
+        return vector.nbytes + len(query.encode('utf-8')) + len(answer.encode('utf-8'))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+        self._matrix = None
+
+    def _similarity_matrix(self):
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            self._matrix = (np.stack([self._entries[k]['embedding'] for k in self._matrix_keys])
+                            if self._matrix_keys else None)
+        return self._matrix
+
+    def lookup(self, embedding, scope=None):
+        """Return the best cached entry of this scope above the threshold as a dict with answer, query and
+        similarity, or None"""
+        vector = _normalize(embedding)
+        now = time.time()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if now - entry['created_at'] > self.ttl]
+            for key in expired:
+                self._remove(key)
+                self._stats['expirations'] += 1
+
+            matrix = self._similarity_matrix()
+            if matrix is None:
+                self._stats['misses'] += 1
+                return None
+
+            scores = matrix @ vector
+            candidates = [index for index in np.argsort(-scores) if scores[index] >= self.threshold
+                          and self._entries[self._matrix_keys[index]]['scope'] == scope]
+            if not candidates:
+                self._stats['misses'] += 1
+                return None
+
+            similarity = float(scores[candidates[0]])
+            key = self._matrix_keys[candidates[0]]
+            self._entries.move_to_end(key)
+            entry = self._entries[key]
+            entry['hits'] += 1
+            self._stats['hits'] += 1
+            return {'answer': entry['answer'], 'query': entry['query'], 'similarity': similarity}
+
+    def store(self, query, embedding, answer, scope=None):
+        """Cache an answer under a scope, evicting least recently used entries past the entry or memory cap"""
+        vector = _normalize(embedding)
+        size = self._entry_size(query, answer, vector)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = {
+                'query': query,
+                'answer': answer,
+                'embedding': vector,
+                'scope': scope,
+                'created_at': time.time(),
+                'size': size,
+                'hits': 0,
+            }
+            self._bytes += size
+            self._matrix = None
+            self._stats['stores'] += 1
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def invalidate_all(self, reason=""):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._matrix = None
+            self._stats['invalidations'] += 1
+        if reason:
+            print(f"Semantic cache cleared: {reason}")
+
+    def _check_index_version(self):
+        """Clear the cache when the incident_sop document counts changed since the last check"""
+        fingerprint = index_fingerprint()
+        if fingerprint is None:
+            return
+        if self._index_fingerprint is not None and fingerprint != self._index_fingerprint:
+            self.invalidate_all(f"{ELASTIC_INDEX} content changed")
+        self._index_fingerprint = fingerprint
+
+    def start_index_check(self, interval=None):
+        """Compare the index fingerprint on a daemon thread every index_check_interval seconds, keeping the
+        Elasticsearch stats call off the request path"""
+        if self._index_thread is not None:
+            return self._index_thread
+        interval = interval or self.index_check_interval
+
+        def _run():
+            while not self._stop.is_set():
+                try:
+                    self._check_index_version()
+                except Exception as e:
+                    print(f"Semantic cache index check failed: {str(e)}")
+                self._stop.wait(interval)
+
+        self._index_thread = threading.Thread(target=_run, name='semantic-cache-index-check', daemon=True)
+        self._index_thread.start()
+        return self._index_thread
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['threshold'] = self.threshold
+        stats['enabled'] = SEMANTIC_CACHE_ENABLED
+        return stats
+
+
+_cache = SemanticCache()
+
+
+def get_semantic_cache():
+    """Return the process-wide SOP answer cache"""
+    return _cache
@@ -0,0 +1,117 @@
+import importlib
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Cold start: the web server comes up with only Flask and the SQL pool; crewai, the agents and the embedding model
+# (torch) load on a background thread, and /readyz reports 503 until they have
+STARTUP_PRELOAD_ENABLED = True
+# Modules imported by the preload thread, in order; anything heavy the first question would otherwise pay for
+STARTUP_PRELOAD_MODULES = ('Crewai_agents',)
+
+_started = time.perf_counter()
+_started_at = datetime.now()
+_lock = threading.Lock()
+_phases = {}
+_components = {}
+_preload_thread = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _peak_rss_mb():
+    """Peak resident memory of the process in MB where the platform reports it (not on Windows)"""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def mark_phase(phase):
+    """Record that a startup phase finished, as seconds since this module was first imported"""
+    with _lock:
+        _phases.setdefault(phase, round(time.perf_counter() - _started, 3))
+
+
+def _set_component(name, state, seconds=None, error=None):
+    with _lock:
+        _components[name] = {'state': state, 'seconds': seconds, 'error': error}
+
+
+def _load(name, loader):
+    _set_component(name, 'loading')
+    start = time.perf_counter()
+    try:
+        loader()
+    except Exception as e:
+        _set_component(name, 'failed', round(time.perf_counter() - start, 3), str(e))
+        print(f"Preload of {name} failed: {str(e)}")
+        return False
+    _set_component(name, 'ready', round(time.perf_counter() - start, 3))
+    return True
+
+
+def _preload():
+    from embeddings import get_embedding_model
+
+    for module in STARTUP_PRELOAD_MODULES:
+        _load(module, lambda: importlib.import_module(module))
+    _load('embedding_model', get_embedding_model)
+    mark_phase('preload')
+    print(format_startup_report())
+
+
+def start_preload(background=True):
+    """Import the agents and load the embedding model, by default on a daemon thread so requests that need
+    neither (history, health) are served immediately"""
+    global _preload_thread
+    with _lock:
+        if _preload_thread is not None:
+            return _preload_thread
+        for module in STARTUP_PRELOAD_MODULES:
+            _components[module] = {'state': 'pending', 'seconds': None, 'error': None}
+        _components['embedding_model'] = {'state': 'pending', 'seconds': None, 'error': None}
+        _preload_thread = threading.Thread(target=_preload, name='startup-preload', daemon=True)
+    if background:
+        _preload_thread.start()
+    else:
+        _preload_thread.run()
+    return _preload_thread
+
+
+def is_preloaded():
+    """True once every preloaded component is ready (always, when preloading is off); a failed component keeps
+    the replica out of rotation"""
+    with _lock:
+        if not _components:
+            return not STARTUP_PRELOAD_ENABLED
+        return all(component['state'] == 'ready' for component in _components.values())
+
+
+def startup_report():
+    """Phase timings, per-component load state and time, and peak memory"""
+    with _lock:
+        phases = dict(_phases)
+        components = {name: dict(component) for name, component in _components.items()}
+    return {
+        'started_at': _started_at.isoformat(timespec='seconds'),
+        'uptime_seconds': round(time.perf_counter() - _started, 1),
+        'ready': is_preloaded(),
+        'phases': phases,
+        'components': components,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def format_startup_report():
+    report = startup_report()
+    phases = ', '.join(f"{phase} {seconds}s" for phase, seconds in report['phases'].items())
+    components = ', '.join(f"{name} {component['state']} ({component['seconds']}s)"
+                           for name, component in report['components'].items())
+    memory = f", peak RSS {report['peak_rss_mb']} MB" if report['peak_rss_mb'] is not None else ""
+    return f"Startup: {phases}; {components}{memory}"
@@ -0,0 +1,57 @@
+"""Shared fixtures: the benchmark's seeded SQLite stand-in for SQL Server, installed behind the app's pool"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark_fakes  # noqa: E402
+import chat_writer  # noqa: E402
+import db_pool  # noqa: E402
+import embeddings  # noqa: E402
+import es_client  # noqa: E402
+
+
+@pytest.fixture
+def incidents_db(tmp_path):
+    """Seed a SQLite file with synthetic incidents and chats and make it the process-wide pool; returns its path"""
+    path = str(tmp_path / 'incidents.db')
+    benchmark_fakes.seed_database(path, incidents=200, chats=5, turns_per_chat=8)
+    db_pool.set_pool(db_pool.ConnectionPool(path, connect=benchmark_fakes.SQLiteConnection))
+    yield path
+    db_pool.set_pool(None)
+
+
+@pytest.fixture
+def execute(incidents_db):
+    """Run one statement against the seeded database and commit it; returns the fetched rows, if any"""
+    def _execute(sql, params=()):
+        with db_pool.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall() if cursor.description else []
+            cursor.close()
+            conn.commit()
+        return rows
+    return _execute
+
+
+@pytest.fixture
+def client(incidents_db):
+    """The Flask app's test client over the seeded database, an in-memory SOP index and a zero-latency scripted LLM,
+    installed through the same seams benchmark.py uses"""
+    embedder = benchmark_fakes.HashingEmbedder()
+    embeddings.set_embedding_model(embedder)
+    es_client.set_es_client(benchmark_fakes.InMemoryKNNStore(benchmark_fakes.make_sop_chunks(), embedder))
+    import Crewai_agents
+    Crewai_agents.set_llm(benchmark_fakes.ScriptedLLM(latency_ms=0, jitter_ms=0))
+
+    from app import app
+    from query_cache import get_query_cache
+    from semantic_cache import get_semantic_cache
+    # Both caches are process-wide; start every test without answers left over from the last one
+    get_query_cache().invalidate_all()
+    get_semantic_cache().invalidate_all()
+    yield app.test_client()
+    chat_writer.sync_chat_history()
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+import Crewai_agents
+import router
+from entity_index import EntityIndex
+from Crewai_agents import RequestContext, run_fan_out, semantic_cache_scope
+from llm_budget import LLMBudgetExceeded, install_budget, request_budget
+
+HISTORY = "conversation summary:\n- Q: Who is handling INC000042? A: Charles Taylor"
+
+
+def _scope(question, history=HISTORY):
+    query = f"user query:\n{question}\n\n{history}\n" if history else f"user query:\n{question}"
+    return semantic_cache_scope(question, query)
+
+
+@pytest.fixture(autouse=True)
+def no_entities(monkeypatch):
+    monkeypatch.setattr(router, 'get_entity_index', lambda: EntityIndex())
+
+
+def test_questions_with_their_own_entities_ignore_the_history():
+    p1 = _scope("What is the P1 escalation procedure?")
+    assert p1 == (None, frozenset({('Severity', 'P1')}))
+    assert p1 == _scope("What is the P1 escalation procedure?", history=None)
+
+
+def test_p1_and_p2_questions_never_share_a_scope():
+    p1 = _scope("What is the P1 escalation procedure?")
+    p2 = _scope("What is the P2 escalation procedure?")
+    follow_up = _scope("What about for P2?")
+    assert len({p1, p2, follow_up}) == 3
+    assert follow_up[0] is not None and follow_up[1] == p2[1]
+
+
+def test_follow_ups_are_scoped_to_their_conversation():
+    question = "What about for P2?"
+    assert _scope(question)[0] != _scope(question, "conversation summary:\n- Q: P1 SLA? A: 4h")[0]
+    assert _scope(question, history=None)[0] is None
+
+
+class BranchLLM:
+    """Answers every call at once; stands in for the model behind both fan-out branches and the synthesis"""
+
+    def __init__(self):
+        self.calls = {'crew.data': 0, 'crew.sop': 0, 'synthesis': 0}
+
+    def call(self, messages, *args, **kwargs):
+        self.calls[kwargs.get('caller', 'synthesis')] += 1
+        return "Merged answer"
+
+
+@pytest.fixture
+def branches(monkeypatch):
+    """Fan-out branches whose crews are LLM call loops: a branch named in `slow` keeps calling until its budget
+    refuses, the others answer after one call. Returns (llm, slow, stopped events by branch)."""
+    llm = install_budget(BranchLLM())
+    slow = set()
+    stopped = {'crew.data': threading.Event(), 'crew.sop': threading.Event()}
+
+    def fake_run_single_agent(agent, description, span_name):
+        try:
+            llm.call(description, caller=span_name)
+            while span_name in slow:
+                time.sleep(0.01)
+                llm.call(description, caller=span_name)
+            return f"{span_name} answer"
+        finally:
+            stopped[span_name].set()
+
+    monkeypatch.setattr(Crewai_agents, 'get_agents', lambda: (None, None, None))
+    monkeypatch.setattr(Crewai_agents, 'get_llm', lambda: llm)
+    monkeypatch.setattr(Crewai_agents, 'run_single_agent', fake_run_single_agent)
+    monkeypatch.setattr(Crewai_agents, 'FAN_OUT_BRANCH_TIMEOUTS', {'data': 5, 'sop': 0.2})
+    return llm, slow, stopped
+
+
+def _fan_out(question="Who is on INC000042 and what is the escalation procedure?"):
+    with request_budget(max_calls=10 ** 6):
+        return run_fan_out(RequestContext(question), f"user query:\n{question}")
+
+
+def test_fan_out_merges_both_branches(branches):
+    llm, _, _ = branches
+    assert _fan_out() == "Merged answer"
+    assert llm.calls == {'crew.data': 1, 'crew.sop': 1, 'synthesis': 1}
+
+
+def test_timed_out_branch_is_cancelled_and_the_other_answer_returned(branches):
+    llm, slow, stopped = branches
+    slow.add('crew.sop')
+    started = time.monotonic()
+    answer = _fan_out()
+
+    assert time.monotonic() - started < 2
+    assert answer.startswith("crew.data answer")
+    assert "The SOP part of this question could not be answered" in answer
+    assert llm.calls['synthesis'] == 0
+
+    # The abandoned branch's next LLM call is refused, so it stops spending on a request that already answered
+    calls = llm.calls['crew.sop']
+    assert stopped['crew.sop'].wait(5)
+    assert llm.calls['crew.sop'] <= calls + 1
+
+
+def test_fan_out_raises_the_data_error_when_both_branches_fail(branches, monkeypatch):
+    def failing_run_single_agent(agent, description, span_name):
+        raise LLMBudgetExceeded(f"{span_name} failed")
+
+    monkeypatch.setattr(Crewai_agents, 'run_single_agent', failing_run_single_agent)
+    with pytest.raises(LLMBudgetExceeded, match="crew.data failed"):
+        _fan_out()
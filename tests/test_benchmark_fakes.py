@@ -0,0 +1,29 @@
+from benchmark_fakes import SQLiteConnection, translate_tsql
+
+
+def test_top_parameter_becomes_a_trailing_limit():
+    sql, params = translate_tsql("SELECT TOP (?) Incident_ID FROM Incidents WHERE Severity = ?", (5, 'P1'))
+    assert sql.split() == "SELECT Incident_ID FROM Incidents WHERE Severity = ? LIMIT ?".split()
+    assert params == ['P1', 5]
+
+
+def test_merge_becomes_an_upsert():
+    sql, params = translate_tsql(
+        "MERGE IncidentChats WITH (HOLDLOCK) AS target USING (SELECT ? AS ChatID) AS source ON target.ChatID = source.ChatID "
+        "WHEN MATCHED THEN UPDATE SET target.MessageCount = target.MessageCount + ? "
+        "WHEN NOT MATCHED THEN INSERT (ChatID, Title, MessageCount) VALUES (?, ?, ?);",
+        ('chat-1', 2, 'chat-1', "Title", 2))
+    assert sql.startswith("INSERT INTO IncidentChats (ChatID, Title, MessageCount) VALUES (?, ?, ?) ON CONFLICT(ChatID)")
+    assert params == ['chat-1', "Title", 2, 2]
+
+
+def test_set_rowcount_caps_rows_until_reset(incidents_db):
+    conn = SQLiteConnection(incidents_db)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET ROWCOUNT 7")
+        assert len(cursor.execute("SELECT Incident_ID FROM Incidents").fetchall()) == 7
+        cursor.execute("SET ROWCOUNT 0")
+        assert len(cursor.execute("SELECT Incident_ID FROM Incidents").fetchall()) == 200
+    finally:
+        conn.close()
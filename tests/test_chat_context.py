@@ -0,0 +1,33 @@
+from chat_context import build_chat_context, count_tokens, fit_to_budget, CONTEXT_RECENT_TURNS
+
+
+def test_context_keeps_recent_turns_and_summarizes_older_ones(execute):
+    # Seeded chats have 8 turns: the oldest 3 fall out of the recent window into the rolling summary
+    context = build_chat_context('bench-00000')
+    assert context.startswith("conversation summary:\n")
+    assert context.count("\nQuestion: ") == CONTEXT_RECENT_TURNS
+
+    summary, turns = execute("SELECT Summary, SummarizedTurns FROM IncidentChatSummary WHERE ChatID = ?",
+                             ('bench-00000',))[0]
+    assert turns == 8 - CONTEXT_RECENT_TURNS
+    assert summary.count("- Q: ") == turns
+
+
+def test_summary_is_only_extended_with_new_turns(execute):
+    build_chat_context('bench-00001')
+    build_chat_context('bench-00001')
+    assert execute("SELECT SummarizedTurns FROM IncidentChatSummary WHERE ChatID = ?",
+                   ('bench-00001',))[0][0] == 8 - CONTEXT_RECENT_TURNS
+
+
+def test_context_fits_the_token_budget():
+    turns = [{'question': f"Question {n}", 'response': "A long answer. " * 100} for n in range(5)]
+    context = fit_to_budget("- Q: earlier A: earlier answer", turns, budget=300)
+    assert count_tokens(context) <= 300
+    # The newest turns are the ones kept
+    assert "Question 4" in context
+    assert "Question 0" not in context
+
+
+def test_unknown_chat_has_no_context(incidents_db):
+    assert build_chat_context('no-such-chat') == ""
@@ -0,0 +1,52 @@
+from chat_writer import ChatHistoryWriter
+
+
+def test_sync_makes_queued_turns_visible(execute):
+    writer = ChatHistoryWriter(batch_size=50, flush_interval=60)
+    try:
+        for n in range(3):
+            assert writer.enqueue('chat-new', f"Question {n}", f"Answer {n}")
+        assert writer.sync('chat-new', timeout=5)
+        rows = execute("SELECT Question FROM IncidentChatHistory WHERE ChatID = ? ORDER BY DateTime", ('chat-new',))
+        assert [row[0] for row in rows] == ["Question 0", "Question 1", "Question 2"]
+        assert execute("SELECT Title, MessageCount FROM IncidentChats WHERE ChatID = ?",
+                       ('chat-new',)) == [("Question 0", 3)]
+        assert writer.stats()['batches'] == 1
+    finally:
+        writer.shutdown(timeout=5)
+
+
+def test_existing_chat_counts_are_incremented(execute):
+    writer = ChatHistoryWriter(batch_size=2, flush_interval=60)
+    try:
+        writer.enqueue('bench-00000', "Follow-up", "Answer")
+        writer.enqueue('bench-00000', "Another", "Answer")
+        assert writer.sync('bench-00000', timeout=5)
+        assert execute("SELECT MessageCount FROM IncidentChats WHERE ChatID = ?", ('bench-00000',)) == [(10,)]
+    finally:
+        writer.shutdown(timeout=5)
+
+
+def test_shutdown_drains_the_queue(execute):
+    writer = ChatHistoryWriter(batch_size=50, flush_interval=60)
+    writer.enqueue('chat-drain', "Question", "Answer")
+    writer.shutdown(timeout=5)
+    assert not writer.enqueue('chat-drain', "Too late", "Answer")
+    assert execute("SELECT COUNT(*) FROM IncidentChatHistory WHERE ChatID = ?", ('chat-drain',)) == [(1,)]
+
+
+def test_a_bad_row_only_drops_itself(execute):
+    writer = ChatHistoryWriter(batch_size=50, flush_interval=60, max_retries=1, retry_backoff=0)
+    try:
+        writer.enqueue('chat-bad', "Question 0", "Answer 0")
+        # SQLite cannot bind an arbitrary object, so this row fails every insert it is part of
+        writer.enqueue('chat-bad', "Question 1", object())
+        writer.enqueue('chat-bad', "Question 2", "Answer 2")
+        assert writer.sync('chat-bad', timeout=5)
+        rows = execute("SELECT Question FROM IncidentChatHistory WHERE ChatID = ? ORDER BY DateTime", ('chat-bad',))
+        assert [row[0] for row in rows] == ["Question 0", "Question 2"]
+        assert execute("SELECT MessageCount FROM IncidentChats WHERE ChatID = ?", ('chat-bad',)) == [(2,)]
+        stats = writer.stats()
+        assert (stats['written'], stats['dropped'], stats['retries']) == (2, 1, 1)
+    finally:
+        writer.shutdown(timeout=5)
@@ -0,0 +1,50 @@
+import pytest
+
+
+def _pages(client, limit):
+    pages = []
+    cursor = None
+    while True:
+        url = f'/conversations?limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_json()
+        pages.append(page['conversations'])
+        cursor = page['nextCursor']
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_chat_once_newest_first(client):
+    pages = _pages(client, limit=2)
+    assert [len(page) for page in pages] == [2, 2, 1]
+
+    chats = [chat for page in pages for chat in page]
+    assert len({chat['chatId'] for chat in chats}) == 5
+    assert all(chat['messageCount'] == 8 and chat['title'] for chat in chats)
+    order = [(chat['lastActivity'], chat['chatId']) for chat in chats]
+    assert order == sorted(order, reverse=True)
+
+
+def test_new_turn_moves_its_chat_to_the_first_page(client):
+    oldest = _pages(client, limit=5)[0][-1]
+    response = client.post('/query', json={'query': "What is the status of INC000042?", 'chatId': oldest['chatId']})
+    assert response.status_code == 200
+
+    first = client.get('/conversations?limit=1').get_json()['conversations'][0]
+    assert first['chatId'] == oldest['chatId']
+    assert first['messageCount'] == 9
+    assert first['lastActivity'] > oldest['lastActivity']
+
+
+@pytest.mark.parametrize('query', ['cursor=not-a-cursor', 'cursor=e30=', 'limit=ten'])
+def test_malformed_parameters_are_rejected(client, query):
+    response = client.get(f'/conversations?{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_limit_is_clamped(client, monkeypatch):
+    monkeypatch.setattr('app.CONVERSATIONS_MAX_PAGE_SIZE', 3)
+    assert len(client.get('/conversations?limit=1000').get_json()['conversations']) == 3
+    assert len(client.get('/conversations?limit=0').get_json()['conversations']) == 1
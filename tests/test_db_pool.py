@@ -0,0 +1,69 @@
+import pyodbc
+import pytest
+
+from benchmark_fakes import SQLiteConnection
+from db_pool import ConnectionPool, get_connection, get_pool, fetch_limited, strip_order_by
+
+
+def test_fetch_limited_caps_rows_and_counts_the_rest(incidents_db):
+    with get_connection() as conn:
+        columns, rows, total = fetch_limited(conn, "SELECT Incident_ID, Status FROM Incidents ORDER BY Incident_ID",
+                                             max_rows=20)
+    assert columns == ['Incident_ID', 'Status']
+    assert len(rows) == 20
+    assert total == 200
+
+
+def test_fetch_limited_skips_the_count_below_the_cap(incidents_db):
+    with get_connection() as conn:
+        _, rows, total = fetch_limited(conn, "SELECT Incident_ID FROM Incidents WHERE Incident_ID IN (?, ?)",
+                                       ('INC000001', 'INC000002'), max_rows=20)
+    assert total == len(rows) == 2
+
+
+def test_row_cap_does_not_leak_to_the_next_checkout(incidents_db):
+    with get_connection() as conn:
+        fetch_limited(conn, "SELECT Incident_ID FROM Incidents", max_rows=5)
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT Incident_ID FROM Incidents")
+        assert len(cursor.fetchall()) == 200
+    assert get_pool().metrics()['created'] == 1
+
+
+def test_strip_order_by_keeps_nested_ordering():
+    assert strip_order_by("SELECT * FROM Incidents ORDER BY Start_Time DESC;") == "SELECT * FROM Incidents"
+    sql = "SELECT * FROM (SELECT TOP 5 * FROM Incidents ORDER BY Start_Time) AS recent"
+    assert strip_order_by(sql) == sql
+
+
+class CountFailsConnection(SQLiteConnection):
+    """Seeded SQLite connection whose COUNT(*) queries fail with sqlstate"""
+    sqlstate = 'HYT00'
+
+    def cursor(self):
+        cursor = super().cursor()
+        execute = cursor.execute
+
+        def failing_execute(sql, params=()):
+            if 'COUNT(*)' in sql:
+                raise pyodbc.OperationalError(self.sqlstate, "[HYT00] Query timeout expired")
+            return execute(sql, params)
+        cursor.execute = failing_execute
+        return cursor
+
+
+class ConnectionLostOnCount(CountFailsConnection):
+    sqlstate = '08S01'
+
+
+@pytest.mark.parametrize('connect, discarded', [(CountFailsConnection, 0), (ConnectionLostOnCount, 1)])
+def test_failed_count_keeps_the_rows(incidents_db, connect, discarded):
+    pool = ConnectionPool(incidents_db, connect=connect)
+    with pool.connection() as conn:
+        columns, rows, total = fetch_limited(conn, "SELECT Incident_ID FROM Incidents", max_rows=20)
+    assert len(rows) == 20
+    assert total is None
+    # A timeout leaves the connection usable; a lost connection is dropped instead of going back to the pool
+    assert pool.metrics()['closed'] == discarded
+    assert pool.metrics()['idle'] == 1 - discarded
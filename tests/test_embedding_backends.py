@@ -0,0 +1,127 @@
+import types
+
+import numpy as np
+import pytest
+
+import embedding_backends
+import embeddings
+from benchmark_fakes import HashingEmbedder
+from embedding_backends import OnnxInt8Backend, check_parity, load_backend
+
+
+class FakeTokenizer:
+    """Whitespace tokenizer padding every batch to its longest text, like tokenizers with padding enabled"""
+
+    def encode_batch(self, texts):
+        width = max(len(text.split()) for text in texts)
+        encodings = []
+        for text in texts:
+            ids = [len(word) for word in text.split()]
+            padding = width - len(ids)
+            encodings.append(types.SimpleNamespace(ids=ids + [0] * padding, attention_mask=[1] * len(ids) + [0] * padding,
+                                                   type_ids=[0] * width))
+        return encodings
+
+
+class FakeSession:
+    """Token embedding i is [id, 1]; padding tokens get a large vector that pooling must ignore"""
+
+    def __init__(self):
+        self.batches = []
+
+    def run(self, outputs, inputs):
+        self.batches.append(len(inputs['input_ids']))
+        ids = inputs['input_ids'].astype(np.float32)
+        token_embeddings = np.stack([ids, np.ones_like(ids)], axis=-1)
+        token_embeddings[inputs['attention_mask'] == 0] = 1000.0
+        return [token_embeddings]
+
+
+def _onnx_backend():
+    backend = object.__new__(OnnxInt8Backend)
+    backend.session = FakeSession()
+    backend.input_names = ['input_ids', 'attention_mask']
+    backend.tokenizer = FakeTokenizer()
+    backend._dimension = None
+    return backend
+
+
+def test_onnx_backend_mean_pools_unpadded_tokens_and_normalizes():
+    backend = _onnx_backend()
+    vectors = backend.encode(["abc", "a abcde"], batch_size=1)
+    # "abc" pools to [3, 1]; "a abcde" to the mean of [1, 1] and [5, 1], i.e. [3, 1]
+    expected = np.array([3.0, 1.0]) / np.linalg.norm([3.0, 1.0])
+    assert vectors.shape == (2, 2) and vectors.dtype == np.float32
+    assert np.allclose(vectors, [expected, expected], atol=1e-6)
+    assert backend.session.batches == [1, 1]
+
+
+def test_onnx_backend_returns_a_vector_for_one_text_and_a_matrix_for_none():
+    backend = _onnx_backend()
+    assert backend.encode("a abcde").shape == (2,)
+    assert backend.get_sentence_embedding_dimension() == 2
+    assert backend.encode([]).shape == (0, 2)
+
+
+def test_onnx_backend_reports_a_missing_export(tmp_path):
+    pytest.importorskip('onnxruntime')
+    pytest.importorskip('tokenizers')
+    with pytest.raises(FileNotFoundError, match="embedding_backends.py export"):
+        OnnxInt8Backend(str(tmp_path))
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="Unknown embedding backend 'gpu'"):
+        load_backend('gpu')
+
+
+class MissingBackend:
+    name = 'onnx-int8'
+
+    def __init__(self):
+        raise FileNotFoundError("model_int8.onnx not found")
+
+
+class ReferenceBackend(HashingEmbedder):
+    name = 'torch'
+
+
+@pytest.fixture
+def unloaded_model(monkeypatch):
+    monkeypatch.setattr(embeddings, '_model', None)
+    monkeypatch.setattr(embeddings, '_stats', dict(embeddings._stats))
+    monkeypatch.setattr(embeddings, 'EMBEDDING_BACKEND', 'onnx-int8')
+    monkeypatch.setitem(embedding_backends.EMBEDDING_BACKENDS, 'onnx-int8', MissingBackend)
+    monkeypatch.setitem(embedding_backends.EMBEDDING_BACKENDS, 'torch', ReferenceBackend)
+
+
+def test_unavailable_backend_falls_back_to_torch(unloaded_model):
+    model = embeddings.get_embedding_model()
+    assert isinstance(model, ReferenceBackend)
+    stats = embeddings.get_embedding_stats()
+    assert stats['backend'] == 'torch'
+    assert stats['load_error'] == "onnx-int8: model_int8.onnx not found"
+
+
+def test_unavailable_backend_without_fallback_raises(unloaded_model, monkeypatch):
+    monkeypatch.setattr(embeddings, 'EMBEDDING_BACKEND_FALLBACK', None)
+    with pytest.raises(FileNotFoundError):
+        embeddings.get_embedding_model()
+    assert embeddings.get_embedding_stats()['load_error'] == "model_int8.onnx not found"
+
+
+class NoisyEmbedder(HashingEmbedder):
+    def encode(self, texts, batch_size=None, **kwargs):
+        vectors = super().encode(texts, batch_size, **kwargs)
+        return vectors + np.random.default_rng(0).normal(0, 0.5, vectors.shape).astype(np.float32)
+
+
+def test_parity_passes_for_the_same_model_and_fails_for_a_drifted_one():
+    reference = HashingEmbedder()
+    same = check_parity(HashingEmbedder(), reference, repeats=1)
+    assert same['passed'] and same['min_cosine'] == pytest.approx(1.0)
+    assert same['nearest_neighbour_agreement'] == 1.0
+
+    drifted = check_parity(NoisyEmbedder(), reference, repeats=1)
+    assert not drifted['passed']
+    assert drifted['min_cosine'] < 0.99
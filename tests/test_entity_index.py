@@ -0,0 +1,75 @@
+import pytest
+
+from entity_index import EntityIndex, EntityTrie
+
+
+def test_trie_fuzzy_matches_within_distance():
+    trie = EntityTrie()
+    for value in ('Payments', 'Shipping', 'Search'):
+        trie.insert(value.lower(), value)
+    assert trie.fuzzy('paymnts', 1) == {'Payments': 1}
+    assert trie.fuzzy('serch', 1) == {'Search': 1}
+    assert trie.fuzzy('billing', 2) == {}
+
+
+def test_resolve_corrects_typos(incidents_db):
+    index = EntityIndex()
+    index.refresh()
+    entities = index.resolve("Which incidents did Aisa Khan handle for Paymnts?")
+    assert [(entity['column'], entity['value']) for entity in entities] == [
+        ('On_Call_Engineer', 'Aisha Khan'), ('Service_Name', 'Payments')]
+
+
+def test_suggest_completes_later_words(incidents_db):
+    index = EntityIndex()
+    index.refresh()
+    fragment, suggestions = index.suggest("assigned to tay")
+    assert fragment == 'tay'
+    assert 'Charles Taylor' in [suggestion['value'] for suggestion in suggestions]
+
+
+def test_incremental_refresh_picks_up_changes_to_resolved_incidents(execute):
+    index = EntityIndex()
+    index.refresh()
+    incident_id = sorted(index._open_ids)[0]
+
+    execute("UPDATE Incidents SET Status = 'Resolved', On_Call_Engineer = 'Zed Newman' WHERE Incident_ID = ?",
+            (incident_id,))
+    index.refresh()
+
+    assert index.stats()['full_reloads'] == 1
+    assert incident_id not in index._open_ids
+    assert index._rows[incident_id][3] == 'Zed Newman'
+    assert [entity['value'] for entity in index.resolve("incidents handled by Zed Newmann")] == ['Zed Newman']
+
+
+def test_values_no_incident_uses_stop_resolving(execute):
+    index = EntityIndex()
+    index.refresh()
+    execute("UPDATE Incidents SET Service_Name = 'Payments' WHERE Service_Name = 'Billing'")
+    index.refresh(full=True)
+    assert index.resolve("incidents for Billing") == []
+
+
+@pytest.mark.parametrize('question', [
+    "Which incidents involve data loss?",
+    "How do I search for incidents by engineer?",
+    "Search incidents for Payments",
+    "Show incidents with identity problems",
+])
+def test_common_words_do_not_resolve_on_their_own(incidents_db, question):
+    index = EntityIndex()
+    index.refresh()
+    assert [entity['value'] for entity in index.resolve(question)] == (
+        ['Payments'] if 'Payments' in question else [])
+
+
+@pytest.mark.parametrize('question, value', [
+    ("Open incidents owned by Data", 'Data'),
+    ("Incidents for the data team", 'Data'),
+    ("Is the search service degraded?", 'Search'),
+])
+def test_single_words_resolve_when_capitalized_or_cued(incidents_db, question, value):
+    index = EntityIndex()
+    index.refresh()
+    assert [entity['value'] for entity in index.resolve(question)] == [value]
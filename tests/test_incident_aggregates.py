@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import incident_aggregates
+from incident_aggregates import IncidentAggregateStore, CLOSED_STATUSES
+
+
+def _open_incident_before_watermark(store):
+    return next(incident_id for incident_id, row in sorted(store._rows.items())
+                if row['Status'] not in CLOSED_STATUSES and row['Start_Time'] < store._watermark)
+
+
+def test_first_refresh_loads_every_incident(incidents_db):
+    store = IncidentAggregateStore()
+    snapshot = store.refresh()
+    assert snapshot['windows']['all']['overall']['incidents'] == 200
+    assert store.stats()['full_reloads'] == 1
+
+
+def test_incremental_refresh_picks_up_resolved_incidents(execute):
+    store = IncidentAggregateStore()
+    store.refresh()
+    open_before = store.query('all')['open']
+    incident_id = _open_incident_before_watermark(store)
+
+    execute("UPDATE Incidents SET Status = 'Resolved', MTTR_Minutes = 42 WHERE Incident_ID = ?", (incident_id,))
+    store.refresh()
+
+    assert store.stats()['full_reloads'] == 1
+    assert store._rows[incident_id]['Status'] == 'Resolved'
+    assert store._rows[incident_id]['MTTR_Minutes'] == 42
+    assert store.query('all')['open'] == open_before - 1
+
+
+def test_incremental_refresh_picks_up_new_incidents(execute):
+    store = IncidentAggregateStore()
+    store.refresh()
+    execute("INSERT INTO Incidents VALUES ('INC999999', 'Payments', 'P1', 'Open', 'New outage', 'Platform', "
+            "'Wei Chen', 'Wei Chen', ?, NULL, 1)", (datetime.now(),))
+    store.refresh()
+
+    assert store._rows['INC999999']['Severity'] == 'P1'
+    assert store.query('all')['incidents'] == 201
+
+
+def test_open_incidents_are_reread_in_chunks(execute, monkeypatch):
+    monkeypatch.setattr(incident_aggregates, 'INCREMENTAL_ID_CHUNK_SIZE', 3)
+    store = IncidentAggregateStore()
+    store.refresh()
+    execute("UPDATE Incidents SET Status = 'Closed' WHERE Status NOT IN ('Resolved', 'Closed')")
+    store.refresh()
+
+    assert store.query('all')['open'] == 0
+    assert store.query('all') == IncidentAggregateStore().refresh()['windows']['all']['overall']
+
+
+def test_filtered_queries_are_case_insensitive(incidents_db):
+    store = IncidentAggregateStore()
+    store.refresh()
+    by_severity = store.query('all', group_by='severity')
+    assert store.query('all', severity='p1')['incidents'] == by_severity['P1']['incidents']
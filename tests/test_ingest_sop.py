@@ -0,0 +1,125 @@
+import pytest
+from elasticsearch import helpers
+
+import embeddings
+import ingest_sop
+from benchmark_fakes import HashingEmbedder
+from ingest_sop import chunk_text, ingest
+
+WORDS = [f"step{number}" for number in range(25)]
+
+
+class FakeSOPIndex:
+    """The documents API slice ingest_sop uses (index create, mget, delete_by_query) over a dict of documents"""
+
+    def __init__(self):
+        self.docs = {}
+        self.mappings = None
+        self.indices = _Indices(self)
+
+    def mget(self, index=None, ids=(), source=True):
+        return {'docs': [{'_id': doc_id, 'found': doc_id in self.docs} for doc_id in ids]}
+
+    def delete_by_query(self, index=None, query=None, conflicts=None):
+        source = query['bool']['filter'][0]['term']['source']
+        keep = set(query['bool']['must_not'][0]['ids']['values'])
+        stale = [doc_id for doc_id, doc in self.docs.items() if doc['source'] == source and doc_id not in keep]
+        for doc_id in stale:
+            del self.docs[doc_id]
+        return {'deleted': len(stale)}
+
+    def sources(self):
+        return sorted(doc['chunk_id'] for doc in self.docs.values())
+
+
+class _Indices:
+    def __init__(self, store):
+        self.store = store
+
+    def exists(self, index=None):
+        return self.store.mappings is not None
+
+    def create(self, index=None, mappings=None):
+        self.store.mappings = mappings
+
+    def refresh(self, index=None):
+        pass
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        super().__init__(dimension=8)
+        self.encoded = 0
+
+    def encode(self, texts, batch_size=None, **kwargs):
+        self.encoded += 1 if isinstance(texts, str) else len(texts)
+        return super().encode(texts, batch_size, **kwargs)
+
+
+@pytest.fixture
+def es(monkeypatch):
+    store = FakeSOPIndex()
+
+    def parallel_bulk(client, actions, **kwargs):
+        for action in actions:
+            client.docs[action['_id']] = action['_source']
+            yield True, {'index': {'_id': action['_id']}}
+
+    monkeypatch.setattr(helpers, 'parallel_bulk', parallel_bulk)
+    monkeypatch.setattr(ingest_sop, 'get_es_client', lambda: store)
+    return store
+
+
+@pytest.fixture
+def embedder(monkeypatch):
+    embedder = CountingEmbedder()
+    monkeypatch.setattr(embeddings, '_model', embedder)
+    return embedder
+
+
+@pytest.fixture
+def sops(tmp_path):
+    (tmp_path / 'escalation.md').write_text(' '.join(WORDS), encoding='utf-8')
+    (tmp_path / 'review.txt').write_text("Post-incident reviews are due in five days", encoding='utf-8')
+    (tmp_path / 'diagram.png').write_bytes(b'\x89PNG')
+    return tmp_path
+
+
+def _ingest(path):
+    return ingest(str(path), chunk_words=10, overlap_words=2, batch_size=2, workers=1)
+
+
+def test_chunks_overlap_and_cover_the_text():
+    chunks = chunk_text(' '.join(WORDS), chunk_words=10, overlap_words=2)
+    assert [chunk.split()[0] for chunk in chunks] == ['step0', 'step8', 'step16']
+    assert chunks[-1].split()[-1] == 'step24'
+    assert chunk_text("   ") == []
+
+
+def test_first_ingest_creates_the_index_and_indexes_every_chunk(es, embedder, sops):
+    stats = _ingest(sops)
+    assert (stats['indexed'], stats['skipped'], stats['deleted'], stats['failed']) == (4, 0, 0, 0)
+    assert es.mappings['properties']['content_embedding']['dims'] == 8
+    assert es.sources() == ['escalation.md#0', 'escalation.md#1', 'escalation.md#2', 'review.txt#0']
+
+
+def test_unchanged_chunks_are_skipped_without_encoding(es, embedder, sops):
+    _ingest(sops)
+    encoded = embedder.encoded
+    stats = _ingest(sops)
+    assert (stats['indexed'], stats['skipped'], stats['deleted']) == (0, 4, 0)
+    assert embedder.encoded == encoded
+
+
+def test_edited_document_replaces_only_its_changed_chunks(es, embedder, sops):
+    _ingest(sops)
+    encoded = embedder.encoded
+    (sops / 'escalation.md').write_text(' '.join(WORDS[:12]), encoding='utf-8')
+    stats = _ingest(sops)
+
+    # The first window is unchanged; the new tail is indexed and the two old windows are deleted
+    assert (stats['indexed'], stats['skipped'], stats['deleted']) == (1, 2, 2)
+    assert embedder.encoded == encoded + 1
+    assert es.sources() == ['escalation.md#0', 'escalation.md#1', 'review.txt#0']
+    assert [doc['content'] for doc in es.docs.values() if doc['chunk_id'] == 'escalation.md#1'] == [
+        ' '.join(WORDS[8:12])]
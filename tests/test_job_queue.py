@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+
+from job_queue import JobManager, JobQueueFull, JOB_MAX_DEADLINE, JOB_MIN_DEADLINE
+from llm_budget import request_budget, install_budget, LLMBudgetExceeded
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=1, max_queue_depth=1, default_deadline=30)
+    yield manager
+    manager.shutdown(timeout=5)
+
+
+def test_job_runs_and_records_its_events(manager):
+    def work(job, value):
+        job.emit('step', {'value': value})
+        return value * 2
+
+    job = manager.submit(work, 21)
+    assert job.wait(5)
+    assert job.status == 'succeeded'
+    assert job.result == 42
+    assert job.events == [('step', {'value': 21}), ('done', 42)]
+
+
+@pytest.mark.parametrize('requested, expected', [
+    (None, 30),
+    (-5, JOB_MIN_DEADLINE),
+    (0.2, JOB_MIN_DEADLINE),
+    (10 ** 6, JOB_MAX_DEADLINE),
+    (45, 45),
+])
+def test_deadlines_are_clamped(manager, requested, expected):
+    job = manager.submit(lambda job: None, deadline_seconds=requested)
+    assert job.deadline - job.created_at == pytest.approx(expected)
+
+
+def test_full_queue_rejects_work(manager):
+    release = threading.Event()
+    running = manager.submit(lambda job: release.wait(5))
+    while running.status == 'queued':
+        running.wait(0.01)
+    manager.submit(lambda job: None)
+    try:
+        with pytest.raises(JobQueueFull):
+            manager.submit(lambda job: None)
+        assert manager.stats()['rejected'] == 1
+    finally:
+        release.set()
+
+
+def test_failed_job_reports_its_error(manager):
+    def fail(job):
+        raise ValueError("no such incident")
+
+    job = manager.submit(fail)
+    assert job.wait(5)
+    assert job.status == 'failed'
+    assert job.error == "no such incident"
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def call(self, messages, *args, **kwargs):
+        self.calls += 1
+        return "Thought: still working"
+
+
+def _wait_until_idle(manager):
+    for _ in range(500):
+        if manager.stats()['running'] == 0:
+            return
+        time.sleep(0.01)
+    raise AssertionError("worker never stopped")
+
+
+def _crew_until_stopped(llm, started, step_seconds=0.01):
+    """Job body standing in for a crew: LLM calls in a loop until the request budget refuses one"""
+    def work(job):
+        with request_budget(max_calls=10 ** 6) as budget:
+            job.on_cancel(budget.cancel)
+            try:
+                while True:
+                    llm.call("next step")
+                    started.set()
+                    time.sleep(step_seconds)
+            except LLMBudgetExceeded as e:
+                return str(e)
+    return work
+
+
+def test_cancelled_job_makes_no_more_llm_calls(manager):
+    llm = install_budget(CountingLLM())
+    started = threading.Event()
+    job = manager.submit(_crew_until_stopped(llm, started))
+    assert started.wait(5)
+
+    manager.cancel(job.id)
+    calls = llm.calls
+    _wait_until_idle(manager)
+
+    assert job.status == 'cancelled'
+    # Only the call already in flight when the job was cancelled may complete
+    assert llm.calls <= calls + 1
+    assert manager.stats()['succeeded'] == 0
+
+
+def test_expired_job_makes_no_more_llm_calls(manager):
+    llm = install_budget(CountingLLM())
+    started = threading.Event()
+    job = manager.submit(_crew_until_stopped(llm, started), deadline_seconds=JOB_MIN_DEADLINE)
+    assert job.wait(5)
+    calls = llm.calls
+    _wait_until_idle(manager)
+
+    assert job.status == 'expired'
+    assert llm.calls <= calls + 1
+
+
+def test_on_cancel_runs_at_once_for_a_cancelled_job(manager):
+    release = threading.Event()
+    job = manager.submit(lambda job: release.wait(5))
+    manager.cancel(job.id)
+    reasons = []
+    job.on_cancel(reasons.append)
+    release.set()
+    assert reasons == ['Cancelled by client']
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from llm_budget import (BranchBudget, LLMBudgetExceeded, RequestBudget, LLM_BUDGET_DEADLINE_MARGIN, branch_budget,
+                        current_budget, install_budget, request_budget)
+
+
+class EchoLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def call(self, messages, *args, **kwargs):
+        self.calls += 1
+        return "Final Answer: done"
+
+
+def test_calls_past_the_limit_are_refused():
+    llm = install_budget(EchoLLM())
+    with request_budget(max_calls=2) as budget:
+        llm.call("first")
+        llm.call("second")
+        with pytest.raises(LLMBudgetExceeded, match="calls limit of 2"):
+            llm.call("third")
+    assert llm.calls == 2
+    assert budget.usage()['exhausted'] == "calls limit of 2 reached"
+
+
+def test_prompt_that_would_pass_the_token_limit_is_refused():
+    llm = install_budget(EchoLLM())
+    with request_budget(max_tokens=50) as budget:
+        llm.call("short question")
+        with pytest.raises(LLMBudgetExceeded, match="tokens limit"):
+            llm.call("word " * 100)
+    assert llm.calls == 1
+    assert 0 < budget.usage()['tokens'] <= 50
+
+
+def test_no_calls_start_after_the_deadline():
+    budget = RequestBudget(deadline_seconds=0)
+    with pytest.raises(LLMBudgetExceeded, match="deadline"):
+        budget.charge_call("too late")
+    # Once exhausted a budget stays exhausted, whatever the limit that ran out
+    with pytest.raises(LLMBudgetExceeded, match="deadline"):
+        budget.charge_call("still too late")
+
+
+def test_job_deadline_caps_the_budget_with_a_margin():
+    with request_budget(deadline=time.time() + LLM_BUDGET_DEADLINE_MARGIN + 10) as budget:
+        assert budget.usage()['limits']['seconds'] == pytest.approx(10, abs=0.5)
+
+
+def test_cancel_refuses_further_calls():
+    llm = install_budget(EchoLLM())
+    with request_budget() as budget:
+        llm.call("first")
+        budget.cancel("Cancelled by client")
+        with pytest.raises(LLMBudgetExceeded, match="Cancelled by client"):
+            llm.call("second")
+    assert llm.calls == 1
+
+
+def test_branch_charges_the_request_and_stops_on_its_own():
+    with request_budget(max_calls=10) as budget:
+        branch = branch_budget()
+        branch.charge_call("from the branch")
+        branch.cancel("branch timed out")
+        with pytest.raises(LLMBudgetExceeded, match="branch timed out"):
+            branch.charge_call("after the timeout")
+        # The request itself can still make calls
+        budget.charge_call("from the request")
+    assert budget.calls == 2
+
+
+def test_branch_deadline_cancels_it():
+    branch = BranchBudget(RequestBudget(), deadline_seconds=0)
+    with pytest.raises(LLMBudgetExceeded, match="branch deadline reached"):
+        branch.charge_call("too late")
+    assert branch.parent.calls == 0
+
+
+def test_install_budget_is_idempotent_and_free_outside_a_request():
+    llm = install_budget(EchoLLM())
+    call = llm.call
+    assert install_budget(llm).call is call
+    assert current_budget() is None and branch_budget() is None
+    for _ in range(20):
+        llm.call("no request running")
+    assert llm.calls == 20
+
+
+def test_install_budget_rejects_llms_without_call():
+    with pytest.raises(RuntimeError, match="no call"):
+        install_budget(object())
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+from elasticsearch import helpers
+
+import local_index
+from local_index import LocalSOPIndex
+
+CHUNKS = [
+    ("sop-1", "Escalate P1 incidents to the duty manager within 15 minutes", [1.0, 0.0, 0.0]),
+    ("sop-2", "Post-incident reviews are due within five business days", [0.0, 1.0, 0.0]),
+    ("sop-3", "Rotate certificates a week before they expire", [0.0, 0.0, 1.0]),
+]
+
+
+@pytest.fixture
+def source(monkeypatch):
+    """The Elasticsearch index the local index mirrors: its hits and the fingerprint it reports"""
+    state = {'hits': list(CHUNKS), 'fingerprint': ('incident_sop', 3)}
+
+    def scan(client, index=None, query=None, _source=None):
+        for chunk_id, content, embedding in state['hits']:
+            yield {'_source': {'chunk_id': chunk_id, 'content': content, 'source': 'sop.pdf',
+                               'content_embedding': list(embedding)}}
+
+    monkeypatch.setattr(helpers, 'scan', scan)
+    monkeypatch.setattr(local_index, 'get_es_client', lambda: None)
+    monkeypatch.setattr(local_index, 'index_fingerprint', lambda: state['fingerprint'])
+    return state
+
+
+def test_sync_mirrors_the_index_and_ranks_by_both_scores(tmp_path, source):
+    index = LocalSOPIndex(str(tmp_path))
+    assert index.sync()
+    assert index.is_ready()
+    results = index.search([0.9, 0.1, 0.0], "escalate a P1 incident", k=2)
+    assert [result['chunk_id'] for result in results] == ['sop-1', 'sop-2']
+    assert results[0]['score'] > results[1]['score']
+
+
+def test_unchanged_fingerprint_skips_the_sync(tmp_path, source):
+    index = LocalSOPIndex(str(tmp_path))
+    assert index.sync()
+    source['hits'] = []
+    assert not index.sync()
+    assert index.stats()['chunks'] == 3
+
+
+def test_resync_replaces_the_snapshot_and_removes_the_old_one(tmp_path, source):
+    index = LocalSOPIndex(str(tmp_path))
+    index.sync()
+    first = index.stats()['version']
+    source['hits'] = CHUNKS[:1]
+    source['fingerprint'] = ('incident_sop', 1)
+    index.sync(force=True)
+
+    version = index.stats()['version']
+    assert version != first
+    assert sorted(os.listdir(tmp_path)) == [f'chunks-{version}.json', 'current.json', f'embeddings-{version}.npy']
+    reloaded = LocalSOPIndex(str(tmp_path))
+    assert reloaded.load()
+    assert reloaded.stats()['chunks'] == 1
+
+
+def test_empty_index_syncs_to_an_empty_snapshot(tmp_path, source):
+    index = LocalSOPIndex(str(tmp_path))
+    source['hits'] = []
+    assert index.sync()
+    assert not index.is_ready()
+    assert index.search([1.0, 0.0, 0.0], "escalation") == []
+
+    reloaded = LocalSOPIndex(str(tmp_path))
+    assert reloaded.load()
+    assert reloaded.stats()['chunks'] == 0
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+QUESTIONS = [
+    "What is the status of INC000042?",
+    "Who is handling INC000007?",
+    "Show all open P1 incidents",
+]
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line.strip()]
+
+
+def test_batch_streams_one_item_per_question_then_the_summary(client):
+    response = client.post('/query-batch', json={'queries': QUESTIONS})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+
+    lines = _lines(response)
+    assert lines[0]['type'] == 'accepted' and lines[0]['count'] == 3
+    items = [line for line in lines if line['type'] == 'item']
+    assert sorted(item['index'] for item in items) == [0, 1, 2]
+    assert all('error' not in item for item in items)
+    by_index = {item['index']: item for item in items}
+    assert by_index[0]['route'] == by_index[1]['route'] == 'incident_lookup'
+    assert 'INC000042' in by_index[0]['response']
+    assert by_index[2]['route'] == 'incident_filter'
+
+    done = lines[-1]
+    assert done['type'] == 'done'
+    assert (done['count'], done['answered'], done['failed']) == (3, 3, 0)
+    # Both ID questions were answered from one combined lookup, and the items are not repeated in the summary
+    assert done['prefetch']['incident_ids'] == 2
+    assert 'items' not in done
+
+
+@pytest.mark.parametrize('body', [
+    {'queries': []},
+    {'queries': "What is the status of INC000042?"},
+    {'queries': ["What is the status of INC000042?", "  "]},
+    {'queries': ["What is the status of INC000042?", 42]},
+])
+def test_invalid_batches_are_rejected(client, body):
+    response = client.post('/query-batch', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_oversized_batches_are_rejected(client, monkeypatch):
+    monkeypatch.setattr('app.BATCH_MAX_QUESTIONS', 2)
+    response = client.post('/query-batch', json={'queries': QUESTIONS})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'At most 2 questions per batch'
@@ -0,0 +1,70 @@
+import pytest
+
+from query_cache import QueryCache, is_read_only, normalize_sql
+
+
+@pytest.mark.parametrize('sql, read_only', [
+    ("SELECT * FROM Incidents", True),
+    ("  select Incident_ID from Incidents", True),
+    ("WITH recent AS (SELECT * FROM Incidents) SELECT * FROM recent", True),
+    ("UPDATE Incidents SET Status = 'Closed'", False),
+    ("DELETE FROM Incidents WHERE Incident_ID = 'INC000001'", False),
+    ("EXEC sp_who", False),
+    ("SELECTED_VIEW", False),
+])
+def test_only_reads_are_cacheable(sql, read_only):
+    assert is_read_only(sql) is read_only
+
+
+def test_normalize_sql_folds_case_and_spacing_outside_literals():
+    assert normalize_sql("select *\n  from Incidents where Status = 'In  Progress';") == \
+        "SELECT * FROM INCIDENTS WHERE STATUS = 'In  Progress'"
+    assert QueryCache.make_key("select * from Incidents") == QueryCache.make_key("SELECT *  FROM incidents;")
+    assert normalize_sql("SELECT 'it''s open'") == "SELECT 'it''s open'"
+
+
+def test_expired_entries_miss():
+    cache = QueryCache(ttl=-1)
+    key = QueryCache.make_key("SELECT * FROM Incidents")
+    cache.store(key, ['Incident_ID'], [('INC000001',)], 1)
+    assert cache.lookup(key) is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    keys = [QueryCache.make_key(f"SELECT * FROM Incidents WHERE Severity = 'P{n}'") for n in (1, 2, 3)]
+    cache.store(keys[0], ['Severity'], [('P1',)], 1)
+    cache.store(keys[1], ['Severity'], [('P2',)], 1)
+    assert cache.lookup(keys[0]) is not None
+    cache.store(keys[2], ['Severity'], [('P3',)], 1)
+
+    assert cache.lookup(keys[1]) is None
+    assert cache.lookup(keys[0]) == (['Severity'], [('P1',)], 1)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidate_incident_drops_results_that_name_or_contain_it():
+    cache = QueryCache()
+    by_param = QueryCache.make_key("SELECT * FROM Incidents WHERE Incident_ID = ?", ('inc000042',))
+    by_literal = QueryCache.make_key("SELECT Status FROM Incidents WHERE Incident_ID = 'INC000042'")
+    by_row = QueryCache.make_key("SELECT Incident_ID FROM Incidents WHERE Status = 'Open'")
+    unrelated = QueryCache.make_key("SELECT Incident_ID FROM Incidents WHERE Status = 'Closed'")
+    cache.store(by_param, ['Incident_ID', 'Status'], [('INC000042', 'Open')], 1)
+    cache.store(by_literal, ['Status'], [('Open',)], 1)
+    cache.store(by_row, ['Incident_ID'], [('INC000007',), ('INC000042',)], 2)
+    cache.store(unrelated, ['Incident_ID'], [('INC000001',)], 1)
+
+    assert cache.invalidate_incident('INC000042') == 3
+    assert [cache.lookup(key) for key in (by_param, by_literal, by_row)] == [None, None, None]
+    assert cache.lookup(unrelated) is not None
+    assert cache.stats()['incidents_tracked'] == 1
+
+
+def test_invalidate_all_empties_the_cache():
+    cache = QueryCache()
+    key = QueryCache.make_key("SELECT * FROM Incidents WHERE Incident_ID = ?", ('INC000001',))
+    cache.store(key, ['Incident_ID'], [('INC000001',)], 1)
+    cache.invalidate_all()
+    assert cache.lookup(key) is None
+    assert cache.stats()['entries'] == cache.stats()['incidents_tracked'] == 0
@@ -0,0 +1,132 @@
+import pytest
+
+import router
+from db_pool import get_connection, fetch_limited
+from entity_index import EntityIndex
+
+
+@pytest.fixture
+def no_entities(monkeypatch):
+    """An entity index that was never refreshed, so no names resolve"""
+    monkeypatch.setattr(router, 'get_entity_index', lambda: EntityIndex())
+
+
+@pytest.fixture
+def entities(incidents_db, monkeypatch):
+    index = EntityIndex()
+    index.refresh()
+    monkeypatch.setattr(router, 'get_entity_index', lambda: index)
+    return index
+
+
+def test_incident_ids_are_looked_up_directly(no_entities):
+    route = router.route_query("What is the status of inc000042 and INC000007?")
+    assert route['path'] == 'incident_lookup'
+    assert route['params'] == ('INC000007', 'INC000042')
+
+
+@pytest.mark.parametrize('question', [
+    "Who is handling INC000042?",
+    "Did INC000042 breach SLA?",
+    "Give me the details and escalation contact of INC000042",
+])
+def test_incident_questions_answered_by_the_row_take_the_lookup(no_entities, question):
+    route = router.route_query(question)
+    assert route['path'] == 'incident_lookup'
+    assert 'Issue_Description' in route['sql']
+
+
+@pytest.mark.parametrize('question', [
+    "Why did INC000229 breach SLA?",
+    "Compare MTTR of INC000229 and INC000230",
+])
+def test_incident_questions_needing_more_than_the_row_go_to_the_manager(no_entities, question):
+    assert router.route_query(question)['path'] == 'manager'
+
+
+def test_incident_ids_with_procedure_take_the_mixed_path(no_entities):
+    assert router.route_query("Who is on INC000042 and what is the escalation procedure?")['path'] == 'mixed'
+
+
+@pytest.mark.parametrize('question', [
+    "What is the escalation procedure for a major outage?",
+    "How do I declare an incident?",
+])
+def test_procedure_questions_go_to_the_sop_agent(no_entities, question):
+    assert router.route_query(question)['path'] == 'sop'
+
+
+@pytest.mark.parametrize('question', [
+    "What is the escalation procedure for P1 incidents?",
+    "Who is the escalation contact for the payments service?",
+    "Show all incidents escalated to Charles Taylor",
+    "What are the steps taken on the Payments service this week?",
+])
+def test_procedure_wording_with_data_cues_goes_to_the_manager(entities, question):
+    assert router.route_query(question)['path'] == 'manager'
+
+
+@pytest.mark.parametrize('question, params', [
+    ("Show all open P1 incidents", ('Open', 'P1')),
+    ("Which incidents have breached SLA?", ()),
+    ("List incidents assigned to Charles Taylor", ('Charles Taylor',)),
+    ("Show me all incidents in progress", ('In Progress',)),
+])
+def test_listing_questions_explained_by_filters_take_the_fast_path(no_entities, question, params):
+    route = router.route_query(question)
+    assert route['path'] == 'incident_filter'
+    assert route['params'] == params
+
+
+@pytest.mark.parametrize('question', [
+    "Show all incidents that are not closed",
+    "Show all incidents that aren't closed",
+    "List open incidents except P4",
+    "List P1 incidents without an owner",
+    "How many P1 incidents were resolved last week?",
+    "Show P1 incidents opened since Monday",
+    "Which incidents are open for Payments?",
+    "Show open or resolved incidents",
+])
+def test_listing_questions_with_unmatched_conditions_go_to_the_manager(no_entities, question):
+    assert router.route_query(question)['path'] == 'manager'
+
+
+def test_resolved_service_names_become_filters(entities):
+    route = router.route_query("Which incidents are open for Paymnts?")
+    assert route['path'] == 'incident_filter'
+    assert route['params'] == ('Open', 'Payments')
+
+
+def test_misspelled_engineer_resolves_to_the_stored_name(entities):
+    route = router.route_query("List incidents assigned to Aisa Khan")
+    assert route['params'] == ('Aisha Khan',)
+
+
+def test_fast_path_sql_returns_only_matching_rows(entities):
+    route = router.route_query("Show all open P2 incidents for the Payments service")
+    assert route['path'] == 'incident_filter'
+    with get_connection() as conn:
+        columns, rows, _ = fetch_limited(conn, route['sql'], route['params'], max_rows=500)
+    assert rows
+    records = [dict(zip(columns, row)) for row in rows]
+    assert {(r['Status'], r['Severity'], r['Service_Name']) for r in records} == {('Open', 'P2', 'Payments')}
+
+
+def test_question_entities_tell_severities_apart(no_entities):
+    p1 = router.question_entities("What is the P1 escalation procedure?")
+    p2 = router.question_entities("What is the P2 escalation procedure?")
+    assert p1 == frozenset({('Severity', 'P1')})
+    assert p1 != p2
+
+
+@pytest.mark.parametrize('question, follow_up', [
+    ("What is the P1 escalation procedure?", False),
+    ("Who is handling INC000042?", False),
+    ("What about for P2?", True),
+    ("And P3?", True),
+    ("Who owns it?", True),
+    ("What is the escalation procedure?", True),
+])
+def test_follow_ups_lean_on_earlier_turns(no_entities, question, follow_up):
+    assert router.is_follow_up(question) is follow_up
@@ -0,0 +1,44 @@
+import numpy as np
+
+from semantic_cache import SemanticCache
+
+P1 = (None, frozenset({('Severity', 'P1')}))
+P2 = (None, frozenset({('Severity', 'P2')}))
+
+
+def _vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_close_question_with_the_same_scope_hits():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("P1 escalation procedure", _vector(1, 0, 0), "Page the incident commander", P1)
+    hit = cache.lookup(_vector(0.98, 0.05, 0), P1)
+    assert hit['answer'] == "Page the incident commander"
+    assert hit['similarity'] > 0.9
+
+
+def test_close_question_about_other_entities_misses():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("P1 escalation procedure", _vector(1, 0, 0), "Page the incident commander", P1)
+    assert cache.lookup(_vector(1, 0, 0), P2) is None
+    assert cache.lookup(_vector(1, 0, 0), ('conversation-hash', P1[1])) is None
+    assert cache.stats()['misses'] == 2
+
+
+def test_best_entry_of_the_matching_scope_wins():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("P1 escalation procedure", _vector(1, 0, 0), "P1 answer", P1)
+    cache.store("P2 escalation procedure", _vector(0.97, 0.1, 0), "P2 answer", P2)
+    assert cache.lookup(_vector(1, 0, 0), P2)['answer'] == "P2 answer"
+
+
+def test_entries_past_the_cap_are_evicted_least_recently_used_first():
+    cache = SemanticCache(threshold=0.9, max_entries=2)
+    cache.store("a", _vector(1, 0, 0), "A")
+    cache.store("b", _vector(0, 1, 0), "B")
+    cache.lookup(_vector(1, 0, 0))
+    cache.store("c", _vector(0, 0, 1), "C")
+    assert cache.lookup(_vector(0, 1, 0)) is None
+    assert cache.lookup(_vector(1, 0, 0))['answer'] == "A"
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+import startup
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('crewai', 'torch', 'sentence_transformers', 'onnxruntime')
+
+
+def _component(state):
+    return {'state': state, 'seconds': None, 'error': None}
+
+
+def test_readyz_waits_for_every_component(client, monkeypatch):
+    components = {'Crewai_agents': _component('ready'), 'embedding_model': _component('loading')}
+    monkeypatch.setattr(startup, '_components', components)
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json()['components']['embedding_model']['state'] == 'loading'
+
+    components['embedding_model'] = _component('ready')
+    assert client.get('/readyz').status_code == 200
+    assert client.get('/healthz').status_code == 200
+
+
+def test_failed_component_keeps_the_replica_unready(monkeypatch):
+    monkeypatch.setattr(startup, '_components', {})
+
+    def load():
+        raise ImportError("No module named 'torch'")
+
+    assert startup._load('embedding_model', load) is False
+    assert startup._load('Crewai_agents', lambda: None) is True
+    assert startup.startup_report()['components']['embedding_model']['error'] == "No module named 'torch'"
+    assert not startup.is_preloaded()
+
+
+def test_app_starts_without_importing_crewai_or_torch():
+    # Preloading and the background refreshes are switched off, so only the import of app.py itself is measured
+    code = (
+        "import sys, startup, incident_aggregates, entity_index, semantic_cache\n"
+        "startup.STARTUP_PRELOAD_ENABLED = False\n"
+        "incident_aggregates.AGGREGATES_ENABLED = entity_index.ENTITY_INDEX_ENABLED = False\n"
+        "semantic_cache.SEMANTIC_CACHE_ENABLED = False\n"
+        "import app\n"
+        f"print('heavy:' + ','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert 'heavy:' in result.stdout.splitlines()
@@ -0,0 +1,60 @@
+import json
+import threading
+
+from job_queue import get_job_manager
+
+
+def _events(body):
+    """Parse Server-Sent Events frames into (event, data) pairs, skipping comments"""
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_query_stream_sends_steps_then_the_answer(client):
+    response = client.post('/query-stream', json={'query': "What is the status of INC000042?", 'chatId': 'chat-sse'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    events = _events(response.get_data(as_text=True))
+    names = [event for event, _ in events]
+    assert names[-1] == 'done' and names.count('done') == 1
+    steps = [data for event, data in events if event == 'step']
+    assert steps and steps[0]['agent'] == 'Router'
+    done = events[-1][1]
+    assert done['chatId'] == 'chat-sse'
+    assert 'INC000042' in done['response']
+    assert len(done['process_flow']) == len(steps)
+
+
+def test_query_stream_validates_before_streaming(client):
+    response = client.post('/query-stream', json={'query': "What is the status of INC000042?"})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Chat ID missing'}
+
+
+def test_job_stream_sends_keep_alives_while_the_job_works(client, monkeypatch):
+    monkeypatch.setattr('app.STREAM_KEEPALIVE_SECONDS', 0.01)
+    release = threading.Event()
+
+    def work(job):
+        job.emit('step', {'agent': 'Manager Agent'})
+        release.wait(5)
+        return {'response': 'finished'}
+
+    job = get_job_manager().submit(work)
+    response = client.get(f'/jobs/{job.id}/stream', buffered=False)
+    chunks = []
+    for chunk in response.iter_encoded():
+        chunks.append(chunk.decode())
+        if chunk.startswith(b": keep-alive"):
+            release.set()
+    response.close()
+
+    body = ''.join(chunks)
+    assert ": keep-alive\n\n" in body
+    assert _events(body) == [('step', {'agent': 'Manager Agent'}), ('done', {'response': 'finished'})]
@@ -0,0 +1,82 @@
+import pytest
+
+from tracing import MetricsRegistry, get_metrics, set_trace_attribute, span, trace_request
+
+
+def test_spans_nest_under_the_current_span():
+    with trace_request() as trace:
+        with span('tool.get_sql_data_tool'):
+            with span('db.query', rows=3):
+                pass
+        with span('es.search'):
+            pass
+
+    request, tool, query, search = trace.to_list()
+    assert [record['name'] for record in (request, tool, query, search)] == [
+        'request', 'tool.get_sql_data_tool', 'db.query', 'es.search']
+    assert request['parent'] is None
+    assert tool['parent'] == search['parent'] == request['id']
+    assert query['parent'] == tool['id']
+    assert query['rows'] == 3
+    assert all(record['status'] == 'ok' and record['duration_ms'] >= 0 for record in trace.to_list())
+
+
+def test_failed_block_marks_its_span_and_the_request():
+    errors_before = _counter('requests_total', route='unknown', status='error')
+    with pytest.raises(ValueError):
+        with trace_request() as trace:
+            with span('llm.call'):
+                raise ValueError("model unavailable")
+
+    assert [record['status'] for record in trace.to_list()] == ['error', 'error']
+    assert _counter('requests_total', route='unknown', status='error') == errors_before + 1
+
+
+def test_request_metrics_are_labelled_with_the_route():
+    before = _counter('requests_total', route='incident_lookup', status='ok')
+    with trace_request():
+        set_trace_attribute('route', 'incident_lookup')
+    assert _counter('requests_total', route='incident_lookup', status='ok') == before + 1
+
+
+def test_render_produces_cumulative_histograms_and_labelled_gauges():
+    registry = MetricsRegistry(prefix='test')
+    registry.inc('spans_total', span='db.query', status='ok')
+    for seconds in (0.003, 0.2, 999):
+        registry.observe('span_duration_seconds', seconds, span='db.query')
+
+    lines = registry.render({'db_pool_connections': {(('state', 'idle'),): 2}, 'cache_hit_ratio': None}).splitlines()
+    assert '# TYPE test_spans_total counter' in lines
+    assert 'test_spans_total{span="db.query",status="ok"} 1' in lines
+    assert 'test_span_duration_seconds_bucket{span="db.query",le="0.005"} 1' in lines
+    assert 'test_span_duration_seconds_bucket{span="db.query",le="0.25"} 2' in lines
+    assert 'test_span_duration_seconds_bucket{span="db.query",le="120.0"} 2' in lines
+    assert 'test_span_duration_seconds_bucket{span="db.query",le="+Inf"} 3' in lines
+    assert 'test_span_duration_seconds_count{span="db.query"} 3' in lines
+    assert 'test_db_pool_connections{state="idle"} 2' in lines
+    # A gauge without a value yet (e.g. a hit ratio before any lookups) gets its header but no sample
+    assert not any(line.startswith('test_cache_hit_ratio') for line in lines)
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry(prefix='test')
+    registry.inc('requests_total', route='say "hi"\\')
+    assert 'test_requests_total{route="say \\"hi\\"\\\\"} 1' in registry.render().splitlines()
+
+
+def test_metrics_endpoint_reports_request_spans(client):
+    response = client.post('/query', json={'query': "What is the status of INC000042?", 'chatId': 'chat-metrics'})
+    assert response.status_code == 200
+    assert response.get_json()['spans'][0]['name'] == 'request'
+
+    metrics = client.get('/metrics')
+    assert metrics.status_code == 200
+    assert metrics.mimetype == 'text/plain'
+    body = metrics.get_data(as_text=True)
+    assert 'incident_chatbot_requests_total{route="incident_lookup",status="ok"}' in body
+    assert '# TYPE incident_chatbot_span_duration_seconds histogram' in body
+    assert 'incident_chatbot_db_pool_connections{state="in_use"} 0' in body
+
+
+def _counter(name, **labels):
+    return get_metrics()._counters.get((name, tuple(sorted(labels.items()))), 0)
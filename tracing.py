@@ -0,0 +1,236 @@
+import contextvars
+import functools
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# Span timings are kept per request (returned next to process_flow) and aggregated into /metrics histograms
+TRACING_ENABLED = True
+METRICS_PREFIX = 'incident_chatbot'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TRACE_MAX_SPANS = 200
+
+METRIC_HELP = {
+    'span_duration_seconds': ('histogram', 'Duration of instrumented operations (LLM, tools, embedding, search, SQL)'),
+    'spans_total': ('counter', 'Instrumented operations by outcome'),
+    'request_duration_seconds': ('histogram', 'End-to-end duration of answered questions by route'),
+    'requests_total': ('counter', 'Answered questions by route and outcome'),
+    'llm_budget_exhausted_total': ('counter', 'Requests that ran out of LLM budget and returned a degraded answer'),
+}
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in items)
+    return '{' + ','.join(escaped) + '}'
+
+
+class MetricsRegistry:
+    """Thread-safe counters and latency histograms rendered in the Prometheus text format"""
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def _header(self, lines, name, metric_type):
+        full_name = f'{self.prefix}_{name}'
+        help_text = METRIC_HELP.get(name, (metric_type, name.replace('_', ' ')))[1]
+        lines.append(f'# HELP {full_name} {help_text}')
+        lines.append(f'# TYPE {full_name} {metric_type}')
+        return full_name
+
+    def render(self, gauges=None):
+        """Prometheus exposition text; gauges is an optional {name: value or {labels tuple: value}} of point-in-time values"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items()}
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            full_name = self._header(lines, name, 'counter')
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{full_name}{_format_labels(labels)} {value}')
+
+        for name in sorted({name for name, _ in histograms}):
+            full_name = self._header(lines, name, 'histogram')
+            for (metric, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{full_name}_bucket{_format_labels(labels, ("le", bound))} {cumulative}')
+                lines.append(f'{full_name}_bucket{_format_labels(labels, ("le", "+Inf"))} {count}')
+                lines.append(f'{full_name}_sum{_format_labels(labels)} {round(total, 6)}')
+                lines.append(f'{full_name}_count{_format_labels(labels)} {count}')
+
+        for name, value in sorted((gauges or {}).items()):
+            full_name = self._header(lines, name, 'gauge')
+            values = value.items() if isinstance(value, dict) else [((), value)]
+            for labels, gauge_value in values:
+                if gauge_value is not None:
+                    lines.append(f'{full_name}{_format_labels(labels)} {gauge_value}')
+        return '\n'.join(lines) + '\n'
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics():
+    """Return the process-wide metrics registry"""
+    return _metrics
+
+
+class Trace:
+    """Spans recorded while answering one question"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.attributes = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        return next(self._ids)
+
+    def add(self, record):
+        with self._lock:
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append(record)
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    def to_list(self):
+        """Finished spans in the order they started"""
+        with self._lock:
+            return sorted(self.spans, key=lambda record: record['id'])
+
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def set_trace_attribute(key, value):
+    """Attach a request-level attribute (e.g. the chosen route) to the running trace"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes[key] = value
+
+
+class Span:
+    """One timed operation; finished explicitly with end(), or through the span() context manager"""
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.trace = _current_trace.get()
+        self.start = time.perf_counter()
+        parent = parent if parent is not None else _current_span.get()
+        self.record = {
+            'id': self.trace.next_id() if self.trace is not None else None,
+            'name': name,
+            'parent': parent.record['id'] if parent is not None else None,
+            'start_ms': round((self.start - self.trace.started) * 1000, 2) if self.trace is not None else 0.0,
+            **attributes,
+        }
+        self._ended = False
+
+    def end(self, status='ok'):
+        if self._ended or not TRACING_ENABLED:
+            return
+        self._ended = True
+        duration = time.perf_counter() - self.start
+        self.record['duration_ms'] = round(duration * 1000, 2)
+        self.record['status'] = status
+        _metrics.observe('span_duration_seconds', duration, span=self.name)
+        _metrics.inc('spans_total', span=self.name, status=status)
+        if self.trace is not None:
+            self.trace.add(self.record)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time the enclosed block as a child of the current span; exceptions mark it as an error"""
+    current = Span(name, **attributes)
+    token = _current_span.set(current)
+    failed = False
+    try:
+        yield current.record
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _current_span.reset(token)
+        # Callers that handle their own errors can mark the span by setting record['status']
+        current.end('error' if failed else current.record.get('status', 'ok'))
+
+
+def traced(name):
+    """Decorator form of span() for functions such as agent tools"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def trace_request(name='request'):
+    """Start a trace for one question; records request_duration_seconds by the route set on the trace"""
+    trace = Trace()
+    trace_token = _current_trace.set(trace)
+    status = 'ok'
+    try:
+        with span(name):
+            yield trace
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        _current_trace.reset(trace_token)
+        route = trace.attributes.get('route', 'unknown')
+        _metrics.observe('request_duration_seconds', time.perf_counter() - trace.started, route=route)
+        _metrics.inc('requests_total', route=route, status=status)